@@ -5,6 +5,7 @@ Entry point for the Streamlit application.
 
 import streamlit as st
 from src.config import load_environment, initialize_session_state, configure_page
+from src.metrics import span, trace
 from src.ui import render_sidebar, render_chat_interface
 
 def main():
@@ -18,14 +19,24 @@ def main():
     # Initialize session state
     initialize_session_state()
     
+    # Pick up incidents added by other sessions; a session without an index
+    # has nothing to refresh, so the RAG stack is not imported before first paint
+    if st.session_state.document_processed:
+        from src.data_loader import sync_session_index
+        sync_session_index()
+    
     # Display application title
     st.title("🔐 Security Incident Analysis Assistant")
     
-    # Render sidebar
-    render_sidebar()
-    
-    # Render main chat interface
-    render_chat_interface()
+    # Time each script run, so slow pages can be told apart from slow queries
+    with trace("page"):
+        # Render sidebar
+        with span("render_sidebar"):
+            sidebar_views = render_sidebar()
+        
+        # Render main chat interface
+        with span("render_chat"):
+            render_chat_interface(sidebar_views)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,540 @@
+"""
+ANN index module for the Security Incident Analysis application.
+Chooses, builds and tunes the FAISS index structure behind the incident store.
+
+Small corpora use an exact Flat index. Larger ones can use an IVF index with
+trained centroids or an HNSW graph; any FAISS index factory string is accepted.
+The trained state lives inside index.faiss, so it is persisted with the segment.
+
+Vectors can additionally be compressed with scalar (fp16 / int8) or product
+quantization. Compressed stores keep the original vectors on disk and can
+re-rank their top candidates exactly.
+
+Searches with a filter on indexed incident metadata (type, date, ID, severity)
+only consider the matching incidents, using a FAISS ID selector.
+"""
+
+import math
+import re
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from src.config import (
+    INDEX_FACTORY, VECTOR_COMPRESSION, RERANK_FACTOR, FAISS_NPROBE, FAISS_EF_SEARCH, FAISS_INDEX_PATH
+)
+from src.full_vectors import get_full_vector_store
+from src.incident_metadata import incident_metadata, filter_from_question
+from src.metrics import span
+
+# Below this many vectors exact search is fast enough
+FLAT_MAX_VECTORS = 50000
+MAX_TRAINING_POINTS = 100000
+# Product quantization trains 256 centroids per sub-quantizer
+PQ_MIN_VECTORS = 256 * 39
+
+UNCOMPRESSED_INDEX_TYPES = (faiss.IndexFlat, faiss.IndexIVFFlat, faiss.IndexHNSWFlat)
+
+_IVF_LISTS_PATTERN = re.compile(r"\bIVF\d+")
+
+def _pq_subquantizers(dim):
+    """Pick the PQ code size: one byte per 4 dimensions (16x smaller), dividing dim evenly"""
+    for m in range(max(1, dim // 4), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+def apply_compression(index_factory, compression, num_vectors, dim):
+    """
+    Swap the flat vector storage of a factory string for a compressed encoding
+
+    "Flat", "IVFn,Flat" and "HNSWm" are rewritten; any other factory string is
+    assumed to choose its own encoding and is returned unchanged.
+    """
+    if not compression or compression == "none":
+        return index_factory
+
+    if compression == "pq" and num_vectors >= PQ_MIN_VECTORS:
+        code = f"PQ{_pq_subquantizers(dim)}"
+    elif compression == "fp16":
+        code = "SQfp16"
+    else:
+        # int8, and PQ on corpora too small to train it
+        code = "SQ8"
+
+    if index_factory == "Flat":
+        return code
+    if index_factory.startswith("IVF") and index_factory.endswith(",Flat"):
+        return index_factory[:-len("Flat")] + code
+    if index_factory.startswith("HNSW") and "," not in index_factory and "_" not in index_factory:
+        return f"{index_factory}_{code}" if code.startswith("PQ") else f"{index_factory},{code}"
+    return index_factory
+
+def _ivf_lists(num_vectors):
+    """Roughly 4*sqrt(n) IVF lists, keeping at least 39 training points per centroid"""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+def resize_ivf_factory(index_factory, num_vectors):
+    """Return an IVF factory string with its list count sized for num_vectors, keeping its encoding"""
+    return _IVF_LISTS_PATTERN.sub(f"IVF{_ivf_lists(num_vectors)}", index_factory, count=1)
+
+def choose_index_factory(num_vectors, requested=INDEX_FACTORY, compression=VECTOR_COMPRESSION, dim=None):
+    """Return the FAISS index factory string to use for a corpus of num_vectors"""
+    if requested and requested.lower() != "auto":
+        index_factory = requested
+    elif num_vectors < FLAT_MAX_VECTORS:
+        index_factory = "Flat"
+    else:
+        index_factory = f"IVF{_ivf_lists(num_vectors)},Flat"
+
+    if dim is None:
+        return index_factory
+    return apply_compression(index_factory, compression, num_vectors, dim)
+
+def is_compressed(index):
+    """Return True if the index stores approximate (quantized) vectors"""
+    return not isinstance(index, UNCOMPRESSED_INDEX_TYPES)
+
+def configure_search(index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """Apply query-time knobs: nprobe for IVF indexes, efSearch for HNSW graphs"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+def describe_index(index):
+    """Return a short human-readable description of an index and its search knobs"""
+    description = type(index).__name__
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        description += f" (nlist={ivf.nlist}, nprobe={ivf.nprobe})"
+    if hasattr(index, "hnsw"):
+        description += f" (efSearch={index.hnsw.efSearch})"
+    return description
+
+def create_faiss_index(vectors, index_factory):
+    """Build, train if needed, and fill a FAISS index from a factory string"""
+    vectors = np.asarray(vectors, dtype="float32")
+    index = faiss.index_factory(vectors.shape[1], index_factory)
+
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > MAX_TRAINING_POINTS:
+            rows = np.random.default_rng(0).choice(len(vectors), MAX_TRAINING_POINTS, replace=False)
+            sample = vectors[rows]
+        try:
+            index.train(sample)
+        except RuntimeError as e:
+            raise ValueError(
+                f"Not enough incidents ({len(vectors)}) to train a '{index_factory}' index: {str(e)}"
+            )
+
+    index.add(vectors)
+    return configure_search(index)
+
+def index_vectors(index):
+    """Return every vector stored in an index, in position order"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def _new_index(vectors, ids, index_factory=None, index_path=FAISS_INDEX_PATH):
+    """Build the index for a set of vectors, keeping exact copies of compressed ones in index_path"""
+    if index_factory is None:
+        index_factory = choose_index_factory(len(vectors), dim=vectors.shape[1])
+    elif index_factory.lower() == "auto":
+        index_factory = choose_index_factory(len(vectors), index_factory, dim=vectors.shape[1])
+    index = create_faiss_index(vectors, index_factory)
+    if is_compressed(index):
+        # Keep the exact vectors on disk for re-ranking and later rebuilds
+        get_full_vector_store(index_path).put_many(ids, vectors)
+    return index
+
+def build_store(embeddings, texts, ids, index_factory=None, metadatas=None, vectors=None,
+                index_path=FAISS_INDEX_PATH):
+    """
+    Embed texts and wrap them in a FAISS store backed by the chosen index type
+
+    Args:
+        embeddings: Embeddings used for the texts and, later, for queries
+        texts: Incident texts
+        ids: Docstore ids, one per text
+        index_factory: FAISS factory string used as given, or None for the
+            configured INDEX_FACTORY with VECTOR_COMPRESSION applied
+        metadatas: Optional metadata dicts, one per text; parsed from the
+            incident texts by default
+        vectors: Precomputed vectors, skipping the embedding call
+        index_path: Index directory whose vectors.sqlite keeps the exact
+            vectors of a compressed index
+
+    An explicit index_factory is kept on the store (as index_factory), so
+    date shards split from it are built in the same family.
+    """
+    if vectors is None:
+        with span("embed_documents"):
+            vectors = embeddings.embed_documents(list(texts))
+    if metadatas is None:
+        metadatas = [incident_metadata(text) for text in texts]
+
+    with span("index_build"):
+        index = _new_index(np.asarray(vectors, dtype="float32"), ids, index_factory, index_path)
+    docstore = InMemoryDocstore({
+        doc_id: Document(id=doc_id, page_content=text, metadata=metadata)
+        for doc_id, text, metadata in zip(ids, texts, metadatas)
+    })
+    db = IncidentFAISS(embeddings, index, docstore, dict(enumerate(ids)))
+    db.index_path = index_path
+    if index_factory is not None and index_factory.lower() != "auto":
+        db.index_factory = index_factory
+    return db
+
+def store_entries(db, exclude_ids=()):
+    """
+    Return (ids, vectors) for every document in a store, in position order
+
+    Vectors of compressed indexes come from the full-precision copies on disk
+    where available, so rebuilding does not compound quantization error.
+    """
+    exclude_ids = set(exclude_ids)
+    vectors = index_vectors(db.index)
+    ids, rows = [], []
+    for position in range(db.index.ntotal):
+        doc_id = db.index_to_docstore_id[position]
+        if doc_id in exclude_ids:
+            continue
+        ids.append(doc_id)
+        rows.append(position)
+
+    vectors = vectors[rows]
+    if is_compressed(db.index) and ids:
+        exact = get_full_vector_store(db.index_path).get_many(ids)
+        for row, doc_id in enumerate(ids):
+            if doc_id in exact:
+                vectors[row] = exact[doc_id]
+    return ids, vectors
+
+def _docstore_subset(db, ids):
+    """Return a docstore holding ids: on-disk docstores are shared, in-memory ones copied"""
+    if not isinstance(db.docstore, InMemoryDocstore):
+        return db.docstore
+    return InMemoryDocstore({doc_id: db.docstore.search(doc_id) for doc_id in ids})
+
+def merge_stores(db, other):
+    """Append other's vectors and documents to db, copying vectors when the index types differ"""
+    other_ids = [other.index_to_docstore_id[position] for position in range(other.index.ntotal)]
+    if not other_ids:
+        return db
+
+    if type(db.index) is faiss.IndexFlat and type(other.index) is faiss.IndexFlat:
+        db.index.merge_from(other.index)
+    else:
+        _, vectors = store_entries(other)
+        db.index.add(vectors)
+
+    if other.docstore is not db.docstore:
+        db.docstore.add({doc_id: other.docstore.search(doc_id) for doc_id in other_ids})
+
+    start = len(db.index_to_docstore_id)
+    db.index_to_docstore_id.update({start + i: doc_id for i, doc_id in enumerate(other_ids)})
+    return db
+
+def rebuild_store(db, exclude_ids=(), retrain=False):
+    """
+    Build a new store from db's documents, dropping exclude_ids
+
+    By default the existing index structure (and its training) is reused; with
+    retrain=True a new index is chosen from the configuration and trained.
+    """
+    ids, vectors = store_entries(db, exclude_ids)
+    return _store_from_entries(db, ids, vectors, retrain)
+
+def _store_from_entries(db, ids, vectors, retrain, template=None, index_factory=None):
+    """
+    Build a store like db holding the given ids and vectors
+
+    The vectors go into a copy of template (db's index by default), or with
+    retrain=True into a newly trained index_factory index (the configured one
+    by default).
+    """
+    if retrain and ids:
+        index = _new_index(vectors, ids, index_factory, db.index_path)
+    else:
+        index = faiss.clone_index(db.index if template is None else template)
+        index.reset()
+        if ids:
+            index.add(vectors)
+        configure_search(index)
+
+    store = IncidentFAISS(
+        db.embedding_function, index, _docstore_subset(db, ids), dict(enumerate(ids)),
+        normalize_L2=db._normalize_L2, distance_strategy=db.distance_strategy
+    )
+    store.index_path = db.index_path
+    return store
+
+def partition_store(db, key_of):
+    """
+    Split a store into one store per key of its documents
+
+    An IVF coarse quantizer is sized for the whole store, so IVF parts are
+    retrained with their list count sized for the part. They keep the family
+    and encoding of the factory db was built with (e.g. "IVF1024,PQ64" parts
+    become "IVF<n>,PQ64"), unless a part is too small to train it; parts of a
+    store without a recorded factory get the configured index for their size.
+    Other index types reuse db's structure.
+
+    Args:
+        db: Store to split
+        key_of: Function mapping a Document to the key of its part
+
+    Returns:
+        dict: key -> store; db itself when all its documents share one key
+    """
+    keys = [key_of(db.docstore.search(db.index_to_docstore_id[position])) for position in range(db.index.ntotal)]
+    if len(set(keys)) <= 1:
+        return {keys[0]: db} if keys else {}
+
+    rows_by_key = {}
+    for row, key in enumerate(keys):
+        rows_by_key.setdefault(key, []).append(row)
+
+    ids, vectors = store_entries(db)
+    retrain = faiss.try_extract_index_ivf(db.index) is not None
+    # Copy db's structure once, without its vectors, rather than once per part
+    template = faiss.clone_index(db.index)
+    template.reset()
+    parts = {}
+    for key, rows in sorted(rows_by_key.items()):
+        part_ids = [ids[row] for row in rows]
+        index_factory = None
+        if retrain and db.index_factory is not None:
+            index_factory = resize_ivf_factory(db.index_factory, len(rows))
+        try:
+            parts[key] = _store_from_entries(db, part_ids, vectors[rows], retrain, template, index_factory)
+        except ValueError:
+            if index_factory is None:
+                raise
+            # Too few incidents to train the requested encoding (e.g. PQ) for this part
+            parts[key] = _store_from_entries(db, part_ids, vectors[rows], retrain, template)
+        parts[key].index_factory = db.index_factory
+    return parts
+
+def remove_from_store(db, doc_ids):
+    """Remove documents from a store's index in place, leaving any shared docstore untouched"""
+    doc_ids = set(doc_ids)
+    if not doc_ids:
+        return
+    if type(db.index) is faiss.IndexFlat:
+        positions = [position for position, doc_id in db.index_to_docstore_id.items() if doc_id in doc_ids]
+        db.index.remove_ids(np.asarray(positions, dtype="int64"))
+        remaining = [doc_id for _, doc_id in sorted(db.index_to_docstore_id.items()) if doc_id not in doc_ids]
+        db.index_to_docstore_id = dict(enumerate(remaining))
+    else:
+        # HNSW graphs cannot remove vectors, and IVF lists keep their original
+        # ids after removal, so rebuild on the same trained structure instead
+        rebuilt = rebuild_store(db, doc_ids)
+        db.index = rebuilt.index
+        db.docstore = rebuilt.docstore
+        db.index_to_docstore_id = rebuilt.index_to_docstore_id
+
+def rerank_exact(query, candidates, k, distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE,
+                 index_path=FAISS_INDEX_PATH):
+    """
+    Re-score (doc id, score) candidates with the full-precision vectors kept in index_path
+
+    Candidates without a stored full vector keep their approximate score.
+    """
+    exact = get_full_vector_store(index_path).get_many([doc_id for doc_id, _ in candidates])
+    query = np.asarray(query, dtype="float32")
+    inner_product = distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+
+    rescored = []
+    for doc_id, score in candidates:
+        vector = exact.get(doc_id)
+        if vector is not None:
+            if inner_product:
+                score = float(np.dot(query, vector))
+            else:
+                score = float(np.sum((query - vector) ** 2))
+        rescored.append((doc_id, score))
+
+    rescored.sort(key=lambda pair: pair[1], reverse=inner_product)
+    return rescored[:k]
+
+def higher_is_better(distance_strategy):
+    """Return True if larger scores mean closer matches under a distance strategy"""
+    return distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+
+def apply_score_threshold(docs, score_threshold, distance_strategy):
+    """Drop (document, score) pairs scoring worse than score_threshold, if one is given"""
+    if score_threshold is None:
+        return docs
+    if higher_is_better(distance_strategy):
+        return [(doc, score) for doc, score in docs if score >= score_threshold]
+    return [(doc, score) for doc, score in docs if score <= score_threshold]
+
+def question_filter(docstore, question, is_live=None):
+    """
+    Return the metadata filter implied by the incident types and dates a question names, or None
+
+    Args:
+        docstore: Docstore holding the incidents' metadata
+        question: The user's question
+        is_live: Optional check that a doc id is searchable; the docstore also
+            holds tombstoned incidents, which must not make a filter look usable
+
+    Returns:
+        dict: A metadata filter, or None if the question implies none or it matches no live incident
+    """
+    if not hasattr(docstore, "distinct_values"):
+        return None
+    filter = filter_from_question(question, docstore.distinct_values("type"))
+    if filter is None:
+        return None
+    # A question-derived filter that matches nothing is more likely a
+    # misreading of the question than a request for no context
+    ids = docstore.filter_ids(filter)
+    if not ids or (is_live is not None and not any(is_live(doc_id) for doc_id in ids)):
+        return None
+    return filter
+
+def search_parameters(index, selector):
+    """Return FAISS search parameters restricting a search to selector, keeping the index's knobs"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+class IncidentFAISS(FAISS):
+    """
+    FAISS store with metadata pre-filtering and exact re-ranking
+
+    Filters the docstore can resolve to ids (see docstore.FILTER_COLUMNS) are
+    applied before the vector search; any other filter falls back to
+    LangChain's filtering of the fetched results. Candidates from compressed
+    indexes are re-ranked with their exact vectors.
+    """
+
+    rerank_factor = RERANK_FACTOR
+    # Factory string the store was explicitly built with, if any
+    index_factory = None
+    # Index directory holding the exact vectors of a compressed index
+    index_path = FAISS_INDEX_PATH
+    _position_cache = None
+
+    def filter_for_question(self, question):
+        """Return the metadata filter implied by the incident types and dates a question names, or None"""
+        return question_filter(self.docstore, question, self.contains)
+
+    def similarity_search_with_score(self, query, k=4, filter=None, fetch_k=20, infer_filter=False, **kwargs):
+        if infer_filter and filter is None:
+            filter = self.filter_for_question(query)
+        return super().similarity_search_with_score(query, k, filter=filter, fetch_k=fetch_k, **kwargs)
+
+    def _position_map(self):
+        """Return the docstore id -> index position map, rebuilt when the id map changes"""
+        key = (id(self.index_to_docstore_id), len(self.index_to_docstore_id))
+        if self._position_cache is None or self._position_cache[0] != key:
+            self._position_cache = (key, {doc_id: position for position, doc_id in self.index_to_docstore_id.items()})
+        return self._position_cache[1]
+
+    def _positions(self, doc_ids):
+        """Map docstore ids to index positions"""
+        positions = self._position_map()
+        if isinstance(doc_ids, (set, frozenset)) and len(doc_ids) > len(positions):
+            # One shard of a larger index: scan its own ids rather than every candidate
+            found = (position for doc_id, position in positions.items() if doc_id in doc_ids)
+        else:
+            found = (positions[doc_id] for doc_id in doc_ids if doc_id in positions)
+        return np.asarray(sorted(found), dtype="int64")
+
+    def contains(self, doc_id):
+        """Return True if the document is searchable in this store (not tombstoned or unpublished)"""
+        return doc_id in self._position_map()
+
+    def _search_positions(self, vector, n, positions=None):
+        """Search the whole index, or only the given positions, returning (scores, positions)"""
+        if positions is None:
+            scores, found = self.index.search(vector, n)
+            return scores[0], found[0]
+
+        selector = faiss.IDSelectorBatch(positions)
+        try:
+            scores, found = self.index.search(vector, n, params=search_parameters(self.index, selector))
+            return scores[0], found[0]
+        except RuntimeError:
+            # Index types without selector support (e.g. plain PQ): scan the candidates
+            candidates = np.vstack([self.index.reconstruct(int(position)) for position in positions])
+            if self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+                scores = -(candidates @ vector[0])
+            else:
+                scores = np.sum((candidates - vector[0]) ** 2, axis=1)
+            order = np.argsort(scores)[:n]
+            scores = scores[order]
+            if self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+                scores = -scores
+            return scores, positions[order]
+
+    def search_ids(self, embedding, k=4, candidate_ids=None):
+        """
+        Return the (doc id, score) pairs of the k incidents nearest to a query vector, best first
+
+        Args:
+            embedding: Query vector
+            k: Number of results
+            candidate_ids: Optional ids the search is restricted to
+        """
+        positions = None
+        if candidate_ids is not None:
+            positions = self._positions(candidate_ids)
+            if not len(positions):
+                return []
+
+        vector = np.asarray([embedding], dtype="float32")
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+
+        # Over-fetch from compressed indexes, then keep the exact top k
+        rerank = self.rerank_factor > 1 and is_compressed(self.index)
+        scores, found = self._search_positions(vector, k * self.rerank_factor if rerank else k, positions)
+        hits = [
+            (self.index_to_docstore_id[int(position)], float(score))
+            for score, position in zip(scores, found) if position != -1
+        ]
+        if rerank:
+            hits = rerank_exact(vector[0], hits, k, self.distance_strategy, self.index_path)
+        return hits[:k]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20, candidate_ids=None,
+                                               **kwargs):
+        # candidate_ids: the filter already resolved by the caller
+        if candidate_ids is None and isinstance(filter, dict) and hasattr(self.docstore, "filter_ids"):
+            candidate_ids = self.docstore.filter_ids(filter)
+        rerank = self.rerank_factor > 1 and is_compressed(self.index)
+        if candidate_ids is None and not rerank:
+            return super().similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter, fetch_k=fetch_k, **kwargs
+            )
+
+        if candidate_ids is not None:
+            # Every hit already matches the filter
+            filter = None
+        hits = self.search_ids(embedding, k if filter is None else max(k, fetch_k), candidate_ids)
+
+        filter_func = self._create_filter_func(filter) if filter is not None else None
+        docs = []
+        for doc_id, score in hits:
+            doc = self.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {doc_id}, got {doc}")
+            if filter_func is None or filter_func(doc.metadata):
+                docs.append((doc, score))
+
+        return apply_score_threshold(docs[:k], kwargs.get("score_threshold"), self.distance_strategy)
@@ -0,0 +1,206 @@
+"""
+Answer cache module for the Security Incident Analysis application.
+Persists LLM answers so repeated questions over the same incidents skip the model.
+
+An answer is keyed by the normalized (standalone) question together with the
+set of incident documents retrieved for it, so the same question asked after
+the relevant incidents changed misses the cache. Near-identical questions can
+also be matched by embedding similarity among answers built from the same
+documents. Replacing an incident invalidates every answer that used it.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+from src.config import (
+    ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY
+)
+from src.embedding_cache import normalize_text
+
+_cache_lock = threading.Lock()
+_shared_cache = None
+
+def _hash(*parts):
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def document_set_key(doc_ids, model_name):
+    """Key identifying the model and the (unordered) set of documents an answer was built from"""
+    return _hash(model_name, *sorted(doc_ids))
+
+def answer_key(question, doc_ids, model_name):
+    """Key identifying a normalized question asked over a set of documents"""
+    return _hash(document_set_key(doc_ids, model_name), normalize_text(question).lower())
+
+class AnswerCache:
+    """
+    Size- and age-bounded on-disk answer cache backed by SQLite
+
+    Entries older than ttl_seconds are ignored and removed; beyond max_entries
+    the least-recently-used entries are evicted. With similarity > 0, a miss
+    falls back to the closest question (by cosine similarity of question
+    embeddings) answered over the same documents.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS, similarity=ANSWER_CACHE_SIMILARITY):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, document_set TEXT NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL, "
+            "embedding BLOB, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_document_set ON answers(document_set)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answer_documents ("
+            "key TEXT NOT NULL, doc_id TEXT NOT NULL, PRIMARY KEY (key, doc_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answer_documents_doc_id ON answer_documents(doc_id)")
+        self._conn.commit()
+
+    def _delete(self, keys):
+        self._conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in keys])
+        self._conn.executemany("DELETE FROM answer_documents WHERE key = ?", [(key,) for key in keys])
+
+    def get(self, question, doc_ids, model_name, embedding=None):
+        """
+        Return the cached answer for a question over doc_ids, or None
+
+        Args:
+            question: Standalone question sent to the retriever
+            doc_ids: Ids of the documents retrieved for it
+            model_name: LLM that produced the answer
+            embedding: Optional question embedding, enabling similarity matching
+        """
+        document_set = document_set_key(doc_ids, model_name)
+        key = answer_key(question, doc_ids, model_name)
+        now = time.time()
+
+        with self._lock:
+            # Drop expired entries as we come across them
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT key FROM answers WHERE document_set = ? AND created_at < ?",
+                (document_set, now - self.ttl_seconds)
+            )]
+            if expired:
+                self._delete(expired)
+
+            row = self._conn.execute("SELECT key, answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None and embedding is not None and self.similarity > 0:
+                row = self._closest(document_set, embedding)
+
+            if row is None:
+                self.misses += 1
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+            self.hits += 1
+            return row[1]
+
+    def _closest(self, document_set, embedding):
+        """Return (key, answer) of the most similar question over the same documents, if close enough"""
+        query = np.asarray(embedding, dtype="float32")
+        query = query / (np.linalg.norm(query) or 1.0)
+        best, best_similarity = None, self.similarity
+        for key, answer, blob in self._conn.execute(
+            "SELECT key, answer, embedding FROM answers WHERE document_set = ? AND embedding IS NOT NULL",
+            (document_set,)
+        ):
+            vector = np.frombuffer(blob, dtype="float32")
+            similarity = float(np.dot(query, vector) / (np.linalg.norm(vector) or 1.0))
+            if similarity >= best_similarity:
+                best, best_similarity = (key, answer), similarity
+        return best
+
+    def put(self, question, doc_ids, model_name, answer, embedding=None):
+        """Store an answer and evict old entries if over capacity"""
+        key = answer_key(question, doc_ids, model_name)
+        blob = np.asarray(embedding, dtype="float32").tobytes() if embedding is not None else None
+        now = time.time()
+
+        with self._lock:
+            self._delete([key])
+            self._conn.execute(
+                "INSERT INTO answers (key, document_set, question, answer, embedding, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, document_set_key(doc_ids, model_name), normalize_text(question), answer, blob, now, now)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO answer_documents (key, doc_id) VALUES (?, ?)",
+                [(key, doc_id) for doc_id in doc_ids]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then least-recently-used entries beyond max_entries"""
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT key FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        )]
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - len(expired)
+        overflow = count - self.max_entries
+        if overflow > 0:
+            expired += [row[0] for row in self._conn.execute(
+                "SELECT key FROM answers WHERE created_at >= ? ORDER BY last_used ASC LIMIT ?",
+                (time.time() - self.ttl_seconds, overflow)
+            )]
+        if expired:
+            self._delete(expired)
+
+    def invalidate_documents(self, doc_ids):
+        """Drop every answer built from any of the given documents"""
+        if not doc_ids:
+            return 0
+        with self._lock:
+            keys = set()
+            doc_ids = list(doc_ids)
+            for start in range(0, len(doc_ids), 500):
+                batch = doc_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                keys.update(row[0] for row in self._conn.execute(
+                    f"SELECT key FROM answer_documents WHERE doc_id IN ({placeholders})", batch
+                ))
+            self._delete(keys)
+            self._conn.commit()
+        return len(keys)
+
+    def clear(self):
+        """Drop every cached answer (the index was rebuilt)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.execute("DELETE FROM answer_documents")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def stats(self):
+        """Return hit/miss counters and the current number of cached answers"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+def get_answer_cache():
+    """Return the process-wide answer cache, opening it on first use"""
+    global _shared_cache
+    with _cache_lock:
+        if _shared_cache is None:
+            _shared_cache = AnswerCache()
+        return _shared_cache
@@ -0,0 +1,363 @@
+"""
+API module for the Security Incident Analysis application.
+Headless HTTP service for automation (e.g. SOAR playbooks) over the shared index.
+
+Usage:
+    python -m src.api --port 8080
+
+Endpoints (JSON in, JSON out):
+    GET  /health     Index generation, size and shards
+    GET  /metrics    Stage and request latency histograms (Prometheus text format)
+    POST /ingest     Stream a CSV, JSON array or NDJSON body into the index
+                     (Content-Type text/csv for CSV; the body needs a
+                     Content-Length, chunked uploads get 411)
+    POST /incidents  Add one incident: {"date", "type", "description", "impact",
+                     "mitigation", "severity"}
+    POST /search     {"question", "k"?, "filter"?} -> ranked incidents with scores
+    POST /analyze    {"question", "session_id"?, "stream"?} -> answer; with
+                     "stream": true the answer is sent as NDJSON lines
+                     {"token": ...} followed by a final {"done": true, ...}
+
+One index and one set of model clients are shared by every request. Requests
+run on their own threads over HTTP/1.1 keep-alive connections. A session_id
+keeps a token-budgeted conversation memory across /analyze calls.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.async_runtime import run_sync
+from src.config import get_api_key, load_environment, API_HOST, API_PORT, API_MAX_SESSIONS, RETRIEVAL_K
+from src.conversation import setup_conversation_chain, aprocess_query
+from src.data_loader import format_incident_for_embedding
+from src.incident_manager import save_incident_report
+from src.ingest import iter_incident_records, index_incident_stream
+from src.memory import TokenBudgetMemory
+from src.metrics import get_metrics_registry, trace
+from src.rag_system import get_model_clients, get_condense_llm
+from src.registry import get_shared_vector_db
+from src.retrieval import hybrid_search
+
+class ApiError(Exception):
+    """Error reported to the client with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class _BodyReader:
+    """File-like view of exactly Content-Length bytes of a request body"""
+
+    def __init__(self, stream, length, name):
+        self.stream = stream
+        self.remaining = length
+        self.name = name
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+def _document_json(doc, scores):
+    return {"id": doc.id, "metadata": doc.metadata, "content": doc.page_content, "scores": scores}
+
+class AnalysisService:
+    """
+    Shared state behind the HTTP handlers: model clients, the index and session memories
+
+    Args:
+        embeddings: Embeddings used for ingest and queries
+        llm: Model that writes the answers
+        condense_llm: Optional model for rewriting follow-up questions
+        max_sessions: Conversation memories kept, least recently used dropped first
+    """
+
+    def __init__(self, embeddings, llm, condense_llm=None, max_sessions=API_MAX_SESSIONS):
+        self.embeddings = embeddings
+        self.llm = llm
+        self.condense_llm = condense_llm
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    def db(self):
+        """Return the shared store, picking up segments written since the last request"""
+        db, _ = get_shared_vector_db(self.embeddings)
+        if db is None:
+            raise ApiError(503, "No index loaded; POST incidents to /ingest first")
+        return db
+
+    def _session(self, session_id):
+        """Return (memory, lock) for a session, creating it if needed"""
+        with self._sessions_lock:
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+            else:
+                self._sessions[session_id] = (TokenBudgetMemory(return_messages=True), threading.Lock())
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            return self._sessions[session_id]
+
+    def health(self):
+        db, generation = get_shared_vector_db(self.embeddings)
+        return {
+            "status": "ok",
+            "generation": generation,
+            "vectors": db.ntotal if db is not None else 0,
+            "shards": len(db.shard_keys) if db is not None else 0,
+            "loaded_shards": len(db.loaded_shards()) if db is not None else 0,
+        }
+
+    def ingest(self, stream):
+        with trace("ingest_api"):
+            stats = index_incident_stream(iter_incident_records(stream), self.embeddings,
+                                          format_incident_for_embedding)
+            _, stats["generation"] = get_shared_vector_db(self.embeddings)
+        return stats
+
+    def add_incident(self, incident):
+        missing = [field for field in ("date", "type", "description") if not incident.get(field)]
+        if missing:
+            raise ApiError(400, f"Missing incident fields: {', '.join(missing)}")
+        incident = dict({"impact": "", "mitigation": "", "severity": "Unknown"}, **incident)
+        with trace("add_incident"):
+            incident_id, _, generation = save_incident_report(incident, self.embeddings)
+        return {"incident_id": incident_id, "duplicate": incident_id is None, "generation": generation}
+
+    def search(self, request):
+        k = request.get("k", RETRIEVAL_K)
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            raise ApiError(400, "'k' must be a positive integer")
+        filter = request.get("filter")
+        if filter is not None and not isinstance(filter, dict):
+            raise ApiError(400, "'filter' must be a JSON object")
+        with trace("search"):
+            result = hybrid_search(self.db(), request["question"], k=k, filter=filter)
+        return {
+            "question": result["question"],
+            "filter": result["filter"],
+            "timings": result["timings"],
+            "documents": [_document_json(doc, scores) for doc, scores in result["documents"]],
+        }
+
+    def _chain(self, memory):
+        return setup_conversation_chain(self.llm, self.db(), memory, self.condense_llm)
+
+    def _details(self, chain):
+        retrieval = chain.retriever.last_result or {}
+        return {
+            "answer_cached": chain.last_cache_hit,
+            "condense": chain.last_condense,
+            "context": chain.last_context,
+            "retrieval_timings": retrieval.get("timings"),
+            "incidents": [doc.metadata.get("incident_id", doc.id) for doc, _ in retrieval.get("documents", [])],
+        }
+
+    def _memory(self, request):
+        """Return (memory, lock) for the request's session, or a throwaway pair without one"""
+        session_id = request.get("session_id")
+        if session_id is None:
+            return TokenBudgetMemory(return_messages=True), threading.Lock()
+        return self._session(str(session_id))
+
+    def analyze(self, request):
+        """Answer a question in one response"""
+        memory, lock = self._memory(request)
+        # Turns of one session must see each other's history
+        with lock:
+            chain = self._chain(memory)
+            response = run_sync(aprocess_query(chain, request["question"]))
+        return dict({"answer": response["answer"]}, **self._details(chain))
+
+    def stream_analyze(self, request):
+        """Yield {"token": ...} events while answering, then a final {"done": true, ...} event"""
+        memory, lock = self._memory(request)
+        with lock:
+            chain = self._chain(memory)
+            parts = []
+            for token in chain.stream_answer(request["question"]):
+                parts.append(token)
+                yield {"token": token}
+        yield dict({"done": True, "answer": "".join(parts), "timings": chain.last_timings}, **self._details(chain))
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the AnalysisService attached to the server"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "IncidentAnalysisAPI/1.0"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status, text, content_type="text/plain; charset=utf-8"):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, events):
+        """Send events as NDJSON with chunked transfer encoding, flushing each one"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for event in events:
+                line = (json.dumps(event, default=str) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+        except Exception as e:
+            # Headers are gone; report the failure in-band and end the stream
+            line = (json.dumps({"error": str(e)}) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _content_length(self, required=False):
+        """Return the request body's Content-Length; chunked bodies are refused with 411"""
+        if self.headers.get("Transfer-Encoding", "identity").lower() != "identity":
+            raise ApiError(411, "Chunked request bodies are not supported; send a Content-Length")
+        length = self.headers.get("Content-Length")
+        if length is None and required:
+            raise ApiError(411, "Content-Length required")
+        try:
+            length = int(length or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ApiError(400, "Invalid Content-Length")
+        return length
+
+    def _json_body(self):
+        length = self._content_length()
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def _question_body(self):
+        body = self._json_body()
+        if not str(body.get("question") or "").strip():
+            raise ApiError(400, "Missing 'question'")
+        return body
+
+    def _handle(self, routes):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        handler = routes.get(path)
+        try:
+            if handler is None:
+                raise ApiError(404, f"Unknown endpoint {path}")
+            handler()
+        except ApiError as e:
+            # The body may be unread; drop the connection rather than misparse it
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            if self.server.verbose:
+                traceback.print_exc()
+            self.close_connection = True
+            self._send_json(500, {"error": str(e)})
+
+    def do_GET(self):
+        self._handle({
+            "/health": lambda: self._send_json(200, self.service.health()),
+            "/metrics": lambda: self._send_text(200, get_metrics_registry().render_prometheus(),
+                                                "text/plain; version=0.0.4; charset=utf-8"),
+        })
+
+    def do_POST(self):
+        self._handle({
+            "/ingest": self._ingest,
+            "/incidents": lambda: self._send_json(200, self.service.add_incident(self._json_body())),
+            "/search": lambda: self._send_json(200, self.service.search(self._question_body())),
+            "/analyze": self._analyze,
+        })
+
+    def _ingest(self):
+        length = self._content_length(required=True)
+        content_type = self.headers.get("Content-Type", "")
+        name = "upload.csv" if "csv" in content_type else "upload.json"
+        self._send_json(200, self.service.ingest(_BodyReader(self.rfile, length, name)))
+
+    def _analyze(self):
+        request = self._question_body()
+        if request.get("stream"):
+            # Fail before the 200 goes out if there is no index to answer from
+            self.service.db()
+            self._send_stream(self.service.stream_analyze(request))
+        else:
+            self._send_json(200, self.service.analyze(request))
+
+def create_server(service, host=API_HOST, port=API_PORT, verbose=False):
+    """Create a threaded HTTP server for a service"""
+    server = ThreadingHTTPServer((host, port), AnalysisRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+def build_parser():
+    """Build the command-line parser"""
+    parser = argparse.ArgumentParser(description="Serve the incident analysis HTTP API")
+    parser.add_argument("--host", default=API_HOST, help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=API_PORT, help="Port to listen on")
+    parser.add_argument("--fake-models", action="store_true",
+                        help="Use deterministic local fakes instead of the Google models (no API key needed)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser
+
+def create_fake_clients():
+    """Return local (embeddings, llm) stand-ins for smoke tests without network access"""
+    from src.fakes import FakeEmbeddings, FakeLLM
+    return FakeEmbeddings(), FakeLLM(response="No model configured: this is a placeholder analysis.")
+
+def main(argv=None):
+    """Command-line entry point"""
+    args = build_parser().parse_args(argv)
+    load_environment()
+
+    if args.fake_models:
+        embeddings, llm = create_fake_clients()
+        condense_llm = None
+    elif not get_api_key():
+        sys.exit("GOOGLE_API_KEY is not set")
+    else:
+        embeddings, llm = get_model_clients()
+        condense_llm = get_condense_llm()
+
+    server = create_server(AnalysisService(embeddings, llm, condense_llm), args.host, args.port, args.verbose)
+    print(f"Serving incident analysis API on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Async runtime module for the Security Incident Analysis application.
+Runs the async query pipeline on one event loop shared by every session.
+
+Streamlit runs each session's script in its own thread. Rather than start an
+event loop per query, sessions submit coroutines to a single loop running in a
+background thread, so their network waits overlap and the async model clients
+stay bound to one loop for the life of the process.
+"""
+
+import asyncio
+import threading
+
+_loop_lock = threading.Lock()
+_loop = None
+
+def get_event_loop():
+    """Return the process-wide event loop, starting its thread on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="query-loop", daemon=True).start()
+        return _loop
+
+def run_sync(coroutine, timeout=None):
+    """
+    Run a coroutine on the shared loop and wait for its result
+    
+    Args:
+        coroutine: Coroutine to run
+        timeout: Seconds to wait before cancelling it (None waits indefinitely)
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
@@ -0,0 +1,201 @@
+"""
+Batch module for the Security Incident Analysis application.
+Analyzes every incident in a CSV/JSON/NDJSON file and writes the results as JSONL.
+
+Usage:
+    python -m src.batch data/new_incident.csv --output analysis.jsonl
+    python -m src.batch daily_export.ndjson --output analysis.jsonl --concurrency 16
+
+Each incident is turned into a severity and mitigation question and run through
+retrieval plus analysis on the async pipeline, with at most --concurrency
+incidents in flight. Results are appended as they finish, so an interrupted run
+can be repeated with the same --output: incidents already analyzed there are
+skipped.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from src.async_runtime import run_sync
+from src.config import get_api_key, load_environment, BATCH_CONCURRENCY
+from src.context_packer import compact_incident
+from src.conversation import setup_conversation_chain, aprocess_query
+from src.data_loader import format_incident_for_embedding
+from src.dedup import parse_incident_id, content_fingerprint
+from src.ingest import iter_incident_records
+from src.memory import TokenBudgetMemory
+from src.rag_system import get_model_clients
+from src.registry import get_shared_vector_db
+
+ANALYSIS_QUESTION = (
+    "Analyze this new security incident. Assess its severity and recommend mitigation steps, "
+    "referring to similar incidents from the knowledge base.\n\nNew incident: {incident}"
+)
+
+def incident_key(text):
+    """
+    Identify an incident by its Incident ID, or by its content if it has none
+
+    Blank, "nan" and auto-generated IDs count as none, so rows without an ID
+    never share a key and keep the same key from one run to the next.
+    """
+    return parse_incident_id(text) or f"sha256:{content_fingerprint(text)}"
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+def read_completed(output_path):
+    """Return the keys of incidents analyzed successfully in an earlier run"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A run killed mid-write leaves a partial last line
+                continue
+            if "error" not in result:
+                completed.add(result["key"])
+    return completed
+
+def _end_partial_line(output_path):
+    """Terminate a partial last line left by a killed run, so appended results stay parseable"""
+    if not os.path.exists(output_path) or not os.path.getsize(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+async def analyze_incident(llm, db, text):
+    """Run retrieval and analysis for one formatted incident and return its result record"""
+    start = time.perf_counter()
+    result = {"key": incident_key(text), "incident_id": parse_incident_id(text)}
+    try:
+        chain = setup_conversation_chain(llm, db, TokenBudgetMemory(return_messages=True))
+        # The question quotes the incident's type and date; similar incidents of
+        # other types and years are exactly what the analysis should draw on
+        response = await aprocess_query(chain, ANALYSIS_QUESTION.format(incident=compact_incident(text)),
+                                        infer_filter=False)
+        retrieval = chain.retriever.last_result or {}
+        result.update({
+            "answer": response["answer"],
+            "similar_incidents": [doc.metadata.get("incident_id", doc.id) for doc, _ in retrieval.get("documents", [])],
+            "answer_cached": chain.last_cache_hit,
+            "prompt_tokens": chain.last_context.get("prompt_tokens"),
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+async def analyze_stream(records, llm, db, output, completed=(), concurrency=BATCH_CONCURRENCY, on_result=None):
+    """
+    Analyze a stream of incident records with bounded concurrency
+
+    Args:
+        records: Iterable of incident dicts
+        llm: Model that writes the analyses
+        db: Vector store to retrieve similar incidents from
+        output: Text file results are appended to, one JSON object per line
+        completed: Keys of incidents to skip
+        concurrency: Most incidents analyzed at once
+        on_result: Optional callback receiving each result record
+
+    Returns:
+        dict: analyzed/skipped/failed counts, elapsed seconds, incidents_per_sec
+        and p50/p95 latency in milliseconds
+    """
+    stats = {"analyzed": 0, "skipped": 0, "failed": 0}
+    latencies = []
+    start = time.perf_counter()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def run(text):
+        try:
+            result = await analyze_incident(llm, db, text)
+        finally:
+            slots.release()
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        latencies.append(result["latency_ms"])
+        stats["failed" if "error" in result else "analyzed"] += 1
+        if on_result is not None:
+            on_result(result)
+
+    seen = set(completed)
+    for record in records:
+        text = format_incident_for_embedding(record)
+        key = incident_key(text)
+        if key in seen:
+            stats["skipped"] += 1
+            continue
+        seen.add(key)
+
+        # Wait for a free slot before reading further, so memory stays bounded
+        await slots.acquire()
+        task = asyncio.ensure_future(run(text))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "elapsed": round(elapsed, 3),
+        "incidents_per_sec": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    })
+    return stats
+
+def format_stats(stats):
+    """Format batch statistics as a one-line report"""
+    return (f"Analyzed {stats['analyzed']} incidents ({stats['failed']} failed, {stats['skipped']} already done) "
+            f"in {stats['elapsed']:.1f}s: {stats['incidents_per_sec']:.2f} incidents/sec, "
+            f"p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms")
+
+def build_parser():
+    """Build the command-line parser"""
+    parser = argparse.ArgumentParser(description="Analyze every incident in a file against the knowledge base")
+    parser.add_argument("input", help="CSV, JSON array or NDJSON file of incidents")
+    parser.add_argument("--output", required=True, help="JSONL file to append results to (also used to resume)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Incidents analyzed at once")
+    parser.add_argument("--json", action="store_true", help="Print the final statistics as JSON")
+    return parser
+
+def main(argv=None):
+    """Command-line entry point"""
+    args = build_parser().parse_args(argv)
+    load_environment()
+    if not get_api_key():
+        sys.exit("GOOGLE_API_KEY is not set")
+
+    embeddings, llm = get_model_clients()
+    db, _ = get_shared_vector_db(embeddings)
+    if db is None:
+        sys.exit("No index found; load incidents into the knowledge base first")
+
+    completed = read_completed(args.output)
+    _end_partial_line(args.output)
+    with open(args.input, "rb") as source, open(args.output, "a", encoding="utf-8") as output:
+        stats = run_sync(analyze_stream(
+            iter_incident_records(source), llm, db, output, completed, max(args.concurrency, 1),
+            on_result=lambda result: print(f"{result['key']}: {result.get('error', 'done')}", file=sys.stderr)
+        ))
+    print(json.dumps(stats, indent=2) if args.json else format_stats(stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Benchmark module for the Security Incident Analysis application.
+Measures ingest, index build/load, search and query latency offline with fake models.
+
+Usage:
+    python -m src.benchmark --scale 1000 --output bench.json
+    python -m src.benchmark --scale 1000 --scale 100000 --dim 256 --baseline bench.json
+    python -m src.benchmark --scale 1000000 --dim 128 --queries 500 --embed-latency 0.05
+
+The model clients are replaced by deterministic fakes (src.fakes) with
+configurable latency, so results reflect the code rather than the network.
+Each scale runs in a fresh subprocess inside a scratch directory, so peak RSS
+is per scale and the real index and caches are never touched. Results are
+written as JSON; --baseline prints the change against an earlier results file.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from src.batch import percentile
+
+INCIDENT_TYPES = ("Phishing", "Ransomware", "Malware", "DDoS", "Data Breach", "Insider Threat",
+                  "Credential Stuffing", "Supply Chain", "SQL Injection", "Privilege Escalation")
+SEVERITIES = ("Low", "Medium", "High", "Critical")
+_TARGETS = ("finance servers", "HR laptops", "the payroll database", "customer portal", "VPN gateway",
+            "build pipeline", "email gateway", "domain controller", "S3 bucket", "point-of-sale terminals")
+_ACTIONS = ("exfiltrated records from", "encrypted files on", "harvested credentials via", "flooded",
+            "installed a backdoor on", "escalated privileges on", "injected SQL into", "abused API keys for")
+_MITIGATIONS = ("isolated affected hosts", "rotated credentials", "restored from backups", "blocked attacker IPs",
+                "patched the vulnerable service", "enabled MFA", "updated email filtering rules")
+
+def synthetic_incidents(count, seed=0):
+    """Yield count deterministic incident records shaped like the sample data"""
+    rng = random.Random(seed)
+    for i in range(count):
+        incident_type = rng.choice(INCIDENT_TYPES)
+        target = rng.choice(_TARGETS)
+        yield {
+            "Incident ID": f"INC-BENCH-{i:07d}",
+            "Date": f"{rng.randint(2019, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "Type": incident_type,
+            "Description": f"{incident_type} attack: an attacker {rng.choice(_ACTIONS)} {target} "
+                           f"from host 10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)} "
+                           f"(ticket {rng.randint(1000, 99999)}).",
+            "Impact": f"{rng.randint(1, 500)} systems affected around {target}.",
+            "Mitigation": ", ".join(rng.sample(_MITIGATIONS, 2)) + ".",
+            "Severity": rng.choice(SEVERITIES),
+        }
+
+def synthetic_questions(count, scale, seed=1):
+    """Return count questions mixing incident-ID lookups and type/date questions"""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        if i % 2:
+            questions.append(f"What happened in INC-BENCH-{rng.randrange(scale):07d} and how was it mitigated? ({i})")
+        else:
+            questions.append(f"Which {rng.choice(INCIDENT_TYPES).lower()} incidents hit {rng.choice(_TARGETS)} "
+                             f"in {rng.randint(2019, 2025)}? ({i})")
+    return questions
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def _latency_stats(name, latencies_ms):
+    return {
+        f"{name}_p50_ms": round(percentile(latencies_ms, 50), 3),
+        f"{name}_p99_ms": round(percentile(latencies_ms, 99), 3),
+    }
+
+def peak_rss_mb():
+    """Return this process's peak resident set size in MB, or None where unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+def run_scale(scale, dim=768, queries=200, embed_latency=0.0, llm_latency=0.0):
+    """
+    Run every measurement for one corpus size in the current working directory
+
+    Returns:
+        dict: the settings plus ingest_rows_per_sec, ingest_s, shards, load_s
+        (opening the index with its hot shards), build_s (rebuilding every
+        shard), search and query p50/p99 latency in ms and peak_rss_mb
+    """
+    import streamlit as st
+    from src import rag_system
+    from src.ann_index import rebuild_store
+    from src.config import initialize_session_state, get_session_memory
+    from src.conversation import setup_conversation_chain, process_user_query
+    from src.data_loader import format_incident_for_embedding
+    from src.embedding_cache import CachedEmbeddings, get_embedding_cache
+    from src.embedding_executor import EmbeddingExecutor
+    from src.fakes import FakeEmbeddings, FakeLLM
+    from src.ingest import index_incident_stream
+    from src.registry import get_shared_vector_db
+    from src.retrieval import hybrid_search
+    from src.segment_store import load_segments
+
+    # Swap the Google clients for fakes wrapped exactly like the real ones
+    clients = (
+        CachedEmbeddings(EmbeddingExecutor(FakeEmbeddings(size=dim, latency=embed_latency)),
+                         get_embedding_cache(), "fake-embedding"),
+        FakeLLM(latency=llm_latency),
+    )
+    rag_system.create_model_clients = lambda: clients
+    embeddings, llm = rag_system.get_model_clients()
+
+    result = {"scale": scale, "dim": dim, "queries": queries,
+              "embed_latency_s": embed_latency, "llm_latency_s": llm_latency}
+
+    stats, elapsed = _timed(index_incident_stream, synthetic_incidents(scale), embeddings,
+                            format_incident_for_embedding)
+    result["ingest_s"] = round(elapsed, 3)
+    result["ingest_rows_per_sec"] = round(stats["rows"] / elapsed, 1) if elapsed else 0.0
+
+    db, load_s = _timed(load_segments, embeddings)
+    result["load_s"] = round(load_s, 3)
+    result["shards"] = len(db.shard_keys)
+    _, build_s = _timed(lambda: [rebuild_store(db.shard(key), (), True) for key in db.shard_keys])
+    result["build_s"] = round(build_s, 3)
+
+    db, _ = get_shared_vector_db(embeddings)
+    questions = synthetic_questions(queries, scale)
+    search_ms = []
+    for question in questions:
+        _, elapsed = _timed(hybrid_search, db, question)
+        search_ms.append(elapsed * 1000)
+    result.update(_latency_stats("search", search_ms))
+
+    # End to end through the UI's entry point; each question is a fresh single-turn chat
+    initialize_session_state()
+    st.session_state.conversation_chain = setup_conversation_chain(llm, db, get_session_memory())
+    query_ms = []
+    for question in questions:
+        st.session_state.memory.clear()
+        answer, elapsed = _timed(process_user_query, question + " (end to end)")
+        if answer.startswith("An error occurred"):
+            raise RuntimeError(answer)
+        query_ms.append(elapsed * 1000)
+    result.update(_latency_stats("query", query_ms))
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def _run_in_subprocess(scale, args):
+    """Run one scale in a fresh interpreter inside a scratch directory and return its result"""
+    command = [
+        sys.executable, "-m", "src.benchmark", "--run-one", str(scale), "--dim", str(args.dim),
+        "--queries", str(args.queries), "--embed-latency", str(args.embed_latency),
+        "--llm-latency", str(args.llm_latency),
+    ]
+    # The scratch directory becomes the working directory, so the package must stay importable
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory(prefix="incident-bench-") as workdir:
+        completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark at scale {scale} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+# (metric, higher is better)
+REPORT_METRICS = (
+    ("ingest_rows_per_sec", True), ("build_s", False), ("load_s", False), ("search_p50_ms", False),
+    ("search_p99_ms", False), ("query_p50_ms", False), ("query_p99_ms", False), ("peak_rss_mb", False),
+)
+
+def format_results(results, baseline=None):
+    """Format results as a table, with the change against a baseline run where one matches"""
+    previous = {(r["scale"], r["dim"]): r for r in baseline or []}
+    lines = [f"{'metric':<22}" + "".join(f"{r['scale']:>16,}" for r in results)]
+    for metric, higher_is_better in REPORT_METRICS:
+        cells = []
+        for r in results:
+            value = r.get(metric)
+            cell = "-" if value is None else f"{value:,.3f}" if abs(value) < 1 else f"{value:,.2f}"
+            old = previous.get((r["scale"], r["dim"]), {}).get(metric)
+            if value is not None and old:
+                change = (value - old) / old * 100
+                better = change > 0 if higher_is_better else change < 0
+                cell += f" ({change:+.0f}%{'' if abs(change) < 5 else ' ok' if better else ' !!'})"
+            cells.append(f"{cell:>16}")
+        lines.append(f"{metric:<22}" + "".join(cells))
+    return "\n".join(lines)
+
+def build_parser():
+    """Build the command-line parser"""
+    parser = argparse.ArgumentParser(description="Benchmark ingest, search and queries with fake models")
+    parser.add_argument("--scale", type=int, action="append", help="Number of synthetic incidents (repeatable)")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Questions timed for search and queries")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per fake embedding request")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    """Command-line entry point"""
+    args = build_parser().parse_args(argv)
+
+    if args.run_one is not None:
+        result = run_scale(args.run_one, args.dim, args.queries, args.embed_latency, args.llm_latency)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for scale in args.scale or [1000]:
+        print(f"Benchmarking {scale:,} incidents...", file=sys.stderr)
+        results.append(_run_in_subprocess(scale, args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print(format_results(results, baseline))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
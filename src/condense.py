@@ -0,0 +1,89 @@
+"""
+Condense module for the Security Incident Analysis application.
+Decides when a follow-up question must be rewritten before retrieval.
+
+Rewriting a follow-up into a standalone question costs an extra LLM call before
+retrieval can start. Questions that already name what they ask about (an
+incident ID, a CVE, a known incident type) and do not refer back to earlier
+turns are sent to retrieval as they are.
+"""
+
+import re
+import threading
+from src.config import CONDENSE_POLICY, CONDENSE_MIN_WORDS
+
+_policy_lock = threading.Lock()
+_shared_policy = None
+
+# Words that point back at earlier turns
+_REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|he|she|his|her|same|above|previous|"
+    r"earlier|former|latter|other|another|else|again|instead)\b",
+    re.IGNORECASE
+)
+_FOLLOW_UP_PATTERN = re.compile(r"^\s*(and|but|or|so|also|then|what about|how about|why|more)\b", re.IGNORECASE)
+_IDENTIFIER_PATTERN = re.compile(r"\bINC-[\w-]+|\bCVE-\d{4}-\d+|\b\d{1,3}(?:\.\d{1,3}){3}\b", re.IGNORECASE)
+
+class CondensePolicy:
+    """
+    Decide per question whether to run the question-condensing LLM call
+    
+    Args:
+        policy: "auto" to use the heuristic, "always" or "never"
+        min_words: Shortest question (in words) treated as self-contained
+    """
+    
+    def __init__(self, policy=CONDENSE_POLICY, min_words=CONDENSE_MIN_WORDS):
+        self.policy = policy
+        self.min_words = min_words
+        self.reasons = {}
+        self._lock = threading.Lock()
+    
+    def decide(self, question, chat_history_str, known_types=()):
+        """
+        Return (condense, reason) for a question and the chat history it follows
+        
+        Args:
+            question: The question as the user asked it
+            chat_history_str: Chat history passed to the chain, empty on the first turn
+            known_types: Incident types present in the index (lower-case)
+        """
+        if not chat_history_str:
+            condense, reason = False, "first_turn"
+        elif self.policy in ("always", "never"):
+            condense, reason = self.policy == "always", f"policy_{self.policy}"
+        elif _IDENTIFIER_PATTERN.search(question):
+            condense, reason = False, "names_incident"
+        elif _FOLLOW_UP_PATTERN.search(question) or _REFERENCE_PATTERN.search(question):
+            condense, reason = True, "refers_back"
+        elif len(question.split()) < self.min_words:
+            condense, reason = True, "short"
+        elif any(re.search(r"\b" + re.escape(incident_type), question.lower()) for incident_type in known_types):
+            condense, reason = False, "names_type"
+        else:
+            condense, reason = False, "self_contained"
+        
+        with self._lock:
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return condense, reason
+    
+    def stats(self):
+        """Return condensed/skipped counts, the skip rate and counts per reason"""
+        with self._lock:
+            reasons = dict(self.reasons)
+        condensed = sum(count for reason, count in reasons.items() if reason in ("refers_back", "short", "policy_always"))
+        total = sum(reasons.values())
+        return {
+            "condensed": condensed,
+            "skipped": total - condensed,
+            "skip_rate": (total - condensed) / total if total else 0.0,
+            "reasons": reasons,
+        }
+
+def get_condense_policy():
+    """Return the process-wide condense policy, so skip rates cover every session"""
+    global _shared_policy
+    with _policy_lock:
+        if _shared_policy is None:
+            _shared_policy = CondensePolicy()
+        return _shared_policy
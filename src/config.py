@@ -8,6 +8,97 @@ import warnings
 import streamlit as st
 from dotenv import load_dotenv
 
+# Model settings
+EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "8"))
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", "6"))
+
+# Vector index settings
+INDEX_FACTORY = os.environ.get("INDEX_FACTORY", "auto")
+FAISS_NPROBE = int(os.environ.get("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", "64"))
+# One of: none, fp16, int8, pq
+VECTOR_COMPRESSION = os.environ.get("VECTOR_COMPRESSION", "none").lower()
+# Compressed indexes fetch k * RERANK_FACTOR candidates and re-rank them exactly (0 disables)
+RERANK_FACTOR = int(os.environ.get("RERANK_FACTOR", "4"))
+
+# Index sharding settings
+# Incidents are partitioned into shards by date: "month", "year" or "none"
+INDEX_SHARD_PERIOD = os.environ.get("INDEX_SHARD_PERIOD", "month").lower()
+# Most recent shards, loaded with the index and always kept in memory
+SHARD_HOT_COUNT = int(os.environ.get("SHARD_HOT_COUNT", "3"))
+# Other shards are unloaded once no search has needed them for this long (0 keeps them)
+SHARD_IDLE_SECONDS = int(os.environ.get("SHARD_IDLE_SECONDS", "600"))
+# Most shards kept in memory, least recently searched unloaded first (0 for no limit)
+SHARD_MAX_LOADED = int(os.environ.get("SHARD_MAX_LOADED", "0"))
+# Threads searching shards in parallel (1 searches them one after another)
+SHARD_SEARCH_THREADS = int(os.environ.get("SHARD_SEARCH_THREADS", str(min(8, os.cpu_count() or 1))))
+
+# Retrieval settings
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "6"))
+# Candidates taken from each of the vector and keyword searches before fusion
+RETRIEVAL_FETCH_K = int(os.environ.get("RETRIEVAL_FETCH_K", "30"))
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# Question condensing settings
+# "auto" rewrites only follow-ups that need it, "always" or "never"
+CONDENSE_POLICY = os.environ.get("CONDENSE_POLICY", "auto").lower()
+# Follow-ups shorter than this many words are always rewritten
+CONDENSE_MIN_WORDS = int(os.environ.get("CONDENSE_MIN_WORDS", "6"))
+# Optional smaller, faster model for the rewrite (defaults to the answer model)
+CONDENSE_MODEL = os.environ.get("CONDENSE_MODEL", "")
+
+# Prompt context settings
+# Token budget for the retrieved incidents placed in the prompt (0 disables the limit)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2000"))
+# Longest a single incident field may be in the prompt
+CONTEXT_FIELD_TOKENS = int(os.environ.get("CONTEXT_FIELD_TOKENS", "150"))
+# Word overlap at which an incident is dropped as a near-duplicate of a better-ranked one
+CONTEXT_DEDUP_SIMILARITY = float(os.environ.get("CONTEXT_DEDUP_SIMILARITY", "0.9"))
+
+# Conversation memory settings
+# Token budget for the chat history sent with each question
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", "1500"))
+# Size of the one-line summary kept for each older turn
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("MEMORY_SUMMARY_TOKENS", "60"))
+
+# Chat display settings
+# Most recent turns drawn in full on every redraw of the chat
+CHAT_RECENT_TURNS = int(os.environ.get("CHAT_RECENT_TURNS", "5"))
+# Older turns drawn per page when browsing earlier turns
+CHAT_PAGE_SIZE = int(os.environ.get("CHAT_PAGE_SIZE", "10"))
+
+# HTTP API settings
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8080"))
+# Conversation memories the API keeps for session_id callers
+API_MAX_SESSIONS = int(os.environ.get("API_MAX_SESSIONS", "1000"))
+
+# Batch analysis settings
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+# Metrics settings
+# One JSON line per request is appended here (empty disables the file)
+METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", "request_metrics.jsonl")
+METRICS_LOG_MAX_BYTES = int(os.environ.get("METRICS_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Storage settings
+FAISS_INDEX_PATH = os.environ.get("FAISS_INDEX_PATH", "faiss_index")
+COMPACTION_DELTA_THRESHOLD = int(os.environ.get("COMPACTION_DELTA_THRESHOLD", "8"))
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "256"))
+INGEST_SEGMENT_ROWS = int(os.environ.get("INGEST_SEGMENT_ROWS", "50000"))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "answer_cache.sqlite")
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Cosine similarity above which a differently worded question reuses an answer (0 disables)
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0"))
+
 # Load environment variables from .env file
 def load_environment():
     """Load environment variables from .env file"""
@@ -34,18 +125,30 @@ def check_api_key():
         return False
     return True
 
+def get_session_memory():
+    """Return this session's conversation memory, creating it on first use"""
+    if st.session_state.get("memory") is None:
+        # The single store for the conversation: the chat renders it, the chain reads a budgeted view
+        from src.memory import TokenBudgetMemory
+        st.session_state.memory = TokenBudgetMemory(return_messages=True)
+    return st.session_state.memory
+
 def initialize_session_state():
     """Initialize Streamlit session state variables"""
-    if "conversation_history" not in st.session_state:
-        st.session_state.conversation_history = []
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    if "memory" not in st.session_state:
+        # Created by get_session_memory() once a conversation needs it, so the
+        # first page load does not import LangChain
+        st.session_state.memory = None
     if "db" not in st.session_state:
         st.session_state.db = None
+    if "index_generation" not in st.session_state:
+        st.session_state.index_generation = None
     if "conversation_chain" not in st.session_state:
         st.session_state.conversation_chain = None
     if "document_processed" not in st.session_state:
         st.session_state.document_processed = False
+    if "last_retrieval" not in st.session_state:
+        st.session_state.last_retrieval = None
 
 def configure_page():
     """Configure Streamlit page settings"""
@@ -0,0 +1,114 @@
+"""
+Context packer module for the Security Incident Analysis application.
+Assembles retrieved incidents into a compact prompt context within a token budget.
+
+Incidents are indexed as indented "Field: value" reports. Before they go into
+the prompt they are rewritten as one compact line each (header fields joined,
+"Unknown" and empty fields dropped, long fields truncated), near-duplicates of
+a better-ranked incident are skipped, and incidents are added in ranking order
+until CONTEXT_TOKEN_BUDGET is full.
+"""
+
+import re
+from langchain_core.documents import Document
+from src.config import CONTEXT_TOKEN_BUDGET, CONTEXT_FIELD_TOKENS, CONTEXT_DEDUP_SIMILARITY
+from src.tokens import estimate_tokens, truncate_tokens
+
+# Short fields that make up the header of a compacted incident, in order
+HEADER_FIELDS = ("Incident ID", "Date", "Type", "Severity")
+
+_FIELD_PATTERN = re.compile(r"^\s*([A-Z][A-Za-z ]{0,30}):\s*(.*?)\s*$")
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+def parse_fields(text):
+    """
+    Split an incident report into (field, value) pairs
+    
+    Lines that do not start with a field label are appended to the previous
+    field, or kept under an empty label if they come first.
+    """
+    fields = []
+    for line in str(text).splitlines():
+        if not line.strip():
+            continue
+        match = _FIELD_PATTERN.match(line)
+        if match:
+            fields.append([match.group(1), match.group(2)])
+        elif fields:
+            fields[-1][1] = f"{fields[-1][1]} {line.strip()}".strip()
+        else:
+            fields.append(["", line.strip()])
+    return [(field, value) for field, value in fields]
+
+def _present(value):
+    return bool(value) and value.lower() not in ("unknown", "nan", "none")
+
+def compact_incident(text, field_tokens=CONTEXT_FIELD_TOKENS):
+    """
+    Rewrite an incident report as a single compact line
+    
+    Example:
+        "[INC-2023-003 | 2023-03-10 | Ransomware] Description: ... Impact: ..."
+    """
+    fields = parse_fields(text)
+    header = [value for field, value in fields if field in HEADER_FIELDS and _present(value)]
+    body = [
+        f"{field}: {truncate_tokens(value, field_tokens)}" if field else truncate_tokens(value, field_tokens)
+        for field, value in fields if field not in HEADER_FIELDS and _present(value)
+    ]
+    parts = [f"[{' | '.join(header)}]"] if header else []
+    return " ".join(parts + body)
+
+def _word_set(text):
+    """Words of an incident's content, leaving out its ID and date so re-filed copies match"""
+    fields = parse_fields(text)
+    content = " ".join(value for field, value in fields if field not in ("Incident ID", "Date"))
+    return set(_WORD_PATTERN.findall(content.lower()))
+
+def _jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+def pack_context(docs, budget=CONTEXT_TOKEN_BUDGET, field_tokens=CONTEXT_FIELD_TOKENS,
+                 similarity=CONTEXT_DEDUP_SIMILARITY):
+    """
+    Compact, dedupe and budget retrieved incidents for the prompt
+    
+    Args:
+        docs: Retrieved documents, best first
+        budget: Token budget for the whole context (0 disables the limit)
+        field_tokens: Longest any single field may be, in tokens
+        similarity: Word-set Jaccard similarity at which an incident counts as a
+            near-duplicate of a better-ranked one (above 1 disables)
+        
+    Returns:
+        tuple: The packed documents (same ids and metadata, compact text) and a
+        report with document counts and raw vs packed token counts
+    """
+    packed = []
+    kept_words = []
+    used = 0
+    report = {"retrieved": len(docs), "duplicates": 0, "over_budget": 0, "packed": 0,
+              "raw_tokens": sum(estimate_tokens(doc.page_content) for doc in docs), "context_tokens": 0}
+    
+    for doc in docs:
+        words = _word_set(doc.page_content)
+        if any(_jaccard(words, other) >= similarity for other in kept_words):
+            report["duplicates"] += 1
+            continue
+        
+        text = compact_incident(doc.page_content, field_tokens)
+        cost = estimate_tokens(text)
+        # Skip incidents that do not fit, a lower-ranked shorter one may still
+        if budget and used + cost > budget:
+            report["over_budget"] += 1
+            continue
+        
+        packed.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+        kept_words.append(words)
+        used += cost
+    
+    report["packed"] = len(packed)
+    report["context_tokens"] = used
+    return packed, report
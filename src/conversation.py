@@ -3,17 +3,241 @@ Conversation module for the Security Incident Analysis application.
 Handles conversation chains and query processing.
 """
 
-import streamlit as st
+import asyncio
+import time
 import traceback
+import streamlit as st
+from typing import Any
 from langchain.prompts import PromptTemplate
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+from src.answer_cache import get_answer_cache
+from src.async_runtime import run_sync
+from src.condense import get_condense_policy
+from src.config import get_session_memory, ANSWER_CACHE_ENABLED, CONTEXT_TOKEN_BUDGET
+from src.context_packer import pack_context
+from src.memory import TokenBudgetMemory
+from src.metrics import observe, span, trace
+from src.rag_system import get_condense_llm
+from src.retrieval import HybridRetriever
+from src.tokens import estimate_tokens
+
+class IncidentRetrievalChain(ConversationalRetrievalChain):
+    """
+    ConversationalRetrievalChain that serves repeated questions from the answer cache
+    and can stream its answer token by token
+    
+    The cache is consulted after retrieval, keyed by the standalone question and
+    the retrieved incident ids, so an answer is only reused while the incidents
+    it was built from are unchanged.
+    """
+    
+    answer_cache: Any = None
+    model_name: str = ""
+    last_cache_hit: bool = False
+    last_timings: dict = {}
+    context_token_budget: int = CONTEXT_TOKEN_BUDGET
+    last_context: dict = {}
+    condense_policy: Any = None
+    last_condense: dict = {}
+    
+    def _should_condense(self, question, chat_history_str):
+        """Decide whether the question must be rewritten before retrieval"""
+        # Only pay for the rewrite when the follow-up does not stand on its own
+        condense, reason = bool(chat_history_str), None
+        if self.condense_policy is not None:
+            docstore = self.retriever.vectorstore.docstore
+            known_types = docstore.distinct_values("type") if hasattr(docstore, "distinct_values") else ()
+            condense, reason = self.condense_policy.decide(question, chat_history_str, known_types)
+        self.last_condense = {"condensed": condense, "reason": reason}
+        return condense
+    
+    def _assemble(self, inputs, chat_history_str, new_question, docs):
+        """Pack the retrieved incidents, format the prompt and look up a cached answer"""
+        with span("context_pack"):
+            docs, context_report = pack_context(docs, self.context_token_budget)
+            
+            new_inputs = inputs.copy()
+            if self.rephrase_question:
+                new_inputs["question"] = new_question
+            new_inputs["chat_history"] = chat_history_str
+            
+            # Format the answer prompt up front so its size can be reported per query
+            prompt = self.combine_docs_chain.llm_chain.prompt.format_prompt(
+                **self.combine_docs_chain._get_inputs(docs, **new_inputs)
+            )
+        self.last_context = dict(
+            context_report,
+            question_tokens=estimate_tokens(new_question),
+            history_tokens=estimate_tokens(chat_history_str),
+            prompt_tokens=estimate_tokens(prompt.to_string()),
+        )
+        prepared = {
+            "question": new_question,
+            "docs": docs,
+            "doc_ids": [doc.id for doc in docs],
+            "inputs": new_inputs,
+            "prompt": prompt,
+            "embedding": None,
+            "answer": None,
+        }
+        
+        # Look the answer up only once we know which incidents it would be built from
+        self.last_cache_hit = False
+        prepared["cacheable"] = self.answer_cache is not None and bool(docs) and all(prepared["doc_ids"])
+        if prepared["cacheable"]:
+            with span("answer_cache"):
+                if self.answer_cache.similarity > 0:
+                    prepared["embedding"] = self.retriever.vectorstore._embed_query(new_question)
+                prepared["answer"] = self.answer_cache.get(
+                    new_question, prepared["doc_ids"], self.model_name, prepared["embedding"]
+                )
+            self.last_cache_hit = prepared["answer"] is not None
+        return prepared
+    
+    def _prepare(self, inputs, run_manager):
+        """Condense the question, retrieve and pack incidents, and look up a cached answer"""
+        question = inputs["question"]
+        get_chat_history = self.get_chat_history or _get_chat_history
+        chat_history_str = get_chat_history(inputs["chat_history"])
+        
+        if self._should_condense(question, chat_history_str):
+            with span("condense"):
+                new_question = self.question_generator.run(
+                    question=question,
+                    chat_history=chat_history_str,
+                    callbacks=run_manager.get_child()
+                )
+        else:
+            new_question = question
+        with span("retrieval"):
+            docs = self._get_docs(new_question, inputs, run_manager=run_manager)
+        return self._assemble(inputs, chat_history_str, new_question, docs)
+    
+    async def _aprepare(self, inputs, run_manager):
+        """Async _prepare: model calls are awaited, SQLite and FAISS work runs in threads"""
+        question = inputs["question"]
+        get_chat_history = self.get_chat_history or _get_chat_history
+        chat_history_str = get_chat_history(inputs["chat_history"])
+        
+        if await asyncio.to_thread(self._should_condense, question, chat_history_str):
+            with span("condense"):
+                new_question = await self.question_generator.arun(
+                    question=question,
+                    chat_history=chat_history_str,
+                    callbacks=run_manager.get_child()
+                )
+        else:
+            new_question = question
+        with span("retrieval"):
+            docs = await self._aget_docs(new_question, inputs, run_manager=run_manager)
+        return await asyncio.to_thread(self._assemble, inputs, chat_history_str, new_question, docs)
+    
+    def _finish(self, prepared, answer):
+        """Cache a freshly generated answer and build the chain output"""
+        if prepared["cacheable"] and not self.last_cache_hit:
+            self.answer_cache.put(prepared["question"], prepared["doc_ids"], self.model_name, answer,
+                                  prepared["embedding"])
+        
+        output = {self.output_key: answer}
+        if self.return_source_documents:
+            output["source_documents"] = prepared["docs"]
+        if self.return_generated_question:
+            output["generated_question"] = prepared["question"]
+        return output
+    
+    def _call(self, inputs, run_manager=None):
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        prepared = self._prepare(inputs, _run_manager)
+        
+        answer = prepared["answer"]
+        if answer is None:
+            with span("generate"):
+                answer = self.combine_docs_chain.run(
+                    input_documents=prepared["docs"],
+                    callbacks=_run_manager.get_child(),
+                    **prepared["inputs"]
+                )
+        return self._finish(prepared, answer)
+    
+    async def _acall(self, inputs, run_manager=None):
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        prepared = await self._aprepare(inputs, _run_manager)
+        
+        answer = prepared["answer"]
+        if answer is None:
+            with span("generate"):
+                answer = await self.combine_docs_chain.arun(
+                    input_documents=prepared["docs"],
+                    callbacks=_run_manager.get_child(),
+                    **prepared["inputs"]
+                )
+        return await asyncio.to_thread(self._finish, prepared, answer)
+    
+    def stream_answer(self, question):
+        """
+        Answer a question, yielding the answer text as the model produces it
+        
+        Memory is updated once the answer is complete. Time to first token and
+        total time (ms) are left in last_timings. Time the caller spends between
+        tokens (e.g. rendering them) is recorded as the stream_render stage, apart
+        from generation.
+        """
+        with trace("query", streamed=True) as request:
+            start = time.perf_counter()
+            self.last_timings = {}
+            inputs = self.prep_inputs({"question": question})
+            prepared = self._prepare(inputs, CallbackManagerForChainRun.get_noop_manager())
+            
+            answer = prepared["answer"]
+            if answer is not None:
+                self.last_timings["ttft_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                yield answer
+            else:
+                # Send exactly the prompt the stuff-documents chain would
+                parts = []
+                generating = rendering = 0.0
+                chunks = iter(self.combine_docs_chain.llm_chain.llm.stream(prepared["prompt"]))
+                while True:
+                    stage = time.perf_counter()
+                    chunk = next(chunks, None)
+                    generating += time.perf_counter() - stage
+                    if chunk is None:
+                        break
+                    text = chunk.content if hasattr(chunk, "content") else str(chunk)
+                    if not text:
+                        continue
+                    if not parts:
+                        self.last_timings["ttft_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                        observe("first_token", self.last_timings["ttft_ms"] / 1000)
+                    parts.append(text)
+                    stage = time.perf_counter()
+                    yield text
+                    rendering += time.perf_counter() - stage
+                answer = "".join(parts)
+                observe("generate", generating)
+                observe("stream_render", rendering)
+            
+            with span("memory_save"):
+                self.prep_outputs(inputs, self._finish(prepared, answer))
+            self.last_timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            request.fields.update(answer_cached=self.last_cache_hit, condensed=self.last_condense.get("condensed"))
 
-def setup_conversation_chain(llm, db):
-    """Set up the conversational retrieval chain"""
+def setup_conversation_chain(llm, db, memory=None, condense_llm=None):
+    """
+    Set up the conversational retrieval chain, optionally keeping an existing memory
+    
+    Args:
+        llm: Model that writes the answers
+        db: Vector store to retrieve incidents from
+        memory: Conversation memory to keep; a new one is created if None
+        condense_llm: Model that rewrites follow-up questions; defaults to llm
+    """
     
-    # Create memory
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # Create memory; only a token-budgeted view of it is sent to the model
+    if memory is None:
+        memory = TokenBudgetMemory(return_messages=True)
     
     # Define the prompt template
     template = """
@@ -42,55 +266,102 @@ def setup_conversation_chain(llm, db):
         template=template
     )
     
-    # Create ConversationalRetrievalChain with increased k value
-    conversation_chain = ConversationalRetrievalChain.from_llm(
+    # Create ConversationalRetrievalChain; hybrid vector + keyword retrieval needs
+    # fewer documents than the 10 plain vector search used
+    conversation_chain = IncidentRetrievalChain.from_llm(
         llm=llm,
-        retriever=db.as_retriever(search_kwargs={"k": 10}),  # Increased from 5 to 10
+        condense_question_llm=condense_llm,
+        retriever=HybridRetriever(vectorstore=db),
         memory=memory,
         combine_docs_chain_kwargs={"prompt": custom_prompt},
-        return_source_documents=False  # Disable returning source documents to avoid UUID issues
+        return_source_documents=False,  # Disable returning source documents to avoid UUID issues
+        answer_cache=get_answer_cache() if ANSWER_CACHE_ENABLED else None,
+        model_name=getattr(llm, "model", type(llm).__name__),
+        condense_policy=get_condense_policy()
     )
     
     return conversation_chain
 
+def attach_index_to_session(llm, db, generation):
+    """Point this session at a shared vector store, keeping its conversation memory"""
+    st.session_state.db = db
+    st.session_state.index_generation = generation
+    st.session_state.conversation_chain = setup_conversation_chain(
+        llm, db, get_session_memory(), get_condense_llm()
+    )
+    st.session_state.document_processed = True
+
+def _record_retrieval():
+    """Keep what the last question retrieved for the debug panel instead of searching again"""
+    chain = st.session_state.conversation_chain
+    st.session_state.last_retrieval = chain.retriever.last_result
+    if st.session_state.last_retrieval is not None:
+        st.session_state.last_retrieval["answer_cached"] = chain.last_cache_hit
+        st.session_state.last_retrieval["answer_timings"] = dict(chain.last_timings)
+        st.session_state.last_retrieval["context"] = dict(chain.last_context)
+        st.session_state.last_retrieval["condense"] = dict(chain.last_condense)
+
+async def aprocess_query(chain, question, infer_filter=True):
+    """
+    Answer a question with the async pipeline
+    
+    Many queries can be in flight on one event loop; each waits on the network
+    without holding a thread. The chain's last_* fields describe its most
+    recent query, so concurrent queries should each use their own chain.
+    
+    Args:
+        chain: Conversation chain to answer with
+        question: The question
+        infer_filter: Restrict retrieval to the incident types and dates the
+            question names; turn off when the question embeds an incident
+            whose own type and date should not limit the search
+    
+    Returns:
+        dict: The chain output, with the answer under "answer"
+    """
+    previous = chain.retriever.infer_filter
+    chain.retriever.infer_filter = infer_filter
+    try:
+        with trace("query", streamed=False) as request:
+            response = await chain.ainvoke({"question": question})
+            request.fields.update(answer_cached=chain.last_cache_hit, condensed=chain.last_condense.get("condensed"))
+    finally:
+        chain.retriever.infer_filter = previous
+    return response
+
 def process_user_query(user_query):
-    """Process user query through the conversational chain"""
+    """Process user query through the conversational chain (sync wrapper over aprocess_query)"""
     
     if st.session_state.conversation_chain:
         try:
-            # Debug: Get documents relevant to the query
-            retriever = st.session_state.db.as_retriever(search_kwargs={"k": 5})
-            retrieved_docs = retriever.get_relevant_documents(user_query)
-            
-            # Print debugging info about retrieved documents
-            st.write("### Debug: Retrieved Documents")
-            st.write(f"Retrieved {len(retrieved_docs)} documents")
-            for i, doc in enumerate(retrieved_docs):
-                st.write(f"**Document {i+1}:**")
-                st.write(doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content)
-                st.write("---")
+            # Process the query; the chain's retriever runs the only retrieval pass
+            # and the chain stores the turn in the session memory
+            st.session_state.conversation_chain.retriever.last_result = None
+            st.session_state.conversation_chain.last_timings = {}
+            response = run_sync(aprocess_query(st.session_state.conversation_chain, user_query))
             
-            # Convert UUID objects to strings in the chat history
-            safe_chat_history = []
-            for msg_pair in st.session_state.chat_history:
-                # Make sure we're storing tuples of strings
-                safe_msg_pair = (str(msg_pair[0]), str(msg_pair[1]))
-                safe_chat_history.append(safe_msg_pair)
-                
-            # Process the query
-            response = st.session_state.conversation_chain({"question": user_query})
-            
-            # Store the response
             response_text = response.get('answer', 'No answer provided')
-            st.session_state.chat_history.append((user_query, response_text))
-            st.session_state.conversation_history.append({"role": "user", "content": user_query})
-            st.session_state.conversation_history.append({"role": "assistant", "content": response_text})
+            _record_retrieval()
             
             return response_text
         except Exception as e:
             st.error(f"Error in processing query: {str(e)}")
-            st.error("Debug info: Chat history length: " + str(len(st.session_state.chat_history)))
+            st.error("Debug info: Chat history length: " + str(len(st.session_state.memory.turns())))
             st.error(traceback.format_exc())
             return f"An error occurred: {str(e)}"
     else:
         return "Please upload security incident data first to initialize the system."
+
+def stream_user_query(user_query):
+    """
+    Process user query through the conversational chain, yielding answer tokens
+    
+    The chain stores the complete answer in the session memory once streaming finishes.
+    """
+    if not st.session_state.conversation_chain:
+        yield "Please upload security incident data first to initialize the system."
+        return
+    
+    st.session_state.conversation_chain.retriever.last_result = None
+    yield from st.session_state.conversation_chain.stream_answer(user_query)
+    _record_retrieval()
@@ -3,11 +3,15 @@ Data loader module for the Security Incident Analysis application.
 Handles loading and processing data from various sources.
 """
 
-import json
-import pandas as pd
 import streamlit as st
-from src.rag_system import create_vector_db, initialize_rag_system, load_vector_db
-from src.conversation import setup_conversation_chain
+from src.config import get_api_key
+from src.rag_system import initialize_rag_system
+from src.ingest import iter_incident_records, index_incident_stream
+from src.registry import (
+    current_generation, get_shared_vector_db, rebuild_shared_vector_db
+)
+from src.conversation import attach_index_to_session
+from src.metrics import trace
 import uuid
 
 def load_sample_data():
@@ -71,6 +75,7 @@ def load_sample_data():
     
     return sample_incidents
 
+@trace("ingest_sample")
 def process_sample_data():
     """Process sample data and initialize the RAG system"""
     try:
@@ -80,13 +85,11 @@ def process_sample_data():
         # Load sample data
         sample_incidents = load_sample_data()
         
-        # Create vector database
-        st.session_state.db = create_vector_db(embeddings, sample_incidents)
+        # Create vector database and share it with every session
+        db, generation = rebuild_shared_vector_db(embeddings, sample_incidents)
         
         # Set up conversation chain
-        st.session_state.conversation_chain = setup_conversation_chain(llm, st.session_state.db)
-        
-        st.session_state.document_processed = True
+        attach_index_to_session(llm, db, generation)
         return True
     except Exception as e:
         st.error(f"Error initializing the system: {str(e)}")
@@ -94,38 +97,45 @@ def process_sample_data():
         st.error(traceback.format_exc())
         return False
 
+@trace("ingest_upload")
 def process_uploaded_file(uploaded_file):
-    """Process uploaded file (JSON or CSV) and initialize the RAG system"""
+    """Stream an uploaded file (CSV, JSON array or NDJSON) into the index and initialize the RAG system"""
     try:
         # Initialize RAG components
         embeddings, llm = initialize_rag_system()
         
-        # Process uploaded file
-        incidents = []
-        if uploaded_file.type == "application/json":
-            data = json.loads(uploaded_file.read())
-            for incident in data:
-                # Format each incident as proper text
-                incident_text = format_incident_for_embedding(incident)
-                incidents.append(incident_text)
-        else:  # CSV
-            df = pd.read_csv(uploaded_file)
-            for _, row in df.iterrows():
-                # Format each row as a proper incident text
-                incident_text = format_incident_for_embedding(dict(row))
-                incidents.append(incident_text)
+        progress_bar = st.progress(0.0)
+        progress_text = st.empty()
+        
+        def report_progress(stats):
+            # Bytes consumed so far is the only size we know before the end
+            if getattr(uploaded_file, "size", 0):
+                progress_bar.progress(min(uploaded_file.tell() / uploaded_file.size, 1.0))
+            progress_text.text(f"Indexed {stats['rows']} incidents ({stats['rows_per_sec']:.0f} rows/sec)")
+        
+        # Format, embed and index the file in bounded batches
+        stats = index_incident_stream(
+            iter_incident_records(uploaded_file),
+            embeddings,
+            format_incident_for_embedding,
+            on_progress=report_progress
+        )
+        progress_bar.progress(1.0)
+        
+        if not stats["rows"]:
+            st.error("No incidents found in uploaded file.")
+            return False
         
         # Log information about the incidents
-        st.info(f"Processed {len(incidents)} incidents from uploaded file")
+        st.info(f"Processed {stats['rows']} incidents from uploaded file "
+                f"in {stats['elapsed']:.1f}s ({stats['rows_per_sec']:.0f} rows/sec): "
+                f"{stats['new']} new, {stats['changed']} changed, {stats['skipped']} skipped as duplicates")
         
-        # Update the vector database with new incidents
-        from src.rag_system import update_vector_db
-        st.session_state.db = update_vector_db(embeddings, incidents)
+        # Pick up the new segments in the shared vector database
+        db, generation = get_shared_vector_db(embeddings)
         
         # Set up conversation chain
-        st.session_state.conversation_chain = setup_conversation_chain(llm, st.session_state.db)
-        
-        st.session_state.document_processed = True
+        attach_index_to_session(llm, db, generation)
         return True
     except Exception as e:
         st.error(f"Error processing data: {str(e)}")
@@ -135,12 +145,16 @@ def process_uploaded_file(uploaded_file):
 
 def format_incident_for_embedding(incident_data):
     """Format incident data as text for embedding"""
-    incident_id = incident_data.get('Incident ID', incident_data.get('incident_id', f'INC-AUTO-{uuid.uuid4().hex[:8]}'))
+    incident_id = incident_data.get('Incident ID', incident_data.get('incident_id'))
+    # Blank CSV cells are read as NaN; such incidents get a generated ID like any other without one
+    if incident_id is None or not str(incident_id).strip() or str(incident_id) == "nan":
+        incident_id = f'INC-AUTO-{uuid.uuid4().hex[:8]}'
     date = incident_data.get('Date', incident_data.get('date', 'Unknown'))
     incident_type = incident_data.get('Type', incident_data.get('type', 'Unknown'))
     description = incident_data.get('Description', incident_data.get('description', ''))
     impact = incident_data.get('Impact', incident_data.get('impact', ''))
     mitigation = incident_data.get('Mitigation', incident_data.get('mitigation', ''))
+    severity = incident_data.get('Severity', incident_data.get('severity'))
     
     # Create the incident report text
     incident_report = f"""
@@ -152,24 +166,25 @@ def format_incident_for_embedding(incident_data):
     Mitigation: {mitigation}
     """
     
+    # Only add severity when the source has it, so existing incidents keep their fingerprint
+    if severity is not None and str(severity).strip() and str(severity) != "nan":
+        incident_report += f"Severity: {severity}\n    "
+    
     return incident_report
 
+@trace("load_index")
 def load_existing_index():
     """Load existing FAISS index and initialize the RAG system"""
     try:
         # Initialize RAG components
         embeddings, llm = initialize_rag_system()
         
-        # Load existing FAISS index
-        existing_db = load_vector_db(embeddings)
+        # Load existing FAISS index (shared across sessions)
+        existing_db, generation = get_shared_vector_db(embeddings)
         
         if existing_db:
-            st.session_state.db = existing_db
-            
             # Set up conversation chain
-            st.session_state.conversation_chain = setup_conversation_chain(llm, st.session_state.db)
-            
-            st.session_state.document_processed = True
+            attach_index_to_session(llm, existing_db, generation)
             return True
         else:
             st.error("No existing FAISS index found.")
@@ -179,3 +194,20 @@ def load_existing_index():
         import traceback
         st.error(traceback.format_exc())
         return False
+
+def sync_session_index():
+    """Switch this session to the latest shared index if it changed on disk"""
+    if not st.session_state.document_processed or not get_api_key():
+        return
+    
+    generation = current_generation()
+    if generation is None or generation == st.session_state.index_generation:
+        return
+    
+    try:
+        embeddings, llm = initialize_rag_system()
+        db, generation = get_shared_vector_db(embeddings)
+        if db:
+            attach_index_to_session(llm, db, generation)
+    except Exception as e:
+        st.warning(f"Could not refresh the shared index: {str(e)}")
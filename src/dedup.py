@@ -0,0 +1,190 @@
+"""
+Deduplication module for the Security Incident Analysis application.
+Tracks which incidents are already indexed so ingest can skip or upsert them.
+
+Every indexed incident is recorded in a SQLite ledger stored inside the index
+directory, keyed by its Incident ID and by a fingerprint of its content. When
+an incident is re-ingested with changed content, the new version is indexed and
+the old vector is tombstoned; tombstones are applied when the index is loaded
+and purged for good when segments are compacted.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from src.ann_index import remove_from_store
+from src.answer_cache import get_answer_cache
+from src.config import FAISS_INDEX_PATH
+from src.embedding_cache import normalize_text
+
+LEDGER_FILE = "incidents.sqlite"
+
+# Stays on the Incident ID line, so an empty ID does not capture the next line
+_INCIDENT_ID_PATTERN = re.compile(r"^\s*Incident ID:[ \t]*(.*?)[ \t]*$", re.MULTILINE)
+_ledger_lock = threading.Lock()
+_ledgers = {}
+
+def parse_incident_id(text):
+    """Return the Incident ID in a formatted incident, ignoring auto-generated and blank IDs"""
+    match = _INCIDENT_ID_PATTERN.search(text)
+    if not match:
+        return None
+    incident_id = match.group(1)
+    # "nan" is a blank CSV cell formatted before blank IDs were replaced
+    if not incident_id or incident_id.startswith("INC-AUTO-") or incident_id.lower() == "nan":
+        return None
+    return incident_id
+
+def content_fingerprint(text):
+    """Fingerprint an incident's content, excluding its Incident ID line"""
+    body = _INCIDENT_ID_PATTERN.sub("", text, count=1)
+    return hashlib.sha256(normalize_text(body).encode("utf-8")).hexdigest()
+
+def empty_report():
+    """Return a zeroed new/changed/skipped report"""
+    return {"new": 0, "changed": 0, "skipped": 0}
+
+class IncidentLedger:
+    """SQLite index of indexed incidents by Incident ID and content fingerprint"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS incidents ("
+            "doc_id TEXT PRIMARY KEY, incident_id TEXT, fingerprint TEXT NOT NULL, "
+            "deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS incidents_incident_id ON incidents(incident_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS incidents_fingerprint ON incidents(fingerprint)")
+        self._conn.commit()
+
+    def _live_by_incident_id(self, incident_id):
+        return self._conn.execute(
+            "SELECT doc_id, fingerprint FROM incidents WHERE incident_id = ? AND deleted = 0",
+            (incident_id,)
+        ).fetchone()
+
+    def _has_fingerprint(self, fingerprint):
+        return self._conn.execute(
+            "SELECT 1 FROM incidents WHERE fingerprint = ? AND deleted = 0 LIMIT 1",
+            (fingerprint,)
+        ).fetchone() is not None
+
+    def plan(self, texts, pending=None):
+        """
+        Decide which incident texts need indexing
+
+        Args:
+            texts: Formatted incident texts
+            pending: Optional dict shared across calls, so incidents planned but
+                not yet committed (e.g. earlier batches of the same upload)
+                are deduplicated too
+
+        Returns:
+            dict: texts and doc_ids to index, rows to record, doc ids to
+            tombstone and a new/changed/skipped report
+        """
+        if pending is None:
+            pending = {}
+        pending_ids = pending.setdefault("incident_ids", {})
+        pending_fingerprints = pending.setdefault("fingerprints", set())
+
+        plan = {"texts": [], "doc_ids": [], "rows": [], "replaced": [], "report": empty_report()}
+        with self._lock:
+            for text in texts:
+                incident_id = parse_incident_id(text)
+                fingerprint = content_fingerprint(text)
+
+                previous = None
+                if incident_id is not None:
+                    previous = pending_ids.get(incident_id) or self._live_by_incident_id(incident_id)
+
+                if previous is not None and previous[1] == fingerprint:
+                    plan["report"]["skipped"] += 1
+                    continue
+                if previous is None and (fingerprint in pending_fingerprints or self._has_fingerprint(fingerprint)):
+                    plan["report"]["skipped"] += 1
+                    continue
+
+                doc_id = str(uuid.uuid4())
+                if previous is not None:
+                    plan["replaced"].append(previous[0])
+                    plan["report"]["changed"] += 1
+                else:
+                    plan["report"]["new"] += 1
+
+                plan["texts"].append(text)
+                plan["doc_ids"].append(doc_id)
+                plan["rows"].append((doc_id, incident_id, fingerprint))
+                if incident_id is not None:
+                    pending_ids[incident_id] = (doc_id, fingerprint)
+                pending_fingerprints.add(fingerprint)
+
+        return plan
+
+    def commit(self, plan):
+        """Record a plan's incidents once they have been written to the index"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO incidents (doc_id, incident_id, fingerprint) VALUES (?, ?, ?)",
+                plan["rows"]
+            )
+            self._conn.executemany(
+                "UPDATE incidents SET deleted = 1 WHERE doc_id = ?",
+                [(doc_id,) for doc_id in plan["replaced"]]
+            )
+            self._conn.commit()
+
+        # Answers built from a replaced incident describe its old version
+        if plan["replaced"]:
+            get_answer_cache().invalidate_documents(plan["replaced"])
+
+    def record(self, doc_ids, texts):
+        """Record already-indexed documents, e.g. when backfilling an older index"""
+        rows = [(doc_id, parse_incident_id(text), content_fingerprint(text)) for doc_id, text in zip(doc_ids, texts)]
+        self.commit({"rows": rows, "replaced": []})
+
+    def deleted_doc_ids(self):
+        """Return doc ids whose vectors were superseded but may still be on disk"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT doc_id FROM incidents WHERE deleted = 1")]
+
+    def purge(self, doc_ids):
+        """Forget tombstones whose vectors have been physically removed"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM incidents WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+            self._conn.commit()
+
+    def reset(self):
+        """Forget every incident (the index is being rebuilt)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM incidents")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM incidents WHERE deleted = 0").fetchone()[0]
+
+def get_incident_ledger(index_path=FAISS_INDEX_PATH):
+    """Return the ledger for an index directory, reopening it if the directory was reset"""
+    path = os.path.join(index_path, LEDGER_FILE)
+    with _ledger_lock:
+        ledger = _ledgers.get(index_path)
+        if ledger is None or not os.path.exists(path):
+            os.makedirs(index_path, exist_ok=True)
+            ledger = IncidentLedger(path)
+            _ledgers[index_path] = ledger
+        return ledger
+
+def apply_tombstones(db, index_path=FAISS_INDEX_PATH):
+    """Remove superseded incidents from a loaded store, returning the removed doc ids"""
+    live_ids = set(db.index_to_docstore_id.values())
+    removed = [doc_id for doc_id in get_incident_ledger(index_path).deleted_doc_ids() if doc_id in live_ids]
+    remove_from_store(db, removed)
+    return removed
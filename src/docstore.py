@@ -0,0 +1,314 @@
+"""
+Docstore module for the Security Incident Analysis application.
+Keeps incident texts and metadata on disk instead of in a pickled index.pkl.
+
+Every segment of the index shares one SQLite table of documents, labelled with
+the segment that owns them. Loading a segment only reads its FAISS index and id
+list; a search fetches just the documents it returns. Documents of a removed
+segment are deleted with it, so superseded incidents disappear at compaction.
+
+Incident ID, type, date and severity are also kept in indexed columns, so a
+metadata filter can be resolved to candidate ids before the vector search.
+
+An FTS5 inverted index over the incident texts is kept in sync by triggers, so
+exact tokens such as CVE IDs, hostnames and incident IDs can be found with
+BM25 ranking alongside the vector search.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+from src.config import FAISS_INDEX_PATH
+from src.incident_metadata import incident_metadata, normalize_date
+
+DOCSTORE_FILE = "documents.sqlite"
+
+# Filterable metadata key -> indexed column
+FILTER_COLUMNS = {
+    "incident_id": "incident_id",
+    "type": "incident_type",
+    "date": "incident_date",
+    "severity": "severity",
+}
+_COMPARISONS = {"$eq": "=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+# Keeps CVE-2021-44228, web-01.corp.local and INC-2023-006 as single query terms
+_QUERY_TERM_PATTERN = re.compile(r"\w[\w.\-:/@]*\w|\w")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from has have how i in is it its me of on or our "
+    "show tell that the their there these this to us was we were what when where which who why will "
+    "with you about any all incident incidents like similar list find give please".split()
+)
+
+_docstore_lock = threading.Lock()
+_docstores = {}
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore reading documents from SQLite on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, segment TEXT, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_segment ON documents(segment)")
+        self._add_metadata_columns()
+        self._create_keyword_index()
+        self._conn.commit()
+
+    def _create_keyword_index(self):
+        """Create the FTS5 index over document texts, and the triggers keeping it in sync"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'"
+        ).fetchone()
+        if exists:
+            return
+
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE documents_fts USING fts5("
+            "page_content, content='documents', tokenize='porter unicode61')"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER documents_fts_insert AFTER INSERT ON documents BEGIN "
+            "INSERT INTO documents_fts(rowid, page_content) VALUES (new.rowid, new.page_content); END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER documents_fts_delete AFTER DELETE ON documents BEGIN "
+            "INSERT INTO documents_fts(documents_fts, rowid, page_content) "
+            "VALUES ('delete', old.rowid, old.page_content); END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER documents_fts_update AFTER UPDATE OF page_content ON documents BEGIN "
+            "INSERT INTO documents_fts(documents_fts, rowid, page_content) "
+            "VALUES ('delete', old.rowid, old.page_content); "
+            "INSERT INTO documents_fts(rowid, page_content) VALUES (new.rowid, new.page_content); END"
+        )
+        # Index documents stored before the keyword index existed
+        self._conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+
+    def _add_metadata_columns(self):
+        """Add the filter columns, backfilling them for documents stored before they existed"""
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        missing = [column for column in FILTER_COLUMNS.values() if column not in existing]
+        for column in missing:
+            self._conn.execute(f"ALTER TABLE documents ADD COLUMN {column} TEXT")
+        for column in FILTER_COLUMNS.values():
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS documents_{column} ON documents({column})")
+
+        if missing:
+            rows = self._conn.execute("SELECT doc_id, page_content, metadata FROM documents").fetchall()
+            self._conn.executemany(
+                "UPDATE documents SET metadata = ?, incident_id = ?, incident_type = ?, incident_date = ?, "
+                "severity = ? WHERE doc_id = ?",
+                [self._metadata_row(page_content, json.loads(metadata)) + (doc_id,)
+                 for doc_id, page_content, metadata in rows]
+            )
+
+    @staticmethod
+    def _metadata_row(page_content, metadata):
+        """Return (metadata json, incident_id, type, date, severity) for a document"""
+        metadata = {**incident_metadata(page_content), **metadata}
+        return (
+            json.dumps(metadata),
+            metadata.get("incident_id"),
+            metadata.get("type"),
+            metadata.get("date"),
+            metadata.get("severity"),
+        )
+
+    def search(self, search):
+        """Return the document with the given id, or a message if it does not exist"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM documents WHERE doc_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts, segment=None):
+        """Insert or update documents; without a segment, a stored document keeps its label"""
+        rows = [
+            (doc_id, segment, doc.page_content) + self._metadata_row(doc.page_content, doc.metadata)
+            for doc_id, doc in texts.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO documents (doc_id, segment, page_content, metadata, incident_id, incident_type, "
+                "incident_date, severity) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(doc_id) DO UPDATE SET page_content = excluded.page_content, "
+                "metadata = excluded.metadata, incident_id = excluded.incident_id, "
+                "incident_type = excluded.incident_type, incident_date = excluded.incident_date, "
+                "severity = excluded.severity, segment = COALESCE(excluded.segment, documents.segment)",
+                rows
+            )
+            self._conn.commit()
+
+    def delete(self, ids):
+        """Delete documents by id"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+            self._conn.commit()
+
+    def write_segment(self, segment, doc_ids, source):
+        """
+        Record that doc_ids belong to segment
+
+        Documents already in this store (e.g. when compacting) are relabelled in
+        place; documents held by another docstore are copied in.
+        """
+        if source is self:
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE documents SET segment = ? WHERE doc_id = ?",
+                    [(segment, doc_id) for doc_id in doc_ids]
+                )
+                self._conn.commit()
+        else:
+            self.add({doc_id: source.search(doc_id) for doc_id in doc_ids}, segment)
+
+    def delete_segment(self, segment):
+        """Delete every document owned by a removed segment"""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE segment = ?", (segment,))
+            self._conn.commit()
+
+    def segment_of(self, doc_id):
+        """Return the segment that owns a document, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT segment FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def can_filter(self, filter):
+        """Return True if a metadata filter only uses indexed columns, so it can be applied in SQL"""
+        return _filter_sql(filter)[0] is not None
+
+    def filter_ids(self, filter):
+        """
+        Return the ids of documents matching a metadata filter
+
+        Returns None if the filter uses keys or operators that have no indexed
+        column, so the caller can fall back to filtering after the search.
+        """
+        where, params = _filter_sql(filter)
+        if where is None:
+            return None
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT doc_id FROM documents WHERE {where}", params)]
+
+    def keyword_search(self, query, limit, filter=None):
+        """
+        Rank documents matching the query's terms with BM25
+
+        Args:
+            query: Free-text question; each term is matched as a phrase of its tokens
+            limit: Maximum number of results
+            filter: Optional metadata filter, applied in SQL when it uses indexed fields
+
+        Returns:
+            list: (doc_id, bm25 score) pairs, best first (lower scores are better)
+        """
+        match = keyword_query(query)
+        if match is None:
+            return []
+
+        where, params = ("1", [])
+        if filter is not None:
+            where, params = _filter_sql(filter)
+            if where is None:
+                # The caller filters the fetched documents instead
+                where, params = ("1", [])
+
+        with self._lock:
+            return self._conn.execute(
+                "SELECT documents.doc_id, bm25(documents_fts) AS score FROM documents_fts "
+                "JOIN documents ON documents.rowid = documents_fts.rowid "
+                f"WHERE documents_fts MATCH ? AND {where} ORDER BY score LIMIT ?",
+                [match] + list(params) + [limit]
+            ).fetchall()
+
+    def distinct_values(self, key):
+        """Return the distinct stored values of a filterable metadata key"""
+        column = FILTER_COLUMNS[key]
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                f"SELECT DISTINCT {column} FROM documents WHERE {column} IS NOT NULL"
+            )]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+def keyword_query(question):
+    """Turn a question into an FTS5 query matching any of its significant terms, or None"""
+    terms = []
+    for term in _QUERY_TERM_PATTERN.findall(question.lower()):
+        if term in _STOPWORDS or (len(term) < 2 and not term.isdigit()) or term in terms:
+            continue
+        terms.append(term)
+    if not terms:
+        return None
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def _filter_value(key, value):
+    """Normalize a filter value the same way incident metadata is normalized"""
+    if key == "date":
+        return normalize_date(value) or str(value)
+    if key in ("type", "severity"):
+        return str(value).lower()
+    return str(value)
+
+def _filter_sql(filter):
+    """Translate a LangChain metadata filter into (where clause, params), or (None, None)"""
+    clauses, params = [], []
+    for key, condition in filter.items():
+        if key == "$and":
+            for sub_filter in condition:
+                where, sub_params = _filter_sql(sub_filter)
+                if where is None:
+                    return None, None
+                clauses.append(f"({where})")
+                params.extend(sub_params)
+            continue
+
+        column = FILTER_COLUMNS.get(key)
+        if column is None:
+            return None, None
+        if isinstance(condition, list):
+            condition = {"$in": condition}
+        elif not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        for operator, value in condition.items():
+            if operator == "$in":
+                if not value:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{column} IN ({','.join('?' * len(value))})")
+                params.extend(_filter_value(key, item) for item in value)
+            elif operator in _COMPARISONS:
+                clauses.append(f"{column} {_COMPARISONS[operator]} ?")
+                params.append(_filter_value(key, value))
+            else:
+                return None, None
+
+    return " AND ".join(clauses) or "1", params
+
+def get_document_store(index_path=FAISS_INDEX_PATH):
+    """Return the docstore for an index directory, reopening it if the directory was reset"""
+    path = os.path.join(index_path, DOCSTORE_FILE)
+    with _docstore_lock:
+        docstore = _docstores.get(index_path)
+        if docstore is None or not os.path.exists(path):
+            os.makedirs(index_path, exist_ok=True)
+            docstore = SQLiteDocstore(path)
+            _docstores[index_path] = docstore
+        return docstore
@@ -0,0 +1,207 @@
+"""
+Embedding cache module for the Security Incident Analysis application.
+Persists incident embeddings on disk so unchanged incidents are never re-embedded,
+and keeps recent query embeddings in memory so repeated questions skip the API.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from src.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_CACHE_SIZE
+
+_cache_lock = threading.Lock()
+_shared_cache = None
+
+def normalize_text(text):
+    """Normalize incident text so formatting-only differences share a cache entry"""
+    return " ".join(str(text).split())
+
+def cache_key(text, model_name):
+    """Build the content-addressed cache key for a text and embedding model"""
+    payload = f"{model_name}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+class EmbeddingCache:
+    """
+    Size-bounded on-disk embedding cache backed by SQLite
+
+    Entries are evicted least-recently-used first once the cache grows past
+    max_entries. Hit and miss counters are kept for the lifetime of the process.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Return a dict of key -> vector for every key present in the cache"""
+        found = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            # Touch the entries we served so eviction keeps them
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs and evict old entries if over capacity"""
+        if not items:
+            return
+
+        with self._lock:
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least-recently-used entries beyond max_entries"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        """Return hit/miss counters and the current number of cached vectors"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document vectors from an EmbeddingCache
+
+    Query vectors are kept in a small in-memory LRU instead, since questions
+    are short-lived and often repeated within a session.
+    """
+
+    def __init__(self, embeddings, cache, model_name, query_cache_size=QUERY_EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self._queries = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.query_hits = 0
+        self.query_misses = 0
+
+    def embed_documents(self, texts):
+        """Embed documents, calling the underlying model only for cache misses"""
+        keys = [cache_key(text, self.model_name) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once, even if it repeats in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def _cached_query(self, key):
+        with self._query_lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+                return list(vector)
+            self.query_misses += 1
+        return None
+
+    def _remember_query(self, key, vector):
+        if self.query_cache_size > 0:
+            with self._query_lock:
+                self._queries[key] = tuple(vector)
+                while len(self._queries) > self.query_cache_size:
+                    self._queries.popitem(last=False)
+
+    def embed_query(self, text):
+        """Embed a search query, reusing the vector of a recent identical query"""
+        key = normalize_text(text)
+        vector = self._cached_query(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._remember_query(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        """Async embed_query, awaiting the underlying model's async client on a miss"""
+        key = normalize_text(text)
+        vector = self._cached_query(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._remember_query(key, vector)
+        return vector
+
+    def query_stats(self):
+        """Return query LRU hit/miss counters and size"""
+        with self._query_lock:
+            return {"hits": self.query_hits, "misses": self.query_misses, "entries": len(self._queries)}
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache, opening it on first use"""
+    global _shared_cache
+    with _cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
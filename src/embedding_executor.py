@@ -0,0 +1,152 @@
+"""
+Embedding executor module for the Security Incident Analysis application.
+Runs batched embedding requests concurrently with AIMD rate adaptation.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from src.config import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_RETRIES
+
+THROTTLING_ERROR_NAMES = ("ResourceExhausted", "TooManyRequests", "DeadlineExceeded",
+                          "ServiceUnavailable", "Timeout", "ReadTimeout", "ConnectTimeout")
+
+def is_throttling_error(error):
+    """Return True for rate-limit (429) and timeout errors worth retrying"""
+    if isinstance(error, TimeoutError):
+        return True
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    if type(error).__name__ in THROTTLING_ERROR_NAMES:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "rate limit" in message.lower()
+
+class AdaptiveConcurrencyLimit:
+    """
+    Concurrency limit with additive increase / multiplicative decrease
+
+    Every successful request raises the limit by 1/limit (about +1 per round
+    of requests); every throttled request halves it.
+    """
+
+    def __init__(self, initial, maximum):
+        self.limit = float(max(1, initial))
+        self.maximum = maximum
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Block until another request may be sent"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def record_throttle(self):
+        """Halve the limit after a throttled request sent outside acquire/release"""
+        with self._condition:
+            self.limit = max(1.0, self.limit / 2)
+
+    def release(self, throttled=False):
+        """Record the outcome of a request and adjust the limit"""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+class EmbeddingExecutor(Embeddings):
+    """
+    Embeddings wrapper that splits documents into batches and embeds them concurrently
+
+    Throttling and timeout errors are retried with exponential backoff and full
+    jitter, and shrink the number of requests in flight.
+    """
+
+    def __init__(self, embeddings, batch_size=EMBEDDING_BATCH_SIZE, max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+                 max_retries=EMBEDDING_MAX_RETRIES, base_backoff=0.5, max_backoff=30.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.limiter = AdaptiveConcurrencyLimit(max(1, max_concurrency // 2), max_concurrency)
+        self.counters = {"batches": 0, "retries": 0, "throttled": 0, "failures": 0}
+        self._counter_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embedding")
+
+    def _count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def _call_with_retry(self, fn, *args):
+        """Call fn under the concurrency limit, retrying throttled attempts"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                self.limiter.release(throttled)
+                if not throttled or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("throttled")
+                self._count("retries")
+                time.sleep(random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)))
+                continue
+            self.limiter.release()
+            return result
+
+    def _embed_batch(self, batch):
+        self._count("batches")
+        return self._call_with_retry(self.embeddings.embed_documents, batch)
+
+    def embed_documents(self, texts):
+        """Embed documents in concurrent batches, preserving input order"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(texts) if texts else []
+
+        vectors = []
+        for batch_vectors in self._pool.map(self._embed_batch, batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_query(self, text):
+        """Embed a search query with the same retry policy"""
+        return self._call_with_retry(self.embeddings.embed_query, text)
+
+    async def aembed_query(self, text):
+        """
+        Async embed_query with the same retry policy
+
+        Single query requests are not held to the concurrency limit, which
+        paces bulk document batches, but throttling still counts against it.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.embeddings.aembed_query(text)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                if not throttled or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self.limiter.record_throttle()
+                self._count("throttled")
+                self._count("retries")
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)))
+
+    def stats(self):
+        """Return request counters and the current concurrency limit"""
+        with self._counter_lock:
+            stats = dict(self.counters)
+        stats["concurrency_limit"] = int(self.limiter.limit)
+        return stats
@@ -0,0 +1,160 @@
+"""
+Fakes module for the Security Incident Analysis application.
+Deterministic local stand-ins for the Google embedding and chat models, used to
+exercise the ingest, retrieval and query code without network access or API keys.
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from typing import Any
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+class ThrottlingError(Exception):
+    """Raised by FakeEmbeddings to mimic an HTTP 429 from the embedding API"""
+
+    code = 429
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic embedding model with injectable latency and throttling
+
+    Args:
+        size: Vector dimension
+        latency: Seconds each request sleeps, plus up to jitter extra seconds
+        jitter: Random extra latency per request
+        throttle_rate: Probability that a request fails with ThrottlingError
+        max_concurrency: Requests beyond this many in flight fail with ThrottlingError
+        seed: Seed for the latency and throttling randomness
+    """
+
+    def __init__(self, size=768, latency=0.0, jitter=0.0, throttle_rate=0.0, max_concurrency=None, seed=0):
+        self.size = size
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.requests = 0
+        self.texts_embedded = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        """Map text to a stable unit vector"""
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size)
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def _start(self):
+        """Count a request and return (delay, throttled) for it"""
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            overloaded = self.max_concurrency is not None and self.in_flight > self.max_concurrency
+            throttled = overloaded or self._random.random() < self.throttle_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        return delay, throttled
+
+    def _respond(self, texts, throttled):
+        if throttled:
+            with self._lock:
+                self.throttled += 1
+            raise ThrottlingError("429 RESOURCE_EXHAUSTED: fake embedding quota exceeded")
+        with self._lock:
+            self.texts_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def _end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _request(self, texts):
+        delay, throttled = self._start()
+        try:
+            time.sleep(delay)
+            return self._respond(texts, throttled)
+        finally:
+            self._end()
+
+    async def _arequest(self, texts):
+        delay, throttled = self._start()
+        try:
+            await asyncio.sleep(delay)
+            return self._respond(texts, throttled)
+        finally:
+            self._end()
+
+    def embed_documents(self, texts):
+        return self._request(list(texts))
+
+    def embed_query(self, text):
+        return self._request([text])[0]
+
+    async def aembed_documents(self, texts):
+        return await self._arequest(list(texts))
+
+    async def aembed_query(self, text):
+        return (await self._arequest([text]))[0]
+
+
+class FakeLLM(LLM):
+    """
+    Text model that answers with a fixed response after an injectable delay
+
+    Args:
+        response: Text returned for every prompt
+        latency: Seconds before the first token
+        token_latency: Seconds between streamed tokens (also added per token
+            to non-streaming calls)
+    """
+
+    response: str = "Fake analysis: the retrieved incidents suggest a moderate severity."
+    latency: float = 0.0
+    token_latency: float = 0.0
+    calls: int = 0
+    prompt_chars: int = 0
+    _lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _tokens(self):
+        words = self.response.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _record(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self._record(prompt)
+        time.sleep(self.latency + self.token_latency * len(self._tokens()))
+        return self.response
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        self._record(prompt)
+        await asyncio.sleep(self.latency + self.token_latency * len(self._tokens()))
+        return self.response
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        self._record(prompt)
+        time.sleep(self.latency)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_latency)
+            yield GenerationChunk(text=token)
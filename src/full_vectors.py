@@ -0,0 +1,78 @@
+"""
+Full vector module for the Security Incident Analysis application.
+Keeps full-precision copies of vectors that live in a compressed index.
+
+Compressed indexes (scalar or product quantization) only hold approximate
+vectors in memory. The originals are kept on disk here, keyed by docstore id,
+so search can re-rank its top candidates exactly and compaction can retrain
+from exact vectors instead of degrading them with every rebuild.
+"""
+
+import os
+import sqlite3
+import threading
+import numpy as np
+from src.config import FAISS_INDEX_PATH
+
+FULL_VECTORS_FILE = "vectors.sqlite"
+
+_store_lock = threading.Lock()
+_stores = {}
+
+class FullVectorStore:
+    """SQLite table of float32 vectors keyed by docstore id"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (doc_id TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def put_many(self, doc_ids, vectors):
+        """Store one vector per doc id"""
+        vectors = np.asarray(vectors, dtype="float32")
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (doc_id, vector) VALUES (?, ?)",
+                [(doc_id, vector.tobytes()) for doc_id, vector in zip(doc_ids, vectors)]
+            )
+            self._conn.commit()
+
+    def get_many(self, doc_ids):
+        """Return a dict of doc id -> vector for the ids that are stored"""
+        found = {}
+        doc_ids = list(doc_ids)
+        with self._lock:
+            for start in range(0, len(doc_ids), 500):
+                batch = doc_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for doc_id, blob in self._conn.execute(
+                    f"SELECT doc_id, vector FROM vectors WHERE doc_id IN ({placeholders})", batch
+                ):
+                    found[doc_id] = np.frombuffer(blob, dtype="float32")
+        return found
+
+    def delete_many(self, doc_ids):
+        """Drop vectors for documents that were removed from the index"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM vectors WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+            self._conn.commit()
+
+    def reset(self):
+        """Drop every stored vector (the index is being rebuilt)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM vectors")
+            self._conn.commit()
+
+def get_full_vector_store(index_path=FAISS_INDEX_PATH):
+    """Return the full vector store for an index directory, reopening it if the directory was reset"""
+    path = os.path.join(index_path, FULL_VECTORS_FILE)
+    with _store_lock:
+        store = _stores.get(index_path)
+        if store is None or not os.path.exists(path):
+            os.makedirs(index_path, exist_ok=True)
+            store = FullVectorStore(path)
+            _stores[index_path] = store
+        return store
@@ -6,19 +6,21 @@ Handles creating, storing, and managing security incidents.
 import datetime
 import uuid
 import streamlit as st
-from langchain_community.vectorstores import FAISS
-from src.rag_system import initialize_rag_system, load_vector_db
-from src.conversation import setup_conversation_chain
+from src.rag_system import initialize_rag_system
+from src.registry import add_to_shared_vector_db
+from src.conversation import attach_index_to_session
 
-def save_incident_report(incident_data):
+def save_incident_report(incident_data, embeddings=None):
     """
     Save a new incident report to the database
     
     Args:
         incident_data: Dictionary containing incident information
+        embeddings: Embeddings to use; defaults to the session's RAG system
         
     Returns:
-        str: The generated incident ID
+        tuple: The generated incident ID (None if an identical incident already
+        exists), the updated shared store and its generation
     """
     # Generate a unique ID for the incident
     incident_id = f"INC-{datetime.datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8]}"
@@ -31,30 +33,34 @@ def save_incident_report(incident_data):
     Description: {incident_data['description']}
     Impact: {incident_data['impact']}
     Mitigation: {incident_data['mitigation']}
+    Severity: {incident_data['severity']}
     """
 
     # Initialize RAG components
-    embeddings, _ = initialize_rag_system()
+    if embeddings is None:
+        embeddings, _ = initialize_rag_system()
     
-    # Update the vector database with the new incident
-    from src.rag_system import update_vector_db
-    st.session_state.db = update_vector_db(embeddings, [incident_report])
+    # Append the new incident to the shared vector database
+    db, generation, report = add_to_shared_vector_db(embeddings, [incident_report])
+    if report["skipped"]:
+        incident_id = None
 
-    return incident_id
+    return incident_id, db, generation
 
 def add_new_incident(incident_data):
     """Add a new security incident to the database"""
     try:
         # Save the incident
-        incident_id = save_incident_report(incident_data)
+        incident_id, db, generation = save_incident_report(incident_data)
         
-        # Initialize RAG components
-        embeddings, llm = initialize_rag_system()
+        # Reuse the shared model clients
+        _, llm = initialize_rag_system()
         
         # Make sure to recreate the conversation chain with the updated database
-        st.session_state.conversation_chain = setup_conversation_chain(llm, st.session_state.db)
+        attach_index_to_session(llm, db, generation)
         
-        st.session_state.document_processed = True
+        if incident_id is None:
+            st.warning("An incident with identical details is already in the database; it was not added again.")
         return incident_id
     except Exception as e:
         st.error(f"Error adding incident: {str(e)}")
@@ -0,0 +1,168 @@
+"""
+Incident metadata module for the Security Incident Analysis application.
+Extracts structured fields from incident reports and search filters from questions.
+
+Incident reports are stored as "Field: value" lines. Incident ID, Type, Date and
+Severity are pulled out into document metadata so retrieval can pre-filter on
+them. Filters use the LangChain metadata filter syntax, e.g.
+{"type": {"$in": ["ransomware"]}, "date": {"$gte": "2023-07-01", "$lte": "2023-09-30"}}.
+"""
+
+import calendar
+import datetime
+import re
+
+# Report line -> metadata key
+METADATA_FIELDS = {
+    "Incident ID": "incident_id",
+    "Type": "type",
+    "Date": "date",
+    "Severity": "severity",
+}
+
+_FIELD_PATTERN = re.compile(
+    r"^\s*(" + "|".join(re.escape(field) for field in METADATA_FIELDS) + r"):\s*(.*?)\s*$",
+    re.MULTILINE
+)
+# Tried in order: an ambiguous slashed date such as 3/4/2025 is read month first, as the CSV exports write it
+_DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%d/%m/%Y", "%d-%m-%Y", "%B %d, %Y", "%b %d, %Y", "%d %B %Y")
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+_QUARTER_PATTERN = re.compile(r"\bq([1-4])\s*(?:of\s*)?((?:19|20)\d{2})\b", re.IGNORECASE)
+_MONTH_YEAR_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\.?\s+((?:19|20)\d{2})\b", re.IGNORECASE
+)
+_ISO_MONTH_PATTERN = re.compile(r"\b((?:19|20)\d{2})-(\d{2})\b(?!-\d)")
+_YEAR_PATTERN = re.compile(r"\b((?:19|20)\d{2})\b")
+_YEAR_LIST = r"(?:19|20)\d{2}(?:\s*(?:,|-|and|or|to|through)\s*(?:19|20)\d{2})*"
+# A bare number is only a year when the wording points to a date: "in 2023",
+# "between 2021 and 2023", "2023 incidents"; not "2000 accounts leaked"
+_YEAR_CONTEXT_PATTERN = re.compile(
+    r"\b(?:in|during|throughout|between|from)\s+(" + _YEAR_LIST + r")\b"
+    r"|\b(" + _YEAR_LIST + r")(?=\s+(?:incidents?|attacks?|breaches?|events?|cases?|reports?)\b)",
+    re.IGNORECASE
+)
+
+# Types that say nothing about the incident, so never narrow a search
+_GENERIC_TYPES = frozenset({"other", "unknown", "misc", "miscellaneous", "general", "none", "n/a"})
+# Words dropped from a type name to group its variants ("phishing attack" with "phishing")
+_GENERIC_TYPE_WORDS = frozenset({"attack", "attacks", "incident", "incidents", "event", "events", "activity", "campaign"})
+
+def normalize_date(value):
+    """
+    Return a date string as YYYY-MM-DD, or None if it cannot be parsed
+
+    Slashed dates are read as month/day/year (3/4/2025 is March 4th), falling
+    back to day/month/year only when the first number cannot be a month.
+    """
+    value = str(value).strip()
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def incident_metadata(text):
+    """
+    Extract structured metadata from a formatted incident report
+
+    Type and severity are lower-cased so filters match regardless of how the
+    source spelled them; dates are normalized to YYYY-MM-DD. Missing or
+    "Unknown" fields are left out.
+    """
+    metadata = {}
+    for field, value in _FIELD_PATTERN.findall(text):
+        key = METADATA_FIELDS[field]
+        if key in metadata or not value or value.lower() == "unknown":
+            continue
+        if key == "date":
+            value = normalize_date(value)
+        elif key in ("type", "severity"):
+            value = value.lower()
+        if value:
+            metadata[key] = value
+    return metadata
+
+def _month_range(year, first_month, last_month):
+    last_day = calendar.monthrange(year, last_month)[1]
+    return datetime.date(year, first_month, 1).isoformat(), datetime.date(year, last_month, last_day).isoformat()
+
+def infer_date_range(question):
+    """Return the (start, end) date range a question refers to, or None"""
+    ranges = []
+    text = question
+    for quarter, year in _QUARTER_PATTERN.findall(text):
+        first_month = (int(quarter) - 1) * 3 + 1
+        ranges.append(_month_range(int(year), first_month, first_month + 2))
+    text = _QUARTER_PATTERN.sub(" ", text)
+
+    for month, year in _MONTH_YEAR_PATTERN.findall(text):
+        number = _MONTHS[month.lower()]
+        ranges.append(_month_range(int(year), number, number))
+    text = _MONTH_YEAR_PATTERN.sub(" ", text)
+
+    for year, month in _ISO_MONTH_PATTERN.findall(text):
+        if 1 <= int(month) <= 12:
+            ranges.append(_month_range(int(year), int(month), int(month)))
+    text = _ISO_MONTH_PATTERN.sub(" ", text)
+
+    # Full dates and incident IDs such as INC-2023-001 are not date ranges
+    text = re.sub(r"\b\d{4}-\d{2}-\d{2}\b|\bINC-\S+", " ", text, flags=re.IGNORECASE)
+    for years in _YEAR_CONTEXT_PATTERN.findall(text):
+        for year in _YEAR_PATTERN.findall(" ".join(years)):
+            ranges.append(_month_range(int(year), 1, 12))
+
+    if not ranges:
+        return None
+    return min(start for start, _ in ranges), max(end for _, end in ranges)
+
+def type_key(incident_type):
+    """Return the distinctive part of a type name: "DDoS Attack" -> "ddos", "Data Breach" -> "data breach" """
+    words = incident_type.lower().split()
+    return " ".join(word for word in words if word not in _GENERIC_TYPE_WORDS)
+
+def _mentions(phrase, lowered):
+    """Return True if a lower-cased question mentions a phrase as whole words, allowing a plural"""
+    return re.search(r"\b" + r"\s+".join(map(re.escape, phrase.split())) + r"(?:s|es)?\b", lowered) is not None
+
+def question_types(question, known_types):
+    """
+    Return the known incident types a question names
+
+    Types are matched as whole words or phrases, and variants sharing a
+    distinctive name are grouped, so "phishing" finds both "phishing" and
+    "phishing attack" incidents. Generic types such as "other" are ignored.
+    """
+    lowered = question.lower()
+    groups = {
+        incident_type: type_key(incident_type) or incident_type
+        for incident_type in known_types if incident_type and incident_type not in _GENERIC_TYPES
+    }
+    named = {group for incident_type, group in groups.items()
+             if _mentions(incident_type, lowered) or _mentions(group, lowered)}
+    return sorted(incident_type for incident_type, group in groups.items() if group in named)
+
+def filter_from_question(question, known_types):
+    """
+    Build a metadata filter from the incident types and dates a question mentions
+
+    Args:
+        question: User question
+        known_types: Incident types present in the index (lower-case)
+
+    Returns:
+        dict: LangChain-style metadata filter, or None if nothing was recognized
+    """
+    conditions = {}
+
+    types = question_types(question, known_types)
+    if types:
+        conditions["type"] = {"$in": types}
+
+    date_range = infer_date_range(question)
+    if date_range:
+        conditions["date"] = {"$gte": date_range[0], "$lte": date_range[1]}
+
+    return conditions or None
@@ -0,0 +1,170 @@
+"""
+Index evaluation module for the Security Incident Analysis application.
+Reports recall@k, query latency and memory of ANN index settings against exact search.
+
+Usage:
+    python -m src.index_eval --factory Flat --factory IVF256,Flat --factory HNSW32
+    python -m src.index_eval --synthetic 200000 --factory IVF1024,Flat --nprobe 4 16 64
+    python -m src.index_eval --factory SQfp16 --factory SQ8 --factory IVF256,PQ192 --rerank 4
+"""
+
+import argparse
+import json
+import os
+import time
+import faiss
+import numpy as np
+from src.ann_index import create_faiss_index, index_vectors, is_compressed
+from src.config import FAISS_INDEX_PATH
+from src.segment_store import read_manifest, segment_names
+
+def load_index_vectors(index_path=FAISS_INDEX_PATH):
+    """Read every stored vector from the index segments without loading the docstore"""
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        raise FileNotFoundError(f"No index found in {index_path}")
+
+    parts = []
+    for name in segment_names(manifest):
+        index = faiss.read_index(os.path.join(index_path, name, "index.faiss"))
+        parts.append(index_vectors(index))
+    return np.vstack(parts).astype("float32")
+
+def make_queries(vectors, num_queries, seed=0):
+    """Sample stored vectors and perturb them slightly to act as unseen queries"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    noise = rng.normal(0, vectors.std() * 0.1, size=(len(rows), vectors.shape[1]))
+    return (vectors[rows] + noise).astype("float32")
+
+def recall_at_k(found, expected, k):
+    """Mean fraction of the exact top-k neighbours returned by the approximate search"""
+    hits = sum(len(set(row_found[:k]) & set(row_expected[:k])) for row_found, row_expected in zip(found, expected))
+    return hits / (len(expected) * k)
+
+def search_with_rerank(index, vectors, queries, k, rerank_factor):
+    """Search k * rerank_factor candidates and re-rank them with the exact vectors"""
+    _, candidates = index.search(queries, k * rerank_factor)
+    found = np.empty((len(queries), k), dtype="int64")
+    for row, (query, ids) in enumerate(zip(queries, candidates)):
+        ids = ids[ids >= 0]
+        distances = np.sum((vectors[ids] - query) ** 2, axis=1)
+        ranked = ids[np.argsort(distances)[:k]]
+        found[row] = np.pad(ranked, (0, k - len(ranked)), constant_values=-1)
+    return found
+
+def _search_settings(index, nprobe_values, ef_search_values):
+    """Yield (label, apply) pairs for each query-time setting worth measuring"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        for nprobe in nprobe_values:
+            yield f"nprobe={nprobe}", lambda value=nprobe: setattr(ivf, "nprobe", value)
+    elif hasattr(index, "hnsw"):
+        for ef_search in ef_search_values:
+            yield f"efSearch={ef_search}", lambda value=ef_search: setattr(index.hnsw, "efSearch", value)
+    else:
+        yield "-", lambda: None
+
+def evaluate_factories(vectors, factories, k=10, num_queries=200, nprobe_values=(1, 4, 16, 64),
+                       ef_search_values=(16, 64, 256), rerank_factor=0):
+    """
+    Measure recall@k, latency and size of each index factory against exact search
+
+    With rerank_factor > 1, compressed indexes are also measured with exact
+    re-ranking of their top k * rerank_factor candidates.
+
+    Returns:
+        list: One result dict per factory and query-time setting
+    """
+    queries = make_queries(vectors, num_queries)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+    flat_bytes = vectors.nbytes
+
+    results = []
+    for factory in factories:
+        start = time.perf_counter()
+        index = create_faiss_index(vectors, factory)
+        build_seconds = time.perf_counter() - start
+        index_bytes = len(faiss.serialize_index(index))
+
+        rerank_options = [0]
+        if rerank_factor > 1 and is_compressed(index):
+            rerank_options.append(rerank_factor)
+
+        for setting, apply_setting in _search_settings(index, nprobe_values, ef_search_values):
+            apply_setting()
+            for rerank in rerank_options:
+                start = time.perf_counter()
+                if rerank:
+                    found = search_with_rerank(index, vectors, queries, k, rerank)
+                else:
+                    _, found = index.search(queries, k)
+                elapsed = time.perf_counter() - start
+
+                results.append({
+                    "factory": factory,
+                    "setting": setting,
+                    "rerank": rerank,
+                    "k": k,
+                    "recall_at_k": round(recall_at_k(found, expected, k), 4),
+                    "query_ms": round(elapsed * 1000 / len(queries), 4),
+                    "build_s": round(build_seconds, 3),
+                    "index_mb": round(index_bytes / 1e6, 2),
+                    "compression": round(flat_bytes / index_bytes, 2),
+                })
+    return results
+
+def format_results(results):
+    """Render evaluation results as an aligned text table"""
+    header = (f"{'factory':<22} {'setting':<14} {'rerank':>6} {'recall@k':>9} {'ms/query':>9} "
+              f"{'build s':>8} {'MB':>8} {'x smaller':>9}")
+    lines = [header, "-" * len(header)]
+    for r in results:
+        rerank = f"x{r['rerank']}" if r["rerank"] else "-"
+        lines.append(
+            f"{r['factory']:<22} {r['setting']:<14} {rerank:>6} {r['recall_at_k']:>9.4f} {r['query_ms']:>9.4f} "
+            f"{r['build_s']:>8.3f} {r['index_mb']:>8.2f} {r['compression']:>9.2f}"
+        )
+    return "\n".join(lines)
+
+def build_parser():
+    """Build the command-line parser"""
+    parser = argparse.ArgumentParser(description="Compare ANN index settings against exact search")
+    parser.add_argument("--index-path", default=FAISS_INDEX_PATH, help="Index directory to read vectors from")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Evaluate on this many random vectors instead of the stored index")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic vectors")
+    parser.add_argument("--factory", action="append", help="FAISS index factory string (repeatable)")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64], help="IVF nprobe values")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256], help="HNSW efSearch values")
+    parser.add_argument("--rerank", type=int, default=0,
+                        help="Also measure compressed indexes with exact re-ranking of k * RERANK candidates")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    return parser
+
+def main(argv=None):
+    """Command-line entry point"""
+    args = build_parser().parse_args(argv)
+
+    if args.synthetic:
+        vectors = np.random.default_rng(0).normal(size=(args.synthetic, args.dim)).astype("float32")
+    else:
+        vectors = load_index_vectors(args.index_path)
+
+    results = evaluate_factories(
+        vectors,
+        args.factory or ["Flat", "HNSW32"],
+        k=min(args.k, len(vectors)),
+        num_queries=args.queries,
+        nprobe_values=args.nprobe,
+        ef_search_values=args.ef_search,
+        rerank_factor=args.rerank
+    )
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Ingest module for the Security Incident Analysis application.
+Streams large CSV/JSON/NDJSON incident exports into the index in bounded batches.
+"""
+
+import codecs
+import itertools
+import json
+import time
+from src.ann_index import build_store, merge_stores
+from src.config import INGEST_BATCH_SIZE, INGEST_SEGMENT_ROWS
+from src.dedup import get_incident_ledger
+from src.metrics import span
+from src.segment_store import read_manifest, write_base_segment, append_delta_segment, maybe_schedule_compaction
+
+READ_CHUNK_SIZE = 1 << 16
+
+def _iter_text_chunks(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yield decoded text chunks from a binary or text stream"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def iter_ndjson(chunks):
+    """Yield one record per non-empty line of newline-delimited JSON"""
+    pending = []
+    for chunk in chunks:
+        if "\n" not in chunk:
+            pending.append(chunk)
+            continue
+        lines = chunk.split("\n")
+        lines[0] = "".join(pending) + lines[0]
+        pending = [lines.pop()]
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    tail = "".join(pending)
+    if tail.strip():
+        yield json.loads(tail)
+
+def iter_json_array(chunks):
+    """
+    Yield the elements of a top-level JSON array without loading the whole document
+
+    Only the current element and one read chunk are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    in_array = False
+
+    while True:
+        # Skip whitespace and separators, pulling more text when the buffer runs dry
+        while pos < len(buffer) and buffer[pos] in " \t\r\n" + ("," if in_array else ""):
+            pos += 1
+        if pos == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                if in_array:
+                    raise ValueError("Unexpected end of JSON array")
+                return
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        if not in_array:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array of incidents")
+            in_array = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element is split across chunks; at least double the pending
+            # text before retrying so large elements are decoded in linear time
+            pending = [buffer[pos:]]
+            wanted = max(len(pending[0]), 1)
+            while wanted > 0:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append(chunk)
+                wanted -= len(chunk)
+            if len(pending) == 1:
+                raise
+            buffer, pos = "".join(pending), 0
+            continue
+
+        yield record
+        pos = end
+
+def iter_csv_records(stream, chunk_rows=INGEST_BATCH_SIZE):
+    """Yield CSV rows as dicts, reading the file in chunks"""
+    # pandas is only needed for CSV, so JSON ingest and app startup skip importing it
+    import pandas as pd
+    for chunk in pd.read_csv(stream, chunksize=chunk_rows):
+        for record in chunk.to_dict("records"):
+            yield record
+
+def iter_incident_records(uploaded_file):
+    """
+    Yield incident records from an uploaded CSV, JSON array or NDJSON file
+
+    The format is chosen from the file name; JSON files whose first character
+    is not "[" are read as NDJSON.
+    """
+    name = getattr(uploaded_file, "name", "").lower()
+    if name.endswith(".csv"):
+        yield from iter_csv_records(uploaded_file)
+        return
+
+    chunks = _iter_text_chunks(uploaded_file)
+    for first in chunks:
+        if first.strip():
+            break
+    else:
+        return
+
+    chunks = itertools.chain([first], chunks)
+    if first.lstrip().startswith("["):
+        yield from iter_json_array(chunks)
+    else:
+        yield from iter_ndjson(chunks)
+
+def _flush_segment(db, before_publish):
+    """Persist an in-progress segment as the base (first write) or as a delta"""
+    if read_manifest() is None:
+        write_base_segment(db, before_publish=before_publish)
+    else:
+        append_delta_segment(db, before_publish=before_publish)
+
+def index_incident_stream(records, embeddings, format_incident, batch_size=INGEST_BATCH_SIZE,
+                          segment_rows=INGEST_SEGMENT_ROWS, on_progress=None):
+    """
+    Format, embed and index a stream of incident records in bounded batches
+
+    Args:
+        records: Iterable of incident dicts
+        embeddings: Embeddings used to vectorize the incidents
+        format_incident: Function turning an incident dict into its text
+        batch_size: Number of incidents embedded per call
+        segment_rows: Number of incidents written per index segment
+        on_progress: Optional callback receiving the stats dict after each batch
+
+    Returns:
+        dict: rows read, new/changed/skipped counts, segments written,
+        elapsed seconds and rows_per_sec
+    """
+    stats = {"rows": 0, "new": 0, "changed": 0, "skipped": 0,
+             "segments": 0, "elapsed": 0.0, "rows_per_sec": 0.0}
+    start = time.perf_counter()
+    ledger = get_incident_ledger()
+    pending = {}
+    segment_db = None
+    segment_plans = []
+    segment_count = 0
+
+    def flush():
+        nonlocal segment_db, segment_plans, segment_count
+        if segment_db is not None:
+            plans = segment_plans
+
+            def commit_plans():
+                for plan in plans:
+                    ledger.commit(plan)
+
+            _flush_segment(segment_db, commit_plans)
+            stats["segments"] += 1
+        # Committed rows are now found through the ledger itself
+        pending.clear()
+        segment_db, segment_plans, segment_count = None, [], 0
+
+    iterator = iter(records)
+    while True:
+        with span("parse"):
+            batch = [format_incident(record) for record in itertools.islice(iterator, batch_size)]
+        if not batch:
+            break
+
+        # Skip incidents already indexed (or seen earlier in this stream)
+        with span("dedup"):
+            plan = ledger.plan(batch, pending)
+        for key, count in plan["report"].items():
+            stats[key] += count
+
+        if plan["texts"]:
+            batch_db = build_store(embeddings, plan["texts"], plan["doc_ids"], "Flat")
+            if segment_db is None:
+                segment_db = batch_db
+            else:
+                merge_stores(segment_db, batch_db)
+            segment_plans.append(plan)
+            segment_count += len(plan["texts"])
+
+        # Keep the in-memory segment bounded
+        if segment_count >= segment_rows:
+            flush()
+
+        stats["rows"] += len(batch)
+        stats["elapsed"] = time.perf_counter() - start
+        stats["rows_per_sec"] = stats["rows"] / stats["elapsed"] if stats["elapsed"] else 0.0
+        if on_progress:
+            on_progress(stats)
+
+    flush()
+    if stats["segments"]:
+        maybe_schedule_compaction(embeddings)
+
+    return stats
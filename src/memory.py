@@ -0,0 +1,110 @@
+"""
+Memory module for the Security Incident Analysis application.
+Conversation memory that keeps the prompt-side chat history within a token budget.
+
+The memory holds the full transcript, which the chat renders. What it hands to
+the chain is bounded: the most recent turns verbatim, then one-line extractive
+summaries of older turns, newest first, until MEMORY_TOKEN_BUDGET is spent.
+Turns that no longer fit are left out of the prompt but stay in the transcript.
+"""
+
+from typing import Optional
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+from src.config import MEMORY_TOKEN_BUDGET, MEMORY_SUMMARY_TOKENS
+from src.tokens import estimate_tokens, first_sentences, truncate_tokens
+
+SUMMARY_HEADER = "Summary of earlier questions:"
+
+def summarize_turn(question, answer, max_tokens=MEMORY_SUMMARY_TOKENS):
+    """Compact a question/answer turn into a single line of about max_tokens tokens"""
+    question = truncate_tokens(question, max(max_tokens // 3, 1))
+    answer = first_sentences(answer, max(max_tokens - estimate_tokens(question) - 4, 1))
+    return f"- Q: {question} A: {answer}"
+
+class TokenBudgetMemory(BaseChatMemory):
+    """
+    Chat memory whose prompt view is bounded by a token budget
+    
+    Args:
+        max_token_limit: Token budget for the chat history sent to the chain
+        summary_tokens: Size of each older turn's summary line
+        verbatim_share: Share of the budget recent verbatim turns may use
+    """
+    
+    memory_key: str = "chat_history"
+    output_key: Optional[str] = "answer"
+    max_token_limit: int = MEMORY_TOKEN_BUDGET
+    summary_tokens: int = MEMORY_SUMMARY_TOKENS
+    verbatim_share: float = 0.75
+    
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+    
+    def turns(self):
+        """Return the full transcript as (question, answer) pairs"""
+        turns = []
+        question = None
+        for message in self.chat_memory.messages:
+            if isinstance(message, HumanMessage):
+                question = message.content
+            elif isinstance(message, AIMessage) and question is not None:
+                turns.append((question, message.content))
+                question = None
+        return turns
+    
+    def budgeted_messages(self):
+        """Return the recent turns verbatim and older turns summarized, within the budget"""
+        turns = self.turns()
+        verbatim = []
+        used = 0
+        verbatim_budget = int(self.max_token_limit * self.verbatim_share)
+        
+        # Newest turns verbatim while they fit; the latest one is kept even if shortened
+        index = len(turns)
+        while index > 0:
+            question, answer = turns[index - 1]
+            cost = estimate_tokens(question) + estimate_tokens(answer)
+            if used + cost > verbatim_budget:
+                if verbatim:
+                    break
+                answer = truncate_tokens(answer, max(verbatim_budget - estimate_tokens(question), 1))
+                cost = estimate_tokens(question) + estimate_tokens(answer)
+            verbatim.insert(0, (question, answer))
+            used += cost
+            index -= 1
+        
+        # Then one line per older turn, newest first, until the whole budget is spent
+        summaries = []
+        used += estimate_tokens(SUMMARY_HEADER)
+        for question, answer in reversed(turns[:index]):
+            line = summarize_turn(question, answer, self.summary_tokens)
+            cost = estimate_tokens(line)
+            if used + cost > self.max_token_limit:
+                break
+            summaries.insert(0, line)
+            used += cost
+        
+        messages = []
+        if summaries:
+            messages.append(SystemMessage(content="\n".join([SUMMARY_HEADER] + summaries)))
+        for question, answer in verbatim:
+            messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+        return messages
+    
+    def load_memory_variables(self, inputs):
+        messages = self.budgeted_messages()
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+    
+    def stats(self):
+        """Return the transcript size and the token count of the budgeted history"""
+        turns = self.turns()
+        return {
+            "turns": len(turns),
+            "transcript_tokens": sum(estimate_tokens(q) + estimate_tokens(a) for q, a in turns),
+            "history_tokens": sum(estimate_tokens(m.content) for m in self.budgeted_messages()),
+            "budget": self.max_token_limit,
+        }
@@ -0,0 +1,250 @@
+"""
+Metrics module for the Security Incident Analysis application.
+Times pipeline stages into latency histograms and exports them as Prometheus text and JSON log lines.
+
+Code times a stage with a span("stage") block. A trace("request") block
+groups the spans of one request (a query, an ingest, a page render); when it
+ends, the request's per-stage breakdown is logged as one JSON line to the
+"incident_analysis.requests" logger, which also writes to METRICS_LOG_PATH.
+Traces may nest: an inner trace logs its own line and counts as a stage of
+the outer one. Stages nest too (retrieval contains embed_query), so they need
+not add up to a request's total. Histograms are process-wide, so the sidebar
+and /metrics show every session's requests.
+"""
+
+import contextvars
+import datetime
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from src.config import METRICS_LOG_PATH, METRICS_LOG_MAX_BYTES
+
+# Histogram bucket upper bounds in seconds, from 1 ms to one minute
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# kind -> (Prometheus metric name, help text); the kind is also the label name
+METRIC_FAMILIES = {
+    "stage": ("incident_analysis_stage_seconds", "Time spent in each pipeline stage"),
+    "request": ("incident_analysis_request_seconds", "End-to-end time of each traced request"),
+}
+
+_registry_lock = threading.Lock()
+_shared_registry = None
+_log_configured = False
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+request_log = logging.getLogger("incident_analysis.requests")
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets, in the Prometheus model"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf overflow bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        position = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                position = i
+                break
+        self.counts[position] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimate a quantile (0-1) by interpolating within its bucket, like histogram_quantile()"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative, lower = 0, 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= rank:
+                # Never report more than was actually observed
+                return min(lower + (bound - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+            lower = bound
+        # Beyond the last finite bucket the largest observation is the best estimate
+        return self.max
+
+    def copy(self):
+        clone = Histogram(self.buckets)
+        clone.counts = list(self.counts)
+        clone.count, clone.sum, clone.max = self.count, self.sum, self.max
+        return clone
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class MetricsRegistry:
+    """Process-wide latency histograms keyed by (kind, label), e.g. ("stage", "embed_query")"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, label, seconds):
+        with self._lock:
+            histogram = self._histograms.get((kind, label))
+            if histogram is None:
+                histogram = self._histograms[(kind, label)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self, kind):
+        """Return {label: Histogram} copies for one kind, safe to read without the lock"""
+        with self._lock:
+            return {label: histogram.copy() for (k, label), histogram in self._histograms.items() if k == kind}
+
+    def summary(self, kind="stage"):
+        """
+        Summarize the histograms of one kind for display
+
+        Returns:
+            list: dicts with the label, count, mean/p50/p95/max in milliseconds
+            and total seconds, most total time first
+        """
+        rows = []
+        for label, histogram in self.snapshot(kind).items():
+            rows.append({
+                kind: label,
+                "count": histogram.count,
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 2),
+                "p50_ms": round(histogram.quantile(0.5) * 1000, 2),
+                "p95_ms": round(histogram.quantile(0.95) * 1000, 2),
+                "max_ms": round(histogram.max * 1000, 2),
+                "total_s": round(histogram.sum, 3),
+            })
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def render_prometheus(self):
+        """Return every histogram in the Prometheus text exposition format"""
+        lines = []
+        for kind, (metric, help_text) in METRIC_FAMILIES.items():
+            series = self.snapshot(kind)
+            if not series:
+                continue
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for label in sorted(series):
+                histogram = series[label]
+                labels = f'{kind}="{_label(label)}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+def get_metrics_registry():
+    """Return the process-wide metrics registry"""
+    global _shared_registry
+    with _registry_lock:
+        if _shared_registry is None:
+            _shared_registry = MetricsRegistry()
+        return _shared_registry
+
+def _get_request_log():
+    """Return the request logger, attaching the METRICS_LOG_PATH file handler on first use"""
+    global _log_configured
+    with _registry_lock:
+        if not _log_configured:
+            _log_configured = True
+            request_log.setLevel(logging.INFO)
+            if METRICS_LOG_PATH:
+                handler = RotatingFileHandler(METRICS_LOG_PATH, maxBytes=METRICS_LOG_MAX_BYTES, backupCount=3,
+                                              encoding="utf-8", delay=True)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                request_log.addHandler(handler)
+    return request_log
+
+class RequestTrace:
+    """Stage timings collected for one request; extra fields are added to its log line"""
+
+    def __init__(self, request, fields):
+        self.request = request
+        self.fields = dict(fields)
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        # Spans of one request can finish on several threads at once
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def log_record(self, seconds, status):
+        with self._lock:
+            stages = {stage: round(total * 1000, 2) for stage, total in self.stages.items()}
+        return dict({
+            "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "request": self.request,
+            "status": status,
+            "total_ms": round(seconds * 1000, 2),
+            "stages_ms": stages,
+        }, **self.fields)
+
+def observe(stage, seconds):
+    """Record a stage duration measured elsewhere, in the histograms and the current trace"""
+    get_metrics_registry().observe("stage", stage, seconds)
+    current = _current_trace.get()
+    if current is not None:
+        current.add(stage, seconds)
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as one stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+@contextmanager
+def trace(request, **fields):
+    """
+    Time the enclosed block as one request and log its stage breakdown when it ends
+
+    Args:
+        request: Request type, e.g. "query" or "ingest_upload"
+        **fields: Extra values for the log line; more can be set on the
+            yielded trace's fields dict
+
+    Yields:
+        RequestTrace: the trace collecting this request's spans
+    """
+    parent = _current_trace.get()
+    current = RequestTrace(request, fields)
+    token = _current_trace.set(current)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A generator closed from another context (e.g. by the garbage collector);
+            # the context that set the trace is gone, so there is nothing to restore
+            pass
+        elapsed = time.perf_counter() - start
+        get_metrics_registry().observe("request", request, elapsed)
+        if parent is not None:
+            parent.add(request, elapsed)
+        _get_request_log().info(json.dumps(current.log_record(elapsed, status), default=str))
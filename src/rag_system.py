@@ -4,21 +4,37 @@ Handles embeddings, vector database, and language model initialization.
 """
 
 import os
+import threading
 import streamlit as st
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
 from langchain.globals import set_llm_cache, get_llm_cache
-from src.config import check_api_key
+from src.config import check_api_key, get_api_key, EMBEDDING_MODEL, FAISS_INDEX_PATH, CONDENSE_MODEL
+from src.embedding_cache import CachedEmbeddings, get_embedding_cache
+from src.embedding_executor import EmbeddingExecutor
+from src.ann_index import build_store, merge_stores
+from src.answer_cache import get_answer_cache
+from src.dedup import get_incident_ledger, apply_tombstones
+from src.full_vectors import get_full_vector_store
+from src.metrics import span
+from src.segment_store import (
+    read_manifest, write_base_segment, append_delta_segment, load_segments, maybe_schedule_compaction
+)
+from src.shards import ShardedIncidentStore
 
-def initialize_rag_system():
-    """Initialize the RAG system with Google Generative AI embeddings and ChatGoogleGenerativeAI"""
-    
-    # Check if API key is available
-    if not check_api_key():
-        st.stop()
+# Model clients shared by every session in this process, keyed by API key
+_client_lock = threading.Lock()
+_model_clients = {}
+
+def create_model_clients():
+    """Create Google Generative AI embeddings and ChatGoogleGenerativeAI clients"""
     
-    # Create embeddings
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    # Create embeddings, served from the on-disk cache where possible;
+    # cache misses are embedded in concurrent, rate-adaptive batches
+    embeddings = CachedEmbeddings(
+        EmbeddingExecutor(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)),
+        get_embedding_cache(),
+        EMBEDDING_MODEL
+    )
     
     # Initialize the language model
     llm = ChatGoogleGenerativeAI(
@@ -32,41 +48,138 @@ def initialize_rag_system():
     
     return embeddings, llm
 
-def create_vector_db(embeddings, security_incidents):
-    """Create a vector database from security incidents data using FAISS"""
+def initialize_rag_system():
+    """Initialize the RAG system, reusing the process-wide model clients"""
+    
+    # Check if API key is available
+    if not check_api_key():
+        st.stop()
+    
+    return get_model_clients()
+
+def get_model_clients():
+    """Return the process-wide (embeddings, llm) pair for the current API key, without Streamlit"""
+    # Build the clients once per API key and hand the same pair to every caller
+    api_key = get_api_key()
+    with _client_lock:
+        if api_key not in _model_clients:
+            _model_clients[api_key] = create_model_clients()
+        return _model_clients[api_key]
+
+def get_condense_llm():
+    """
+    Return the process-wide client for CONDENSE_MODEL, or None to condense
+    follow-up questions with the answer model
+    """
+    if not CONDENSE_MODEL:
+        return None
+    
+    key = (get_api_key(), CONDENSE_MODEL)
+    with _client_lock:
+        if key not in _model_clients:
+            _model_clients[key] = ChatGoogleGenerativeAI(
+                model=CONDENSE_MODEL,
+                temperature=0,
+                max_output_tokens=256
+            )
+        return _model_clients[key]
+
+def create_vector_db(embeddings, security_incidents, index_factory=None):
+    """Create a vector database from security incidents data using FAISS (see build_vector_db)"""
+    return build_vector_db(embeddings, security_incidents, index_factory)[0]
+
+def build_vector_db(embeddings, security_incidents, index_factory=None):
+    """
+    Create a fresh vector database, dropping duplicate incidents
+    
+    Args:
+        embeddings: Embeddings used to vectorize the incidents
+        security_incidents: Formatted incident texts
+        index_factory: FAISS index factory string (e.g. "Flat", "IVF1024,Flat",
+            "HNSW32", "IVF1024,PQ64"); defaults to INDEX_FACTORY, where "auto"
+            picks by corpus size, with VECTOR_COMPRESSION applied. With date
+            sharding each shard gets its own index of this family; IVF list
+            counts are resized to the shard, and compaction later rebuilds
+            shards with INDEX_FACTORY
+    
+    Returns:
+        tuple: (db, report) where report counts new and skipped incidents
+    """
+    
+    # The index is being rebuilt, so only duplicates within this batch count
+    ledger = get_incident_ledger()
+    ledger.reset()
+    get_full_vector_store().reset()
+    get_answer_cache().clear()
+    with span("dedup"):
+        plan = ledger.plan(security_incidents)
     
     # Create a vector store using FAISS
-    db = FAISS.from_texts(security_incidents, embeddings)
+    db = build_store(embeddings, plan["texts"], plan["doc_ids"], index_factory)
     
-    # Save the FAISS index to a file
-    db.save_local("faiss_index")
+    # Save the FAISS index (including any trained centroids) as a fresh base segment
+    write_base_segment(db, before_publish=lambda: ledger.commit(plan))
     
-    return db
+    return db, plan["report"]
 
-def update_vector_db(embeddings, security_incidents):
-    """Update an existing FAISS vector database with new incidents"""
-    
-    # Try to load existing index
-    existing_db = load_vector_db(embeddings)
-    
-    if existing_db:
-        # Add new texts to the existing database
-        existing_db.add_texts(security_incidents)
-        # Save the updated index
-        existing_db.save_local("faiss_index")
-        return existing_db
-    else:
+def update_vector_db(embeddings, security_incidents, db=None):
+    """
+    Update an existing FAISS vector database with new incidents
+    
+    Only the new incidents are written to disk, as append-only delta
+    segments. If an in-memory db (as create_vector_db returns) is given it is
+    updated in place instead of being reloaded from disk.
+    """
+    
+    with span("update_vector_db"):
         # No existing index, create a new one
-        return create_vector_db(embeddings, security_incidents)
+        if read_manifest() is None:
+            return create_vector_db(embeddings, security_incidents)
+        
+        delta_db, _ = append_to_vector_db(embeddings, security_incidents)
+        
+        if db is not None and not isinstance(db, ShardedIncidentStore):
+            if delta_db is not None:
+                merge_stores(db, delta_db)
+                apply_tombstones(db)
+        else:
+            db = load_vector_db(embeddings)
+        
+        return db
+
+def append_to_vector_db(embeddings, security_incidents):
+    """
+    Embed new or changed incidents and persist them as a delta segment
+    
+    Incidents already indexed with the same content are skipped; incidents
+    whose ID is known but whose content changed replace the old version.
+    
+    Returns:
+        tuple: (delta_db, report); delta_db is None if nothing needed indexing
+    """
+    ledger = get_incident_ledger()
+    with span("dedup"):
+        plan = ledger.plan(security_incidents)
+    if not plan["texts"]:
+        return None, plan["report"]
+    
+    # Embed and persist only the new incidents; deltas are small, so exact search suits them
+    delta_db = build_store(embeddings, plan["texts"], plan["doc_ids"], "Flat")
+    append_delta_segment(delta_db, before_publish=lambda: ledger.commit(plan))
+    
+    # Fold deltas back into the base segment once there are too many
+    maybe_schedule_compaction(embeddings)
+    
+    return delta_db, plan["report"]
 
 def load_vector_db(embeddings):
-    """Load the FAISS vector database from file if it exists"""
+    """Load the FAISS vector database (base segment plus deltas) if it exists"""
     
     try:
         # Try to load existing FAISS index
-        if os.path.exists("faiss_index"):
-            db = FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-            return db
+        if os.path.exists(FAISS_INDEX_PATH):
+            with span("load_vector_db"):
+                return load_segments(embeddings)
     except Exception as e:
         st.warning(f"Could not load existing index: {str(e)}")
     
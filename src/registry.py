@@ -0,0 +1,118 @@
+"""
+Registry module for the Security Incident Analysis application.
+Owns the single FAISS index shared by every session in the process.
+
+Sessions receive the shared store as a read-only handle. Writes go to disk as
+new segments; the registry notices the new manifest generation and builds a
+fresh store for later callers instead of mutating one that may be searched
+concurrently. Loaded shards the write did not touch are carried over as they
+are, and shards that only gained deltas are extended rather than reloaded.
+"""
+
+import threading
+import faiss
+from src.config import FAISS_INDEX_PATH
+from src.ann_index import IncidentFAISS, merge_stores
+from src.dedup import get_incident_ledger, apply_tombstones
+from src.metrics import span
+from src.rag_system import build_vector_db, append_to_vector_db
+from src.segment_store import read_manifest, load_segment, load_snapshot
+
+_registry_lock = threading.Lock()
+_shared_db = None
+_loaded_manifest = None
+
+def current_generation(index_path=FAISS_INDEX_PATH):
+    """Return the on-disk index generation, or None if no index exists"""
+    manifest = read_manifest(index_path)
+    return manifest["generation"] if manifest else None
+
+def _appended_deltas(old_entry, new_entry):
+    """Return deltas added to a shard since old_entry, or None if the shard must be reloaded"""
+    if old_entry is None or new_entry is None or old_entry["base"] != new_entry["base"]:
+        return None
+    old_deltas = old_entry["deltas"]
+    if new_entry["deltas"][:len(old_deltas)] != old_deltas:
+        return None
+    return new_entry["deltas"][len(old_deltas):]
+
+def _clone_store(db):
+    """Copy a FAISS store so it can be extended without touching the original"""
+    # Documents live on disk and are shared; only the index and id map are copied
+    clone = IncidentFAISS(
+        embedding_function=db.embedding_function,
+        index=faiss.clone_index(db.index),
+        docstore=db.docstore,
+        index_to_docstore_id=dict(db.index_to_docstore_id),
+        normalize_L2=db._normalize_L2,
+        distance_strategy=db.distance_strategy
+    )
+    clone.index_path = db.index_path
+    return clone
+
+def _reusable_shards(embeddings, db, old_manifest, manifest, index_path):
+    """Return db's loaded shards that are still valid under manifest, brought up to date"""
+    deleted = get_incident_ledger(index_path).deleted_doc_ids()
+    reusable = {}
+    for key, shard_db in db.loaded_shards().items():
+        new_deltas = _appended_deltas(old_manifest["shards"].get(key), manifest["shards"].get(key))
+        if new_deltas is None:
+            # Rebuilt or compacted: loaded again when next needed
+            continue
+        if new_deltas or any(shard_db.contains(doc_id) for doc_id in deleted):
+            # Extend a copy rather than the store other sessions may be searching
+            shard_db = _clone_store(shard_db)
+            for delta_name in new_deltas:
+                merge_stores(shard_db, load_segment(embeddings, delta_name, index_path))
+            apply_tombstones(shard_db, index_path)
+        reusable[key] = shard_db
+    return reusable
+
+def get_shared_vector_db(embeddings, index_path=FAISS_INDEX_PATH):
+    """
+    Return the process-wide vector store, reloading only if the index changed on disk
+
+    Returns:
+        tuple: (db, generation); db is None if no index exists
+    """
+    global _shared_db, _loaded_manifest
+
+    with _registry_lock:
+        manifest = read_manifest(index_path)
+        if manifest is None:
+            _shared_db, _loaded_manifest = None, None
+            return None, None
+
+        if _loaded_manifest is not None and manifest["generation"] == _loaded_manifest["generation"]:
+            return _shared_db, _loaded_manifest["generation"]
+
+        if _shared_db is not None:
+            with span("index_refresh"):
+                loaded = _reusable_shards(embeddings, _shared_db, _loaded_manifest, manifest, index_path)
+                manifest, db = load_snapshot(embeddings, index_path, manifest, loaded)
+        else:
+            with span("index_load"):
+                manifest, db = load_snapshot(embeddings, index_path)
+
+        _shared_db, _loaded_manifest = db, manifest
+        return db, manifest["generation"]
+
+def rebuild_shared_vector_db(embeddings, security_incidents, index_path=FAISS_INDEX_PATH):
+    """Replace the index with the given incidents and return the new shared store"""
+    build_vector_db(embeddings, security_incidents)
+    return get_shared_vector_db(embeddings, index_path)
+
+def add_to_shared_vector_db(embeddings, security_incidents, index_path=FAISS_INDEX_PATH):
+    """
+    Append incidents to the index, skipping or replacing ones already indexed
+
+    Returns:
+        tuple: (db, generation, report) where report counts new, changed and
+        skipped incidents
+    """
+    if read_manifest(index_path) is None:
+        _, report = build_vector_db(embeddings, security_incidents)
+    else:
+        _, report = append_to_vector_db(embeddings, security_incidents)
+    db, generation = get_shared_vector_db(embeddings, index_path)
+    return db, generation, report
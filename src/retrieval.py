@@ -0,0 +1,210 @@
+"""
+Retrieval module for the Security Incident Analysis application.
+Combines vector search with BM25 keyword search using reciprocal rank fusion.
+
+Embedding similarity finds incidents that describe the same kind of attack;
+the keyword index finds exact tokens (CVE IDs, hostnames, incident IDs) that
+embeddings blur. Fusing both rankings lets a small k carry the right context.
+"""
+
+import asyncio
+import time
+from typing import Any, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.config import RETRIEVAL_K, RETRIEVAL_FETCH_K, HYBRID_SEARCH, RRF_K
+from src.metrics import observe
+
+# Timing key -> stage name in the latency histograms
+STAGE_NAMES = {
+    "filter_ms": "filter",
+    "embed_ms": "embed_query",
+    "vector_ms": "vector_search",
+    "keyword_ms": "keyword_search",
+    "fusion_ms": "fusion",
+}
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """
+    Fuse ranked id lists, scoring each id by the sum of 1 / (rrf_k + rank)
+
+    Returns:
+        list: (id, fused score) pairs, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def _record_timings(timings):
+    for key, stage in STAGE_NAMES.items():
+        if key in timings:
+            observe(stage, timings[key] / 1000)
+
+def _keyword_hits(db, question, fetch_k, filter):
+    """Return (id, bm25 score) pairs for live incidents matching the question's keywords"""
+    # Over-fetch: the keyword index also holds superseded incidents
+    rows = db.docstore.keyword_search(question, fetch_k * 2, filter)
+    return [(doc_id, score) for doc_id, score in rows if db.contains(doc_id)][:fetch_k]
+
+def _fuse(db, vector_hits, keyword_hits, filter, k):
+    """Fuse vector and keyword hits into the k best (Document, scores) pairs"""
+    docs_by_id = {doc.id: doc for doc, _ in vector_hits}
+    vector_scores = {doc.id: float(score) for doc, score in vector_hits}
+    keyword_scores = dict(keyword_hits)
+    fused = reciprocal_rank_fusion([
+        [doc.id for doc, _ in vector_hits],
+        [doc_id for doc_id, _ in keyword_hits],
+    ])
+
+    # Keyword hits were filtered in SQL unless the filter has no indexed column
+    filter_func = None
+    if filter is not None and keyword_hits and not db.docstore.can_filter(filter):
+        filter_func = db._create_filter_func(filter)
+
+    documents = []
+    for doc_id, score in fused:
+        doc = docs_by_id.get(doc_id) or db.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            continue
+        if doc_id not in docs_by_id and filter_func is not None and not filter_func(doc.metadata):
+            continue
+        documents.append((doc, {
+            "fused": round(score, 6),
+            "vector": vector_scores.get(doc_id),
+            "bm25": keyword_scores.get(doc_id),
+        }))
+        if len(documents) == k:
+            break
+    return documents
+
+def _uses_keywords(db, hybrid):
+    return hybrid and hasattr(db.docstore, "keyword_search")
+
+def hybrid_search(db, question, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, filter=None,
+                  infer_filter=True, hybrid=HYBRID_SEARCH):
+    """
+    Retrieve the k incidents most relevant to a question
+
+    Args:
+        db: IncidentFAISS store to search
+        question: User question
+        k: Number of incidents to return
+        fetch_k: Candidates taken from each search before fusion
+        filter: Optional metadata filter
+        infer_filter: Derive a filter from the incident types and dates the
+            question names when no filter is given
+        hybrid: Fuse BM25 keyword results with the vector results
+
+    Returns:
+        dict: the question; documents as (Document, scores) pairs, where
+        scores holds the fused, vector and bm25 scores; the filter used; and
+        per-stage timings in milliseconds
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    stage = time.perf_counter()
+    if filter is None and infer_filter:
+        filter = db.filter_for_question(question)
+    timings["filter_ms"] = _elapsed_ms(stage)
+
+    stage = time.perf_counter()
+    embedding = db._embed_query(question)
+    timings["embed_ms"] = _elapsed_ms(stage)
+
+    stage = time.perf_counter()
+    vector_hits = db.similarity_search_with_score_by_vector(embedding, k=fetch_k if hybrid else k, filter=filter)
+    timings["vector_ms"] = _elapsed_ms(stage)
+
+    keyword_hits = []
+    if _uses_keywords(db, hybrid):
+        stage = time.perf_counter()
+        keyword_hits = _keyword_hits(db, question, fetch_k, filter)
+        timings["keyword_ms"] = _elapsed_ms(stage)
+
+    stage = time.perf_counter()
+    documents = _fuse(db, vector_hits, keyword_hits, filter, k)
+    timings["fusion_ms"] = _elapsed_ms(stage)
+    timings["total_ms"] = _elapsed_ms(start)
+    _record_timings(timings)
+
+    return {"question": question, "documents": documents, "filter": filter, "timings": timings}
+
+async def ahybrid_search(db, question, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, filter=None,
+                         infer_filter=True, hybrid=HYBRID_SEARCH):
+    """
+    Async hybrid_search that overlaps independent stages
+
+    The query embedding is requested with the async client while the filter is
+    inferred and the keyword search runs; FAISS and SQLite work is offloaded to
+    threads so the event loop keeps serving other queries. Stage timings are
+    measured per stage, so they can add up to more than total_ms.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    async def embed():
+        stage = time.perf_counter()
+        embedding = await db.embedding_function.aembed_query(question)
+        timings["embed_ms"] = _elapsed_ms(stage)
+        return embedding
+
+    async def timed_thread(name, func, *args):
+        stage = time.perf_counter()
+        result = await asyncio.to_thread(func, *args)
+        timings[name] = _elapsed_ms(stage)
+        return result
+
+    embedding_task = asyncio.ensure_future(embed())
+    try:
+        if filter is None and infer_filter:
+            filter = await timed_thread("filter_ms", db.filter_for_question, question)
+
+        keyword_task = None
+        if _uses_keywords(db, hybrid):
+            keyword_task = asyncio.ensure_future(
+                timed_thread("keyword_ms", _keyword_hits, db, question, fetch_k, filter)
+            )
+
+        embedding = await embedding_task
+        vector_hits = await timed_thread(
+            "vector_ms", db.similarity_search_with_score_by_vector, embedding, fetch_k if hybrid else k, filter
+        )
+        keyword_hits = await keyword_task if keyword_task is not None else []
+    finally:
+        embedding_task.cancel()
+
+    documents = await timed_thread("fusion_ms", _fuse, db, vector_hits, keyword_hits, filter, k)
+    timings["total_ms"] = _elapsed_ms(start)
+    _record_timings(timings)
+
+    return {"question": question, "documents": documents, "filter": filter, "timings": timings}
+
+class HybridRetriever(BaseRetriever):
+    """LangChain retriever running hybrid_search and keeping the last result for display"""
+
+    vectorstore: Any
+    k: int = RETRIEVAL_K
+    fetch_k: int = RETRIEVAL_FETCH_K
+    hybrid: bool = HYBRID_SEARCH
+    infer_filter: bool = True
+    last_result: Optional[dict] = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        self.last_result = hybrid_search(
+            self.vectorstore, query, k=self.k, fetch_k=self.fetch_k,
+            infer_filter=self.infer_filter, hybrid=self.hybrid
+        )
+        return [doc for doc, _ in self.last_result["documents"]]
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        self.last_result = await ahybrid_search(
+            self.vectorstore, query, k=self.k, fetch_k=self.fetch_k,
+            infer_filter=self.infer_filter, hybrid=self.hybrid
+        )
+        return [doc for doc, _ in self.last_result["documents"]]
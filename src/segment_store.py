@@ -0,0 +1,352 @@
+"""
+Segment store module for the Security Incident Analysis application.
+Keeps each date shard of the FAISS index as one base segment plus small append-only delta segments.
+
+On-disk layout of the index directory:
+
+    manifest.json        generation counter and the live segments of each shard
+    documents.sqlite     incident texts and metadata of every segment
+    2024-05/base-000003/ a shard's compacted base segment (index.faiss + ids.json)
+    2024-06/base-000004/
+    2024-06/delta-000005/ incidents appended to a shard since its last compaction
+
+Shards are described in src/shards.py. Manifests written before sharding
+(a single "base" and "deltas" list) are read as the one shard "all", whose
+segments sit directly in the index directory; so are indexes built with
+INDEX_SHARD_PERIOD=none. Indexes written before segments existed (index.faiss / index.pkl directly in
+the index directory) are read as a base segment named ".". Segments that still
+carry a pickled index.pkl docstore are migrated to documents.sqlite the first
+time they are loaded.
+"""
+
+import json
+import os
+import shutil
+import threading
+import faiss
+from langchain_community.vectorstores import FAISS
+from src.ann_index import IncidentFAISS, configure_search, is_compressed, merge_stores, rebuild_store
+from src.config import FAISS_INDEX_PATH, COMPACTION_DELTA_THRESHOLD
+from src.dedup import get_incident_ledger, apply_tombstones
+from src.docstore import get_document_store
+from src.full_vectors import get_full_vector_store
+from src.metrics import span
+from src.shards import ALL_SHARDS, ShardedIncidentStore, shard_segments, split_by_shard
+
+MANIFEST_FILE = "manifest.json"
+IDS_FILE = "ids.json"
+LEGACY_BASE = "."
+
+# Serializes manifest updates between sessions of this process
+_write_lock = threading.Lock()
+_compaction_thread = None
+
+def read_manifest(index_path=FAISS_INDEX_PATH):
+    """
+    Return the segment manifest, or None if no index exists
+
+    Returns:
+        dict: {"generation": n, "shards": {key: {"base", "deltas", "vectors"}}};
+        a shard's base is None until its first compaction if it started as a delta
+    """
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if "shards" not in manifest:
+            # Written before sharding: the whole index is one shard
+            entry = {"base": manifest["base"], "deltas": manifest["deltas"]}
+            manifest = {"generation": manifest["generation"], "shards": {ALL_SHARDS: entry}}
+        return manifest
+
+    # Index written before segments were introduced
+    if os.path.exists(os.path.join(index_path, "index.faiss")):
+        return {"generation": 0, "shards": {ALL_SHARDS: {"base": LEGACY_BASE, "deltas": []}}}
+
+    return None
+
+def segment_names(manifest):
+    """Return every live segment of a manifest, shard by shard"""
+    return [name for key in sorted(manifest["shards"]) for name in shard_segments(manifest["shards"][key])]
+
+def _segment_name(key, kind, generation):
+    """Name a shard's new segment; unsharded segments stay at the top of the index directory"""
+    prefix = "" if key == ALL_SHARDS else f"{key}/"
+    return f"{prefix}{kind}-{generation:06d}"
+
+def _write_manifest(index_path, manifest):
+    """Atomically replace the manifest so readers never see a partial file"""
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def _write_ids(segment_path, doc_ids):
+    """Atomically write a segment's position -> docstore id list"""
+    ids_path = os.path.join(segment_path, IDS_FILE)
+    with open(ids_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(doc_ids, f)
+    os.replace(ids_path + ".tmp", ids_path)
+
+def _save_segment(db, index_path, name):
+    """Write a single segment's index and ids, and its documents to the shared docstore"""
+    segment_path = os.path.join(index_path, name)
+    os.makedirs(segment_path, exist_ok=True)
+    doc_ids = [db.index_to_docstore_id[position] for position in range(db.index.ntotal)]
+
+    with span("segment_write"):
+        get_document_store(index_path).write_segment(name, doc_ids, db.docstore)
+        if is_compressed(db.index) and db.index_path != index_path:
+            # Keep the exact vectors with the index they belong to
+            exact = get_full_vector_store(db.index_path).get_many(doc_ids)
+            get_full_vector_store(index_path).put_many(list(exact), list(exact.values()))
+        faiss.write_index(db.index, os.path.join(segment_path, "index.faiss"))
+        _write_ids(segment_path, doc_ids)
+
+def _migrate_pickled_segment(index_path, name, embeddings):
+    """Move a segment's pickled index.pkl docstore into documents.sqlite"""
+    segment_path = os.path.join(index_path, name)
+    # The only place a pickle is still read: segments this application wrote itself
+    legacy = FAISS.load_local(segment_path, embeddings, allow_dangerous_deserialization=True)
+    doc_ids = [legacy.index_to_docstore_id[position] for position in range(legacy.index.ntotal)]
+
+    get_document_store(index_path).write_segment(name, doc_ids, legacy.docstore)
+    _write_ids(segment_path, doc_ids)
+    os.remove(os.path.join(segment_path, "index.pkl"))
+
+def _load_segment(index_path, name, embeddings):
+    """Read a single segment from disk and apply the query-time search knobs"""
+    segment_path = os.path.join(index_path, name)
+    ids_path = os.path.join(segment_path, IDS_FILE)
+    if not os.path.exists(ids_path) and os.path.exists(os.path.join(segment_path, "index.pkl")):
+        _migrate_pickled_segment(index_path, name, embeddings)
+
+    with span("segment_read"):
+        index = faiss.read_index(os.path.join(segment_path, "index.faiss"))
+        with open(ids_path, "r", encoding="utf-8") as f:
+            doc_ids = json.load(f)
+
+    configure_search(index)
+    db = IncidentFAISS(embeddings, index, get_document_store(index_path), dict(enumerate(doc_ids)))
+    db.index_path = index_path
+    return db
+
+def _remove_segment(index_path, name):
+    """Delete a segment, and the documents it owns, once the manifest no longer references it"""
+    if not name:
+        return
+    if name == LEGACY_BASE:
+        for filename in ("index.faiss", "index.pkl", IDS_FILE):
+            path = os.path.join(index_path, filename)
+            if os.path.exists(path):
+                os.remove(path)
+    else:
+        shutil.rmtree(os.path.join(index_path, name), ignore_errors=True)
+    get_document_store(index_path).delete_segment(name)
+
+def write_base_segment(db, index_path=FAISS_INDEX_PATH, before_publish=None):
+    """
+    Replace the whole index with db as a fresh base segment
+
+    before_publish, if given, is called after the segment is on disk but before
+    the manifest makes it visible to readers.
+    """
+    os.makedirs(index_path, exist_ok=True)
+
+    with _write_lock:
+        old_manifest = read_manifest(index_path) or {"generation": 0, "shards": {}}
+        generation = old_manifest["generation"] + 1
+        shards = {}
+        for key, shard_db in (split_by_shard(db) or {ALL_SHARDS: db}).items():
+            base_name = _segment_name(key, "base", generation)
+            _save_segment(shard_db, index_path, base_name)
+            shards[key] = {"base": base_name, "deltas": [], "vectors": shard_db.index.ntotal}
+
+        if before_publish:
+            before_publish()
+        _write_manifest(index_path, {"generation": generation, "shards": shards})
+
+        for name in segment_names(old_manifest):
+            _remove_segment(index_path, name)
+
+def append_delta_segment(db, index_path=FAISS_INDEX_PATH, before_publish=None):
+    """
+    Persist db as new delta segments without rewriting existing segments
+
+    Incidents go to the shard of their date, one delta per shard they fall in;
+    shards they do not touch are left as they are.
+
+    Args:
+        db: FAISS store holding only the newly added incidents
+        index_path: Index directory that already holds an index
+        before_publish: Optional callback run once the segment is on disk but
+            before the manifest makes it visible to readers
+
+    Returns:
+        int: The manifest generation after the append
+    """
+    with _write_lock:
+        manifest = read_manifest(index_path)
+        generation = manifest["generation"] + 1
+        shards = dict(manifest["shards"])
+        for key, shard_db in split_by_shard(db).items():
+            delta_name = _segment_name(key, "delta", generation)
+            _save_segment(shard_db, index_path, delta_name)
+            entry = shards.get(key) or {"base": None, "deltas": []}
+            shards[key] = dict(entry, deltas=entry["deltas"] + [delta_name],
+                               vectors=entry.get("vectors", 0) + shard_db.index.ntotal)
+
+        if before_publish:
+            before_publish()
+        _write_manifest(index_path, dict(manifest, generation=generation, shards=shards))
+
+    return generation
+
+def load_segment(embeddings, name, index_path=FAISS_INDEX_PATH):
+    """Load one named segment from the index directory"""
+    return _load_segment(index_path, name, embeddings)
+
+def _load_shard_segments(index_path, entry, embeddings):
+    """Read a shard's segments and merge them into one store, without applying tombstones"""
+    names = shard_segments(entry)
+    db = _load_segment(index_path, names[0], embeddings)
+    for name in names[1:]:
+        merge_stores(db, _load_segment(index_path, name, embeddings))
+    return db
+
+def load_shard(embeddings, key, manifest, index_path=FAISS_INDEX_PATH):
+    """
+    Load one shard of a manifest (base segment plus deltas) as a single store
+
+    If a compaction has replaced the shard's segments since the manifest was
+    read, the shard's current segments are loaded instead.
+    """
+    try:
+        db = _load_shard_segments(index_path, manifest["shards"][key], embeddings)
+    except (FileNotFoundError, RuntimeError):
+        current = read_manifest(index_path)
+        if current is None or key not in current["shards"]:
+            raise
+        db = _load_shard_segments(index_path, current["shards"][key], embeddings)
+
+    # Hide superseded incidents
+    apply_tombstones(db, index_path)
+    return db
+
+def load_snapshot(embeddings, index_path=FAISS_INDEX_PATH, manifest=None, loaded=None):
+    """
+    Open the index as a sharded store, loading its hot shards
+
+    Args:
+        embeddings: Embeddings used for queries
+        index_path: Index directory
+        manifest: Manifest to open, read from disk by default
+        loaded: Shards of an earlier snapshot still valid under this
+            manifest, {key: IncidentFAISS}, reused instead of reloaded
+
+    Returns:
+        tuple: (manifest, db) describing exactly the segments that were loaded,
+        or (None, None) if no index exists
+    """
+    manifest = manifest or read_manifest(index_path)
+    if manifest is None:
+        return None, None
+
+    ledger = get_incident_ledger(index_path)
+    db = ShardedIncidentStore(
+        embeddings, get_document_store(index_path), manifest["shards"],
+        lambda key: load_shard(embeddings, key, manifest, index_path),
+        loaded=loaded, deleted=ledger.deleted_doc_ids()
+    ).load_hot()
+
+    # Register indexes built before deduplication (always a single unsharded shard)
+    if len(ledger) == 0:
+        for key in db.shard_keys:
+            shard_db = db.shard(key)
+            doc_ids = list(shard_db.index_to_docstore_id.values())
+            ledger.record(doc_ids, [shard_db.docstore.search(doc_id).page_content for doc_id in doc_ids])
+    return manifest, db
+
+def load_segments(embeddings, index_path=FAISS_INDEX_PATH):
+    """Open the whole index (every shard's base segment plus deltas) as one sharded store"""
+    return load_snapshot(embeddings, index_path)[1]
+
+def _compact_shard(embeddings, index_path, key, snapshot):
+    """Merge one shard's base segment and current deltas into a new base segment"""
+    # Merge outside the lock so appends are not blocked by the rewrite
+    db = _load_shard_segments(index_path, snapshot, embeddings)
+
+    # Rebuild as one index sized for the whole shard (retraining IVF centroids),
+    # physically dropping superseded incidents; their documents are deleted
+    # along with the old segments that still own them
+    live_ids = set(db.index_to_docstore_id.values())
+    purged = [doc_id for doc_id in get_incident_ledger(index_path).deleted_doc_ids() if doc_id in live_ids]
+    db = rebuild_store(db, purged, retrain=True)
+
+    with _write_lock:
+        current = read_manifest(index_path)
+        entry = current["shards"].get(key) if current else None
+        if entry is None or entry.get("base") != snapshot.get("base"):
+            # The index was rebuilt or the shard compacted elsewhere in the meantime
+            return False
+
+        generation = current["generation"] + 1
+        base_name = _segment_name(key, "base", generation)
+        _save_segment(db, index_path, base_name)
+
+        remaining = [name for name in entry["deltas"] if name not in snapshot["deltas"]]
+        # Vectors in deltas appended during the merge are still counted
+        vectors = db.index.ntotal + entry.get("vectors", 0) - snapshot.get("vectors", 0)
+        shards = dict(current["shards"])
+        shards[key] = {"base": base_name, "deltas": remaining, "vectors": vectors}
+        _write_manifest(index_path, dict(current, generation=generation, shards=shards))
+
+        for name in shard_segments(snapshot):
+            _remove_segment(index_path, name)
+
+    get_incident_ledger(index_path).purge(purged)
+    get_full_vector_store(index_path).delete_many(purged)
+    return True
+
+def compact_segments(embeddings, index_path=FAISS_INDEX_PATH, min_deltas=1):
+    """
+    Merge the base segment and current deltas of each shard with at least
+    min_deltas deltas into a new base segment for that shard
+
+    Other shards are not rewritten. Deltas appended while a merge is running
+    are kept and stay live.
+
+    Returns:
+        bool: True if a new base segment was written
+    """
+    snapshot = read_manifest(index_path)
+    if not snapshot:
+        return False
+
+    compacted = False
+    for key, entry in sorted(snapshot["shards"].items()):
+        if entry["deltas"] and len(entry["deltas"]) >= min_deltas:
+            compacted = _compact_shard(embeddings, index_path, key, entry) or compacted
+    return compacted
+
+def maybe_schedule_compaction(embeddings, index_path=FAISS_INDEX_PATH, threshold=COMPACTION_DELTA_THRESHOLD):
+    """Start a background compaction of the shards whose number of deltas crosses the threshold"""
+    global _compaction_thread
+
+    manifest = read_manifest(index_path)
+    if not manifest or all(len(entry["deltas"]) < threshold for entry in manifest["shards"].values()):
+        return False
+
+    with _write_lock:
+        if _compaction_thread is not None and _compaction_thread.is_alive():
+            return False
+        _compaction_thread = threading.Thread(
+            target=compact_segments,
+            args=(embeddings, index_path, threshold),
+            name="faiss-compaction",
+            daemon=True
+        )
+        _compaction_thread.start()
+
+    return True
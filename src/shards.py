@@ -0,0 +1,362 @@
+"""
+Shards module for the Security Incident Analysis application.
+Partitions the incident index by date and searches the shards a question needs in parallel.
+
+Every incident belongs to the shard of its date's month (or year, see
+INDEX_SHARD_PERIOD); incidents without a date share an "undated" shard, and
+indexes built unsharded are one "all" shard. Each shard is its own base
+segment plus deltas, so a write only touches the shards of the incidents it
+adds and compaction only rewrites the shards that changed: the shards of past
+months are immutable unless incidents dated in them arrive late.
+
+A search goes to the shards whose dates overlap its metadata filter (all of
+them without a date filter), runs on a thread pool, and the hits are merged by
+score. The most recent SHARD_HOT_COUNT shards are loaded with the index and
+kept; the others are loaded when a search first needs them and unloaded after
+SHARD_IDLE_SECONDS without one, or least recently searched first beyond
+SHARD_MAX_LOADED, so memory follows the periods being asked about.
+"""
+
+import calendar
+import contextvars
+import datetime
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.vectorstores import VectorStore
+from src.ann_index import (
+    build_store, describe_index, higher_is_better, apply_score_threshold, question_filter, partition_store
+)
+from src.config import (
+    FAISS_INDEX_PATH, INDEX_SHARD_PERIOD, SHARD_HOT_COUNT, SHARD_IDLE_SECONDS, SHARD_MAX_LOADED, SHARD_SEARCH_THREADS
+)
+from src.dedup import get_incident_ledger
+from src.incident_metadata import normalize_date
+from src.metrics import span
+
+# Shard of an index built without sharding (or with INDEX_SHARD_PERIOD=none)
+ALL_SHARDS = "all"
+UNDATED_SHARD = "undated"
+
+_pool_lock = threading.Lock()
+_search_pool = None
+
+def shard_key(date, period=INDEX_SHARD_PERIOD):
+    """Return the shard of an incident dated YYYY-MM-DD (or undated)"""
+    if period == "none":
+        return ALL_SHARDS
+    if not date:
+        return UNDATED_SHARD
+    return date[:4] if period == "year" else date[:7]
+
+def shard_date_range(key):
+    """Return the (first, last) date a shard holds, or None for the all and undated shards"""
+    try:
+        if len(key) == 7:
+            year, month = int(key[:4]), int(key[5:])
+            return f"{key}-01", datetime.date(year, month, calendar.monthrange(year, month)[1]).isoformat()
+        if len(key) == 4:
+            int(key)
+            return f"{key}-01-01", f"{key}-12-31"
+    except ValueError:
+        pass
+    return None
+
+def shard_segments(entry):
+    """Return the segment names of a manifest shard entry, base first"""
+    return ([entry["base"]] if entry.get("base") else []) + list(entry["deltas"])
+
+def split_by_shard(db, period=INDEX_SHARD_PERIOD):
+    """Split a store into {shard key: store} by the date of each incident"""
+    return partition_store(db, lambda doc: shard_key(doc.metadata.get("date"), period))
+
+def _condition_range(condition):
+    """Return the (first, last) date one date condition allows, either end None if open"""
+    if isinstance(condition, list):
+        condition = {"$in": condition}
+    elif not isinstance(condition, dict):
+        condition = {"$eq": condition}
+
+    first, last = None, None
+    for operator, value in condition.items():
+        if operator == "$in" and value:
+            dates = [normalize_date(item) or str(item) for item in value]
+            first, last = min(dates), max(dates)
+        elif operator == "$eq":
+            first = last = normalize_date(value) or str(value)
+        elif operator in ("$gt", "$gte"):
+            first = normalize_date(value) or str(value)
+        elif operator in ("$lt", "$lte"):
+            last = normalize_date(value) or str(value)
+    return first, last
+
+def filter_date_range(filter):
+    """
+    Return the dates a metadata filter restricts incidents to
+
+    Returns:
+        tuple: (first, last) dates as YYYY-MM-DD, either None if open, or None
+        if the filter does not restrict the date
+    """
+    if not isinstance(filter, dict):
+        return None
+
+    ranges = []
+    for key, condition in filter.items():
+        if key == "$and":
+            ranges.extend(filter_date_range(sub_filter) for sub_filter in condition)
+        elif key == "date":
+            ranges.append(_condition_range(condition))
+
+    # Every condition must hold, so the allowed range is their intersection
+    firsts = [bounds[0] for bounds in ranges if bounds and bounds[0]]
+    lasts = [bounds[1] for bounds in ranges if bounds and bounds[1]]
+    if not firsts and not lasts:
+        return None
+    return max(firsts, default=None), min(lasts, default=None)
+
+def _get_search_pool():
+    """Return the process-wide thread pool shard searches run on"""
+    global _search_pool
+    with _pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=max(SHARD_SEARCH_THREADS, 1),
+                                              thread_name_prefix="shard-search")
+        return _search_pool
+
+class ShardedIncidentStore(VectorStore):
+    """
+    Read-only incident store made of date shards, each an IncidentFAISS loaded on demand
+
+    Args:
+        embedding_function: Embeddings used for queries
+        docstore: Document store shared by every shard
+        shards: Manifest shard entries, {key: {"base", "deltas", "vectors"}}
+        load_shard: Function loading a shard key into an IncidentFAISS
+        loaded: Already loaded shards to reuse, {key: IncidentFAISS}
+        deleted: Doc ids tombstoned when the manifest was read
+    """
+
+    def __init__(self, embedding_function, docstore, shards, load_shard, loaded=None, deleted=(),
+                 hot_count=SHARD_HOT_COUNT, idle_seconds=SHARD_IDLE_SECONDS, max_loaded=SHARD_MAX_LOADED,
+                 distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE):
+        self.embedding_function = embedding_function
+        self.docstore = docstore
+        self.distance_strategy = distance_strategy
+        self.idle_seconds = idle_seconds
+        self.max_loaded = max_loaded
+        self._entries = dict(sorted(shards.items()))
+        self._load_shard = load_shard
+        self._deleted = frozenset(deleted)
+        self._segment_shards = {name: key for key, entry in self._entries.items() for name in shard_segments(entry)}
+
+        # Shard keys sort by date, so the last dated ones are the most recent
+        dated = [key for key in self._entries if shard_date_range(key) is not None]
+        self.hot = set(dated[-hot_count:] if hot_count > 0 else []) | ({ALL_SHARDS} & set(self._entries))
+
+        # key -> (store, last searched), least recently searched first
+        now = time.monotonic()
+        self._loaded = OrderedDict(
+            (key, (db, now)) for key, db in (loaded or {}).items() if key in self._entries
+        )
+        self._lock = threading.Lock()
+        self._load_locks = {key: threading.Lock() for key in self._entries}
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, index_path=FAISS_INDEX_PATH,
+                   index_factory=None, **kwargs):
+        """
+        Replace the index in index_path with texts, written as date shards, and return it loaded
+
+        Args:
+            texts: Formatted incident texts
+            embedding: Embeddings used for the texts and for queries
+            metadatas: Optional metadata dicts, one per text; parsed from the texts by default
+            ids: Optional docstore ids, one per text
+            index_path: Index directory to write
+            index_factory: FAISS factory string for each shard's index (see build_store)
+        """
+        # segment_store builds on this module, so it is imported when first needed
+        from src.segment_store import load_segments, write_base_segment
+
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        db = build_store(embedding, texts, ids, index_factory, metadatas, index_path=index_path)
+
+        # The ledger describes the index, so it is replaced along with it
+        ledger = get_incident_ledger(index_path)
+
+        def record_incidents():
+            ledger.reset()
+            ledger.record(ids, texts)
+
+        write_base_segment(db, index_path, before_publish=record_incidents)
+        return load_segments(embedding, index_path)
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    @property
+    def shard_keys(self):
+        return list(self._entries)
+
+    def loaded_shards(self):
+        """Return the shards currently in memory, {key: IncidentFAISS}"""
+        with self._lock:
+            return {key: db for key, (db, _) in self._loaded.items()}
+
+    def shard(self, key):
+        """Return a shard's store, loading it from disk if it is not in memory"""
+        with self._lock:
+            loaded = self._loaded.get(key)
+            if loaded is not None:
+                self._loaded[key] = (loaded[0], time.monotonic())
+                self._loaded.move_to_end(key)
+                self._unload_cold()
+                return loaded[0]
+
+        # One load per shard, while searches of other shards carry on
+        with self._load_locks[key]:
+            with self._lock:
+                loaded = self._loaded.get(key)
+            if loaded is not None:
+                return loaded[0]
+            with span("shard_load"):
+                db = self._load_shard(key)
+            with self._lock:
+                self._loaded[key] = (db, time.monotonic())
+                self._unload_cold()
+            return db
+
+    def load_hot(self):
+        """Load the hot shards, in parallel"""
+        list(_get_search_pool().map(self.shard, sorted(self.hot)))
+        return self
+
+    def unload(self, key):
+        """Drop a shard from memory; it is read from disk again when next searched"""
+        with self._lock:
+            return self._loaded.pop(key, None) is not None
+
+    def _unload_cold(self):
+        """Unload idle cold shards, then the least recently searched beyond max_loaded (lock held)"""
+        now = time.monotonic()
+        for key, (_, last_searched) in list(self._loaded.items()):
+            if key in self.hot:
+                continue
+            over_limit = self.max_loaded > 0 and len(self._loaded) > self.max_loaded
+            idle = self.idle_seconds > 0 and now - last_searched > self.idle_seconds
+            if not over_limit and not idle:
+                # Entries are in search order, so the rest are more recent
+                break
+            del self._loaded[key]
+
+    def shards_for_filter(self, filter):
+        """Return the shards that can hold incidents matching a metadata filter"""
+        date_range = filter_date_range(filter)
+        if date_range is None:
+            return self.shard_keys
+
+        first, last = date_range
+        keys = []
+        for key in self._entries:
+            shard_range = shard_date_range(key)
+            if shard_range is None:
+                # Undated incidents never match a date filter; unsharded indexes always might
+                if key == ALL_SHARDS:
+                    keys.append(key)
+            elif (first is None or shard_range[1] >= first) and (last is None or shard_range[0] <= last):
+                keys.append(key)
+        return keys
+
+    def contains(self, doc_id):
+        """Return True if the document is searchable in this store (not tombstoned or unpublished)"""
+        key = self._segment_shards.get(self.docstore.segment_of(doc_id))
+        if key is None:
+            return False
+        with self._lock:
+            loaded = self._loaded.get(key)
+        if loaded is not None:
+            return loaded[0].contains(doc_id)
+        return doc_id not in self._deleted
+
+    def filter_for_question(self, question):
+        """Return the metadata filter implied by the incident types and dates a question names, or None"""
+        return question_filter(self.docstore, question, self.contains)
+
+    _create_filter_func = staticmethod(FAISS._create_filter_func)
+
+    def _embed_query(self, text):
+        return self.embedding_function.embed_query(text)
+
+    def _fan_out(self, keys, search):
+        """Run search(shard store) on every shard key, in parallel when there are several"""
+        if len(keys) == 1 or SHARD_SEARCH_THREADS <= 1:
+            return [search(self.shard(key)) for key in keys]
+
+        def run(key):
+            return search(self.shard(key))
+
+        # Each task gets its own copy of the context, so its spans join the current trace
+        pool = _get_search_pool()
+        futures = [pool.submit(contextvars.copy_context().run, run, key) for key in keys]
+        return [future.result() for future in futures]
+
+    def _best(self, results, k):
+        """Merge per-shard (item, score) lists into the k best"""
+        hits = [hit for shard_hits in results for hit in shard_hits]
+        hits.sort(key=lambda pair: pair[1], reverse=higher_is_better(self.distance_strategy))
+        return hits[:k]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20, **kwargs):
+        keys = self.shards_for_filter(filter)
+        candidate_ids = None
+        if isinstance(filter, dict) and hasattr(self.docstore, "filter_ids"):
+            candidate_ids = self.docstore.filter_ids(filter)
+
+        if candidate_ids is None and filter is not None:
+            # Filters without indexed columns are checked against each shard's fetched documents
+            return self._best(self._fan_out(keys, lambda db: db.similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter, fetch_k=fetch_k, **kwargs
+            )), k)
+
+        if candidate_ids is not None:
+            if not candidate_ids:
+                return []
+            candidate_ids = set(candidate_ids)
+        hits = self._best(self._fan_out(keys, lambda db: db.search_ids(embedding, k, candidate_ids)), k)
+
+        # Documents are only read for the merged top k
+        docs = [(self.docstore.search(doc_id), score) for doc_id, score in hits]
+        return apply_score_threshold(docs, kwargs.get("score_threshold"), self.distance_strategy)
+
+    def similarity_search_with_score(self, query, k=4, filter=None, fetch_k=20, infer_filter=False, **kwargs):
+        if infer_filter and filter is None:
+            filter = self.filter_for_question(query)
+        return self.similarity_search_with_score_by_vector(
+            self._embed_query(query), k, filter=filter, fetch_k=fetch_k, **kwargs
+        )
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    @property
+    def ntotal(self):
+        """Vectors in every shard, counting shards that are not loaded from the manifest"""
+        loaded = self.loaded_shards()
+        return sum(
+            loaded[key].index.ntotal if key in loaded else entry.get("vectors", 0)
+            for key, entry in self._entries.items()
+        )
+
+    def describe(self):
+        """Return a short human-readable description of the shards and their indexes"""
+        loaded = self.loaded_shards()
+        kinds = sorted({describe_index(db.index) for db in loaded.values()})
+        return (f"{len(self._entries)} shards, {len(loaded)} loaded ({', '.join(kinds) or 'none'}), "
+                f"{self.ntotal:,} vectors")
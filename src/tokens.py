@@ -0,0 +1,43 @@
+"""
+Tokens module for the Security Incident Analysis application.
+Cheap token estimates used to keep prompts within a budget.
+
+Counting tokens exactly would need the model's tokenizer (a network call for
+Gemini), so budgets use the usual estimate of about four characters per token.
+"""
+
+import math
+import re
+
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a text"""
+    return math.ceil(len(" ".join(str(text).split())) / CHARS_PER_TOKEN)
+
+def truncate_tokens(text, max_tokens):
+    """
+    Shorten a text to about max_tokens tokens, cutting at a word boundary
+    
+    Returns:
+        str: The text with whitespace collapsed, ending in "..." if it was cut
+    """
+    text = " ".join(str(text).split())
+    max_chars = max(max_tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max(max_chars - 3, 0)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,;:") + "..."
+
+def first_sentences(text, max_tokens):
+    """Return the leading sentences of a text that fit in max_tokens"""
+    text = " ".join(str(text).split())
+    kept = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        candidate = f"{kept} {sentence}".strip()
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        kept = candidate
+    return kept or truncate_tokens(text, max_tokens)
@@ -5,22 +5,34 @@ Handles Streamlit UI components and interactions.
 
 import os
 import datetime
+import math
 import streamlit as st
 import traceback
-from src.config import get_api_key, set_api_key
-from src.data_loader import process_sample_data, process_uploaded_file, load_existing_index
-from src.incident_manager import add_new_incident
-from src.conversation import process_user_query
+from importlib.metadata import version
+from src.config import (
+    get_api_key, set_api_key, FAISS_INDEX_PATH, ANSWER_CACHE_ENABLED, CHAT_RECENT_TURNS, CHAT_PAGE_SIZE
+)
+from src.metrics import get_metrics_registry
+from src.condense import get_condense_policy
+
+# LangChain, FAISS and pandas are imported inside the handlers that use them,
+# so the first page paints before they load
 
 def render_sidebar():
-    """Render the sidebar UI components"""
+    """
+    Render the sidebar UI components
+    
+    Returns:
+        dict: Sidebar containers the chat fragment draws its per-question
+        views into ("stats", and "retrieval" while debug info is shown)
+    """
+    views = {"stats": None, "retrieval": None}
     with st.sidebar:
         st.header("Configuration")
         
-        # Display LangChain version
+        # Display LangChain version (from package metadata, without importing it)
         try:
-            import langchain
-            st.info(f"LangChain version: {langchain.__version__}")
+            st.info(f"LangChain version: {version('langchain')}")
         except Exception:
             st.warning("Could not detect LangChain version")
         
@@ -48,17 +60,18 @@ def render_sidebar():
         # Advanced options
         st.subheader("Advanced Options")
         if st.button("Reset Chat History"):
-            st.session_state.conversation_history = []
-            st.session_state.chat_history = []
+            if st.session_state.memory is not None:
+                st.session_state.memory.clear()
             st.success("Chat history cleared")
             
         if st.button("Reset Database"):
             import os
-            if os.path.exists("faiss_index"):
+            if os.path.exists(FAISS_INDEX_PATH):
                 try:
                     import shutil
-                    shutil.rmtree("faiss_index")
+                    shutil.rmtree(FAISS_INDEX_PATH)
                     st.session_state.db = None
+                    st.session_state.index_generation = None
                     st.session_state.conversation_chain = None
                     st.session_state.document_processed = False
                     st.success("Database has been reset")
@@ -69,7 +82,11 @@ def render_sidebar():
         st.subheader("System Status")
         status = "Ready" if st.session_state.document_processed else "Not Initialized"
         st.write(f"Status: {status}")
-        st.write(f"Chat history entries: {len(st.session_state.chat_history)}")
+        views["stats"] = st.container()
+        if get_metrics_registry().summary("stage"):
+            # Rendered when downloaded, so the export is current however stale the page is
+            st.download_button("Download Prometheus metrics", get_metrics_registry().render_prometheus,
+                               file_name="incident_analysis_metrics.prom", mime="text/plain")
         
         # Debug section
         # Debug section
@@ -78,6 +95,32 @@ def render_sidebar():
             st.write(f"Database initialized: {st.session_state.db is not None}")
             st.write(f"Conversation chain initialized: {st.session_state.conversation_chain is not None}")
             
+            if st.session_state.db is not None:
+                st.write(f"Vector index: {st.session_state.db.describe()}")
+            
+            from src.embedding_cache import get_embedding_cache
+            cache_stats = get_embedding_cache().stats()
+            st.write(f"Embedding cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                     f"({cache_stats['entries']} vectors cached)")
+            
+            if st.session_state.conversation_chain is not None:
+                embeddings = st.session_state.db.embedding_function
+                if hasattr(embeddings, "query_stats"):
+                    query_stats = embeddings.query_stats()
+                    st.write(f"Query embedding cache: {query_stats['hits']} hits / {query_stats['misses']} misses")
+            
+            if ANSWER_CACHE_ENABLED:
+                from src.answer_cache import get_answer_cache
+                answer_stats = get_answer_cache().stats()
+                st.write(f"Answer cache: {answer_stats['hits']} hits / {answer_stats['misses']} misses "
+                         f"({answer_stats['entries']} answers cached)")
+            
+            condense_stats = get_condense_policy().stats()
+            st.write(f"Question condensing: {condense_stats['condensed']} rewritten / "
+                     f"{condense_stats['skipped']} skipped ({condense_stats['skip_rate']:.0%} skip rate)")
+            
+            views["retrieval"] = st.container()
+            
             # Add option to inspect database contents
             if st.button("Inspect Database Contents") and st.session_state.db:
                 with st.spinner("Retrieving database content samples..."):
@@ -92,6 +135,76 @@ def render_sidebar():
                             st.text_area(f"Document {i+1}", doc.page_content, height=200)
                     except Exception as e:
                         st.error(f"Error inspecting database: {str(e)}")
+    
+    return views
+
+def render_turn_stats(views):
+    """Draw the views that change with every question into the sidebar containers"""
+    with views["stats"]:
+        if st.session_state.memory is not None:
+            memory_stats = st.session_state.memory.stats()
+            st.write(f"Chat history entries: {memory_stats['turns']}")
+            st.write(f"History sent to the model: ~{memory_stats['history_tokens']} of "
+                     f"{memory_stats['budget']} tokens")
+        else:
+            st.write("Chat history entries: 0")
+        render_stage_latency()
+    
+    if views["retrieval"] is not None:
+        with views["retrieval"]:
+            render_last_retrieval()
+
+def render_stage_latency():
+    """Show per-stage latency histograms (all sessions in this process)"""
+    registry = get_metrics_registry()
+    stages = registry.summary("stage")
+    if not stages:
+        return
+    
+    with st.expander("Stage latency"):
+        st.caption("Milliseconds per stage, slowest total first; percentiles are estimated from histogram buckets")
+        st.dataframe(stages, hide_index=True)
+        requests = registry.summary("request")
+        if requests:
+            st.dataframe(requests, hide_index=True)
+
+def render_last_retrieval():
+    """Show the documents, scores and stage latencies of the last question's retrieval"""
+    retrieval = st.session_state.last_retrieval
+    if not retrieval:
+        return
+    
+    st.write("### Retrieved Documents")
+    st.write(f"Search query: {retrieval['question']}")
+    st.write(f"Retrieved {len(retrieval['documents'])} documents")
+    st.write("Stage latency (ms): " + ", ".join(
+        f"{stage[:-3]} {ms:.1f}" for stage, ms in retrieval["timings"].items()
+    ))
+    if retrieval["filter"]:
+        st.write(f"Filter: {retrieval['filter']}")
+    context = retrieval.get("context")
+    if context:
+        st.write(f"Prompt context: {context['packed']} of {context['retrieved']} incidents "
+                 f"({context['duplicates']} near-duplicates, {context['over_budget']} over budget), "
+                 f"~{context['context_tokens']} tokens from ~{context['raw_tokens']} raw")
+        st.write(f"Input tokens: ~{context['prompt_tokens']} total (question ~{context['question_tokens']}, "
+                 f"history ~{context['history_tokens']})")
+    condense = retrieval.get("condense") or {}
+    if condense.get("reason"):
+        action = "rewritten" if condense["condensed"] else "sent as asked"
+        st.write(f"Question {action} ({condense['reason'].replace('_', ' ')})")
+    if retrieval.get("answer_cached"):
+        st.write("Answer served from the answer cache")
+    answer_timings = retrieval.get("answer_timings") or {}
+    if "ttft_ms" in answer_timings:
+        st.write(f"Answer time to first token: {answer_timings['ttft_ms']:.1f} ms, "
+                 f"total {answer_timings.get('total_ms', 0):.1f} ms")
+    for i, (doc, scores) in enumerate(retrieval["documents"]):
+        st.write(f"**Document {i+1}:** (fused {scores['fused']:.4f}, "
+                 f"vector {scores['vector'] if scores['vector'] is not None else '-'}, "
+                 f"bm25 {scores['bm25'] if scores['bm25'] is not None else '-'})")
+        st.write(doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content)
+        st.write("---")
 
 def handle_data_source_selection(data_option):
     """Handle the data source selection in the sidebar"""
@@ -101,12 +214,14 @@ def handle_data_source_selection(data_option):
                 st.error("Google API key not found. Please set it manually or check your .env file.")
             else:
                 with st.spinner("Loading sample data and initializing the system..."):
+                    from src.data_loader import process_sample_data
                     success = process_sample_data()
                     if success:
                         st.success("Sample data loaded successfully!")
     
     elif data_option == "Upload Own Data":
-        uploaded_file = st.file_uploader("Upload security incidents JSON or CSV", type=["json", "csv"])
+        uploaded_file = st.file_uploader("Upload security incidents JSON, NDJSON or CSV",
+                                         type=["json", "ndjson", "jsonl", "csv"])
         
         if uploaded_file is not None:
             if st.button("Process Uploaded Data"):
@@ -114,6 +229,7 @@ def handle_data_source_selection(data_option):
                     st.error("Google API key not found. Please set it manually or check your .env file.")
                 else:
                     with st.spinner("Processing uploaded data..."):
+                        from src.data_loader import process_uploaded_file
                         success = process_uploaded_file(uploaded_file)
                         if success:
                             st.success("Data processed successfully!")
@@ -127,6 +243,7 @@ def handle_data_source_selection(data_option):
                 st.error("Google API key not found. Please set it manually or check your .env file.")
             else:
                 with st.spinner("Loading existing FAISS index..."):
+                    from src.data_loader import load_existing_index
                     success = load_existing_index()
                     if success:
                         st.success("Existing index loaded successfully!")
@@ -140,6 +257,7 @@ def render_add_incident_form():
         "Phishing Attack", "Malware", "Ransomware", "DDoS", "Data Breach", 
         "Insider Threat", "SQL Injection", "XSS", "CSRF", "Other"
     ])
+    incident_severity = st.selectbox("Severity", ["Low", "Medium", "High", "Critical"], index=1)
     
     incident_description = st.text_area("Description", height=100)
     incident_impact = st.text_area("Impact", height=100)
@@ -153,28 +271,67 @@ def render_add_incident_form():
             incident_data = {
                 "date": incident_date.strftime("%Y-%m-%d"),
                 "type": incident_type,
+                "severity": incident_severity,
                 "description": incident_description,
                 "impact": incident_impact,
                 "mitigation": incident_mitigation
             }
             
+            from src.incident_manager import add_new_incident
             incident_id = add_new_incident(incident_data)
             if incident_id:
                 st.success(f"Incident {incident_id} added successfully!")
         else:
             st.error("Please fill in all fields.")
 
-def render_chat_interface():
-    """Render the main chat interface"""
+def render_chat_interface(sidebar_views=None):
+    """Render the main chat interface, refreshing sidebar_views (see render_sidebar) after each question"""
     st.header("Security Incident Analysis Chat")
+    render_chat(sidebar_views)
+
+def render_turn(query, response):
+    """Render one question and its answer"""
+    st.info(f"Question: {query}")
+    st.success(f"Response: {response}")
+    st.divider()
+
+def render_earlier_turns(turns):
+    """Render turns older than the recent ones one page at a time, and only on request"""
+    if not st.toggle(f"Show {len(turns)} earlier turns", key="show_earlier_turns"):
+        return
+    
+    pages = math.ceil(len(turns) / CHAT_PAGE_SIZE)
+    page = pages
+    if pages > 1:
+        page = st.number_input(f"Page (1 = oldest, {pages} = most recent)", min_value=1, max_value=pages,
+                               value=pages, step=1)
+    start = (page - 1) * CHAT_PAGE_SIZE
+    for query, response in turns[start:start + CHAT_PAGE_SIZE]:
+        render_turn(query, response)
+
+@st.fragment
+def render_chat(sidebar_views=None):
+    """
+    Render the conversation and the question box as a fragment
+    
+    Typing a question or paging through earlier turns reruns only this
+    fragment, not the whole page, and draws at most CHAT_RECENT_TURNS recent
+    turns plus one page of older ones, so each question costs the same however
+    long the investigation gets. The sidebar's per-question views (history
+    and latency stats, the debug retrieval panel) are drawn by this fragment
+    into sidebar_views, so they are current after every question without a
+    whole-page rerun.
+    """
+    turns = st.session_state.memory.turns() if st.session_state.memory is not None else []
+    split = max(len(turns) - max(CHAT_RECENT_TURNS, 1), 0)
     
     # Display chat history
+    if split:
+        render_earlier_turns(turns[:split])
     chat_container = st.container()
     with chat_container:
-        for i, (query, response) in enumerate(st.session_state.chat_history):
-            st.info(f"Question: {query}")
-            st.success(f"Response: {response}")
-            st.divider()
+        for query, response in turns[split:]:
+            render_turn(query, response)
     
     # Input for new queries
     st.subheader("Ask a Question")
@@ -191,13 +348,24 @@ def render_chat_interface():
             if not get_api_key():
                 st.error("Google API key not found. Please set it manually or check your .env file.")
             elif st.session_state.document_processed:
-                with st.spinner("Analyzing..."):
-                    try:
-                        # Process the query and update the UI
-                        response = process_user_query(user_query)
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Error processing query: {str(e)}")
-                        st.error(traceback.format_exc())
+                try:
+                    # Stream the answer under the history as it is generated, then draw it like
+                    # the other turns; only this turn is drawn, nothing above it reruns
+                    with chat_container:
+                        st.info(f"Question: {user_query}")
+                        answer_slot = st.empty()
+                        with answer_slot.container():
+                            with st.spinner("Analyzing..."):
+                                from src.conversation import stream_user_query
+                                response = st.write_stream(stream_user_query(user_query))
+                        answer_slot.success(f"Response: {response}")
+                        st.divider()
+                except Exception as e:
+                    st.error(f"Error processing query: {str(e)}")
+                    st.error(traceback.format_exc())
             else:
                 st.error("Please initialize the system with security incident data first.")
+    
+    # After any question, so the sidebar describes the turn just answered
+    if sidebar_views is not None:
+        render_turn_stats(sidebar_views)
@@ -0,0 +1,42 @@
+"""
+Shared fixtures for the Security Incident Analysis tests.
+Every test runs in its own working directory, so the index, ledger and caches
+it creates never touch the real ones, using the offline fakes for models.
+"""
+
+import pytest
+from src import answer_cache, dedup, docstore, embedding_cache, full_vectors, registry
+from src.data_loader import format_incident_for_embedding
+from src.fakes import FakeEmbeddings
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    """Run the test in an empty directory with no process-wide stores opened yet"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(registry, "_shared_db", None)
+    monkeypatch.setattr(registry, "_loaded_manifest", None)
+    monkeypatch.setattr(dedup, "_ledgers", {})
+    monkeypatch.setattr(docstore, "_docstores", {})
+    monkeypatch.setattr(full_vectors, "_stores", {})
+    monkeypatch.setattr(answer_cache, "_shared_cache", None)
+    monkeypatch.setattr(embedding_cache, "_shared_cache", None)
+    return tmp_path / "faiss_index"
+
+@pytest.fixture
+def embeddings():
+    return FakeEmbeddings(size=32)
+
+@pytest.fixture
+def make_incident():
+    """Return a function formatting an incident report as it is indexed"""
+    def make(incident_id, date, incident_type, description, severity="High"):
+        return format_incident_for_embedding({
+            "Incident ID": incident_id,
+            "Date": date,
+            "Type": incident_type,
+            "Description": description,
+            "Impact": "Service disruption",
+            "Mitigation": "Isolated the affected hosts",
+            "Severity": severity,
+        })
+    return make
@@ -0,0 +1,32 @@
+import os
+from src.ann_index import build_store, is_compressed, rebuild_store
+from src.full_vectors import get_full_vector_store
+from src.segment_store import load_segments, write_base_segment
+
+def test_exact_vectors_stay_with_their_index_directory(embeddings, make_incident):
+    texts = [make_incident(f"INC-{i}", f"2024-01-{i + 1:02d}", "Malware", f"Trojan on host {i}") for i in range(20)]
+    ids = [f"doc-{i}" for i in range(20)]
+    db = build_store(embeddings, texts, ids, "SQ8", index_path="second_index")
+
+    assert is_compressed(db.index)
+    assert len(get_full_vector_store("second_index").get_many(ids)) == 20
+    assert len(rebuild_store(db, ["doc-0"]).index_to_docstore_id) == 19
+
+    write_base_segment(db, "second_index")
+    store = load_segments(embeddings, "second_index")
+    shard = store.shard("2024-01")
+    assert shard.index_path == "second_index"
+
+    hits = store.similarity_search_with_score(texts[3], k=1)
+    assert hits[0][0].metadata["incident_id"] == "INC-3"
+    # Exact re-ranking scored the match with its full-precision vector
+    assert hits[0][1] < 1e-6
+    assert not os.path.exists(os.path.join("faiss_index", "vectors.sqlite"))
+
+def test_segments_written_elsewhere_take_their_exact_vectors_along(embeddings, make_incident):
+    texts = [make_incident(f"INC-{i}", "2024-01-05", "Malware", f"Trojan on host {i}") for i in range(10)]
+    db = build_store(embeddings, texts, [f"doc-{i}" for i in range(10)], "SQ8")
+
+    write_base_segment(db, "second_index")
+
+    assert len(get_full_vector_store("second_index").get_many([f"doc-{i}" for i in range(10)])) == 10
@@ -0,0 +1,17 @@
+import asyncio
+from src.batch import analyze_incident
+from src.fakes import FakeLLM
+from src.registry import rebuild_shared_vector_db
+
+def test_analysis_draws_on_similar_incidents_of_other_types_and_years(embeddings, make_incident):
+    db, _ = rebuild_shared_vector_db(embeddings, [
+        make_incident("INC-1", "2025-01-10", "Phishing Attack", "Fake invoice emails sent to finance"),
+        make_incident("INC-2", "2023-06-02", "Malware", "Invoice attachment installed a trojan in finance"),
+        make_incident("INC-3", "2022-11-20", "Data Breach", "Finance invoices exfiltrated by a stolen account"),
+    ])
+    new_incident = make_incident("INC-9", "2025-03-03", "Phishing Attack", "Invoice lure sent to the finance team")
+
+    result = asyncio.run(analyze_incident(FakeLLM(), db, new_incident))
+
+    assert "error" not in result
+    assert sorted(result["similar_incidents"]) == ["INC-1", "INC-2", "INC-3"]
@@ -0,0 +1,68 @@
+import io
+import pandas as pd
+from src.batch import incident_key
+from src.data_loader import format_incident_for_embedding
+from src.dedup import get_incident_ledger, parse_incident_id
+
+def test_plan_skips_duplicates_and_replaces_changed_incidents(make_incident):
+    ledger = get_incident_ledger()
+    first = make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email")
+    second = make_incident("INC-2", "2024-02-10", "Malware", "Trojan on a finance laptop")
+
+    plan = ledger.plan([first, second, first])
+    assert plan["report"] == {"new": 2, "changed": 0, "skipped": 1}
+    ledger.commit(plan)
+    first_doc_id = plan["doc_ids"][0]
+
+    assert ledger.plan([first, second])["report"] == {"new": 0, "changed": 0, "skipped": 2}
+
+    changed = make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email, 40 users")
+    plan = ledger.plan([changed])
+    assert plan["report"] == {"new": 0, "changed": 1, "skipped": 0}
+    assert plan["replaced"] == [first_doc_id]
+    ledger.commit(plan)
+
+    assert ledger.deleted_doc_ids() == [first_doc_id]
+    assert len(ledger) == 2
+
+def test_pending_plans_dedup_across_batches(make_incident):
+    ledger = get_incident_ledger()
+    incident = make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email")
+    pending = {}
+
+    assert ledger.plan([incident], pending)["report"]["new"] == 1
+    assert ledger.plan([incident], pending)["report"]["skipped"] == 1
+
+def test_parse_incident_id_ignores_blank_and_generated_ids():
+    assert parse_incident_id("Incident ID: INC-7\nDate: 2024-01-01") == "INC-7"
+    assert parse_incident_id("Incident ID: nan\nDate: 2024-01-01") is None
+    assert parse_incident_id("Incident ID: \nDate: 2024-01-01") is None
+    assert parse_incident_id("Incident ID: INC-AUTO-1a2b3c4d\nDate: 2024-01-01") is None
+
+def test_blank_csv_incident_ids_are_not_versions_of_one_incident():
+    csv = (
+        "Incident ID,Date,Type,Description,Impact,Mitigation\n"
+        ",2024-01-01,Phishing,Fake invoice email,Low,Blocked sender\n"
+        "INC-1,2024-01-02,Malware,Trojan on a laptop,Medium,Reimaged\n"
+        ",2024-01-03,DDoS,Flood against the VPN,High,Rate limited\n"
+    )
+    texts = [format_incident_for_embedding(row) for row in pd.read_csv(io.StringIO(csv)).to_dict("records")]
+
+    assert not any("Incident ID: nan" in text for text in texts)
+    assert [parse_incident_id(text) for text in texts] == [None, "INC-1", None]
+
+    ledger = get_incident_ledger()
+    plan = ledger.plan(texts)
+    assert plan["report"] == {"new": 3, "changed": 0, "skipped": 0}
+    ledger.commit(plan)
+    assert ledger.deleted_doc_ids() == []
+
+def test_incident_key_uses_content_for_blank_ids():
+    row = {"Incident ID": float("nan"), "Date": "2024-01-01", "Type": "Phishing", "Description": "Fake invoice"}
+    other = dict(row, Description="Fake payroll notice")
+
+    key = incident_key(format_incident_for_embedding(row))
+    assert key.startswith("sha256:")
+    # Stable across runs although each formatting generates a new INC-AUTO ID
+    assert incident_key(format_incident_for_embedding(row)) == key
+    assert incident_key(format_incident_for_embedding(other)) != key
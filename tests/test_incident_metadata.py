@@ -0,0 +1,42 @@
+import pytest
+from src.incident_metadata import filter_from_question, infer_date_range, normalize_date
+
+KNOWN_TYPES = ["other", "phishing attack", "phishing", "ddos attack", "data breach", "malware", "ransomware"]
+
+def test_slashed_dates_are_read_month_first():
+    assert normalize_date("3/4/2025") == "2025-03-04"
+    assert normalize_date("25/12/2024") == "2024-12-25"
+
+def test_generic_type_words_do_not_become_filters():
+    question = "Were there other phishing-like incidents with fake invoices?"
+
+    assert filter_from_question(question, KNOWN_TYPES) == {"type": {"$in": ["phishing", "phishing attack"]}}
+
+@pytest.mark.parametrize("question, types", [
+    ("Show DDoS incidents", ["ddos attack"]),
+    ("Any phishing attacks on finance?", ["phishing", "phishing attack"]),
+    ("How did we contain the data breaches?", ["data breach"]),
+])
+def test_variant_type_names_are_grouped(question, types):
+    assert filter_from_question(question, KNOWN_TYPES)["type"] == {"$in": types}
+
+def test_types_match_whole_words_only():
+    assert filter_from_question("Was the malwarebytes agent involved?", KNOWN_TYPES) is None
+
+@pytest.mark.parametrize("question, date_range", [
+    ("ransomware in 2023", ("2023-01-01", "2023-12-31")),
+    ("incidents during 2022", ("2022-01-01", "2022-12-31")),
+    ("2023 incidents on the VPN", ("2023-01-01", "2023-12-31")),
+    ("breaches between 2021 and 2023", ("2021-01-01", "2023-12-31")),
+    ("phishing in Q3 2023", ("2023-07-01", "2023-09-30")),
+])
+def test_years_are_read_from_date_wording(question, date_range):
+    assert infer_date_range(question) == date_range
+
+@pytest.mark.parametrize("question", [
+    "2000 accounts leaked after the phishing email",
+    "What happened in INC-2023-001?",
+    "The attacker sent 1999 requests per second",
+])
+def test_other_numbers_are_not_years(question):
+    assert infer_date_range(question) is None
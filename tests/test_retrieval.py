@@ -0,0 +1,68 @@
+import pytest
+from src.registry import add_to_shared_vector_db, rebuild_shared_vector_db
+from src.retrieval import hybrid_search
+
+@pytest.fixture
+def db(embeddings, make_incident):
+    db, _ = rebuild_shared_vector_db(embeddings, [
+        make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email sent to finance"),
+        make_incident("INC-2", "2024-01-20", "Malware", "Trojan beaconing from a finance laptop", "Medium"),
+        make_incident("INC-3", "2024-02-11", "Ransomware", "File server encrypted via CVE-2023-4966"),
+        make_incident("INC-4", "2024-03-02", "Phishing", "Fake payroll notice with a CVE-2023-4966 lure", "Low"),
+    ])
+    return db
+
+def _incident_ids(result):
+    return sorted(doc.metadata["incident_id"] for doc, _ in result["documents"])
+
+def test_hybrid_search_fuses_keyword_and_vector_hits(db):
+    result = hybrid_search(db, "CVE-2023-4966", k=2, infer_filter=False)
+
+    assert _incident_ids(result) == ["INC-3", "INC-4"]
+    assert all(scores["bm25"] is not None for _, scores in result["documents"])
+    assert set(result["timings"]) >= {"filter_ms", "embed_ms", "total_ms"}
+
+def test_hybrid_search_applies_indexed_filters(db):
+    assert _incident_ids(hybrid_search(db, "CVE-2023-4966", filter={"type": "Phishing"})) == ["INC-1", "INC-4"]
+    assert _incident_ids(hybrid_search(db, "finance", filter={"date": {"$gte": "2024-02-01"}})) == ["INC-3", "INC-4"]
+    assert _incident_ids(hybrid_search(db, "finance", filter={"severity": ["medium", "low"]})) == ["INC-2", "INC-4"]
+
+def test_hybrid_search_applies_filters_without_an_indexed_column(db):
+    result = hybrid_search(db, "CVE-2023-4966 finance", filter={"type": {"$nin": ["phishing"]}})
+
+    assert _incident_ids(result) == ["INC-2", "INC-3"]
+
+def test_hybrid_search_infers_a_filter_from_the_question(db):
+    result = hybrid_search(db, "Which ransomware incidents did we have?")
+
+    assert result["filter"] == {"type": {"$in": ["ransomware"]}}
+    assert _incident_ids(result) == ["INC-3"]
+
+def test_inferred_filter_ignores_superseded_incidents(embeddings, make_incident, db):
+    # INC-3 is reclassified, so only its tombstoned old version is still ransomware
+    db, _, _ = add_to_shared_vector_db(embeddings, [
+        make_incident("INC-3", "2024-02-11", "Malware", "File server encrypted via CVE-2023-4966"),
+    ])
+
+    result = hybrid_search(db, "Which ransomware incidents did we have?")
+
+    assert result["filter"] is None
+    assert result["documents"]
+
+def test_inferred_type_filter_keeps_variant_types_and_skips_generic_ones(embeddings, make_incident):
+    db, _ = rebuild_shared_vector_db(embeddings, [
+        make_incident("INC-2023-111", "2025-03-03", "Phishing Attack", "Fake invoice emails sent to the DevOps team"),
+        make_incident("INC-5", "2024-04-01", "Other", "Lost laptop left on a train"),
+        make_incident("INC-6", "2024-05-01", "Malware", "Trojan on a finance laptop"),
+    ])
+
+    result = hybrid_search(db, "Were there other phishing-like incidents with fake invoices?")
+
+    assert result["filter"] == {"type": {"$in": ["phishing attack"]}}
+    assert _incident_ids(result) == ["INC-2023-111"]
+
+def test_numbers_in_a_question_are_not_read_as_years(db):
+    result = hybrid_search(db, "2000 accounts leaked after a credential harvesting email")
+
+    assert result["filter"] is None
+    assert "INC-1" in _incident_ids(result)
@@ -0,0 +1,60 @@
+from src.dedup import get_incident_ledger
+from src.docstore import get_document_store
+from src.registry import add_to_shared_vector_db, get_shared_vector_db, rebuild_shared_vector_db
+from src.segment_store import compact_segments, read_manifest, segment_names
+
+def _incidents(make_incident):
+    return [
+        make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email"),
+        make_incident("INC-2", "2024-01-20", "Malware", "Trojan on a finance laptop"),
+        make_incident("INC-3", "2024-02-11", "Ransomware", "File server encrypted"),
+    ]
+
+def test_append_writes_delta_segments_only(embeddings, make_incident):
+    db, generation = rebuild_shared_vector_db(embeddings, _incidents(make_incident))
+    base = read_manifest()
+    assert db.ntotal == 3
+    assert all(not entry["deltas"] for entry in base["shards"].values())
+
+    changed = make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email, 40 users")
+    added = make_incident("INC-4", "2024-01-28", "DDoS", "Flood against the VPN gateway")
+    db, new_generation, report = add_to_shared_vector_db(embeddings, [changed, added])
+
+    assert report == {"new": 1, "changed": 1, "skipped": 0}
+    assert new_generation > generation
+    manifest = read_manifest()
+    # Base segments are untouched; the January shard gained one delta
+    assert {key: entry["base"] for key, entry in manifest["shards"].items()} == \
+        {key: entry["base"] for key, entry in base["shards"].items()}
+    assert [len(entry["deltas"]) for key, entry in sorted(manifest["shards"].items())] == [1, 0]
+
+    # The superseded version is still on disk but no longer searchable
+    old_doc_id = get_incident_ledger().deleted_doc_ids()[0]
+    assert not db.contains(old_doc_id)
+    ids = [doc.metadata["incident_id"] for doc, _ in db.similarity_search_with_score("credential harvesting", k=10)]
+    assert sorted(ids) == ["INC-1", "INC-2", "INC-3", "INC-4"]
+
+def test_compaction_folds_deltas_and_drops_superseded_incidents(embeddings, make_incident):
+    rebuild_shared_vector_db(embeddings, _incidents(make_incident))
+    changed = make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email, 40 users")
+    add_to_shared_vector_db(embeddings, [changed])
+    old_doc_id = get_incident_ledger().deleted_doc_ids()[0]
+    before = read_manifest()
+    assert before["shards"]["2024-01"]["vectors"] == 3
+
+    assert compact_segments(embeddings)
+
+    manifest = read_manifest()
+    assert all(not entry["deltas"] for entry in manifest["shards"].values())
+    assert manifest["shards"]["2024-01"]["vectors"] == 2
+    # Only the compacted shard was rewritten
+    assert manifest["shards"]["2024-02"] == before["shards"]["2024-02"]
+    assert set(segment_names(before)) - set(segment_names(manifest)) == \
+        {before["shards"]["2024-01"]["base"], *before["shards"]["2024-01"]["deltas"]}
+    assert get_incident_ledger().deleted_doc_ids() == []
+    assert isinstance(get_document_store().search(old_doc_id), str)
+
+    db, _ = get_shared_vector_db(embeddings)
+    docs = [doc for doc, _ in db.similarity_search_with_score("credential harvesting", k=10)]
+    assert db.ntotal == 3
+    assert [doc.page_content for doc in docs if doc.metadata["incident_id"] == "INC-1"] == [changed]
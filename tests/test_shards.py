@@ -0,0 +1,29 @@
+from src.dedup import get_incident_ledger
+from src.segment_store import read_manifest
+from src.shards import ShardedIncidentStore
+
+def test_from_texts_writes_and_loads_date_shards(embeddings, make_incident):
+    texts = [
+        make_incident("INC-1", "2024-01-05", "Phishing", "Credential harvesting email"),
+        make_incident("INC-2", "2024-02-10", "Malware", "Trojan on a finance laptop"),
+        make_incident("INC-3", "2024-02-20", "Ransomware", "File server encrypted"),
+    ]
+
+    store = ShardedIncidentStore.from_texts(texts, embeddings, ids=["a", "b", "c"])
+
+    assert isinstance(store, ShardedIncidentStore)
+    assert sorted(read_manifest()["shards"]) == ["2024-01", "2024-02"]
+    assert store.ntotal == 3
+    assert store.similarity_search(texts[1], k=1)[0].metadata["incident_id"] == "INC-2"
+    assert len(store.as_retriever(search_kwargs={"k": 3}).invoke("laptop")) == 3
+    # The ledger knows the incidents, so indexing them again is skipped
+    assert get_incident_ledger().plan(texts)["report"]["skipped"] == 3
+
+def test_from_texts_replaces_the_existing_index(embeddings, make_incident):
+    ShardedIncidentStore.from_texts([make_incident("INC-1", "2024-01-05", "Phishing", "Old incident")], embeddings)
+
+    store = ShardedIncidentStore.from_texts([make_incident("INC-2", "2023-05-05", "Malware", "New incident")], embeddings)
+
+    assert sorted(read_manifest()["shards"]) == ["2023-05"]
+    assert store.ntotal == 1
+    assert len(get_incident_ledger()) == 1